@@ -0,0 +1,126 @@
+"""Query and maintain a Ship Tilt Dashboard sample archive (written with --archive DIR).
+
+With several --sensor options each sensor has its own archive in DIR/NAME; pass that directory.
+
+    python SAP_Archive.py info DIR
+    python SAP_Archive.py stats DIR --from "2026-10-14 02:00" --to "2026-10-14 04:00"
+    python SAP_Archive.py series DIR --from 2026-07-01 --to 2026-10-01 --points 1000 > overview.csv
+    python SAP_Archive.py import DIR recording.rec
+    python SAP_Archive.py compact DIR --keep-raw-days 30
+
+Times are ISO dates or date-times in local time unless they carry a UTC offset, or Unix seconds.
+"""
+import argparse
+import datetime
+import json
+import sys
+import time
+
+import SAP_Production as sap
+
+
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp is not None else "-"
+
+
+def command_info(args):
+    archive = sap.SampleArchive(args.archive)
+    print(f"{'level':<6}{'days':>6}{'blocks':>9}{'rows':>12}{'MB':>10}  span")
+    for name, level in archive.info().items():
+        print(f"{name:<6}{level['days']:6}{level['blocks']:9}{level['rows']:12}{level['bytes'] / 1e6:10.2f}  "
+              f"{format_time(level['first'])} .. {format_time(level['last'])}")
+
+
+def command_stats(args):
+    archive = sap.SampleArchive(args.archive)
+    start = time.perf_counter()
+    result = archive.stats(parse_time(args.start), parse_time(args.end))
+    result["query_ms"] = (time.perf_counter() - start) * 1000
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{result['count']} samples, {result['blocks_read']} blocks read in {result['query_ms']:.1f} ms"
+          + (" (edges from summaries, raw data compacted)" if result["approximate"] else ""))
+    for axis in ("roll", "pitch"):
+        stats = result[axis]
+        if stats["min"] is not None:
+            print(f"{axis:<6} min {stats['min']:6.1f}°  max {stats['max']:6.1f}°  mean {stats['mean']:6.2f}°")
+
+
+def command_series(args):
+    archive = sap.SampleArchive(args.archive)
+    series = archive.series(parse_time(args.start), parse_time(args.end), args.points)
+    if series is None:
+        print("No samples in that range", file=sys.stderr)
+        return
+    columns = ("roll_min", "roll_max", "roll_mean", "pitch_min", "pitch_max", "pitch_mean")
+    print("time,level,count," + ",".join(columns))
+    for i, timestamp in enumerate(series["time"]):
+        values = ",".join(f"{series[column][i]:.2f}" for column in columns)
+        print(f"{format_time(timestamp)},{series['level']},{series['count'][i]},{values}")
+
+
+def command_import(args):
+    """Append the decoded angles of recordings (--record files) to the archive."""
+    writer = sap.ArchiveWriter(args.archive)
+    for path in args.recordings:
+        count = 0
+        for timestamp, _, roll, pitch, checksum_ok in sap.read_recording(path):
+            if checksum_ok or args.include_bad:
+                writer.append(timestamp, roll, pitch)
+                count += 1
+        print(f"{path}: {count} samples")
+    writer.close()
+    print(f"{writer.samples_written} samples in {writer.blocks_written} blocks written")
+
+
+def command_compact(args):
+    report = sap.compact_archive(args.archive, args.keep_raw_days, args.keep_1s_days)
+    print(f"{report['days_rewritten']} days rewritten, raw removed for {report['raw_days_removed']} days, "
+          f"1 s summaries removed for {report['1s_days_removed']} days, "
+          f"{report['bytes_before'] / 1e6:.2f} MB -> {report['bytes_after'] / 1e6:.2f} MB")
+
+
+def add_command(commands, name, handler, help):
+    command = commands.add_parser(name, help=help)
+    command.add_argument("archive", metavar="DIR", help="archive directory")
+    command.set_defaults(handler=handler)
+    return command
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ship Tilt Dashboard sample archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_command(commands, "info", command_info, "levels, sizes and time span of an archive")
+
+    stats = add_command(commands, "stats", command_stats, "min, max and mean roll and pitch over a time range")
+    stats.add_argument("--json", action="store_true", help="print the result as JSON")
+
+    series = add_command(commands, "series", command_series, "min/max/mean per bucket as CSV, for overview plots")
+    series.add_argument("--points", type=int, default=1000, help="about this many rows at most")
+
+    for command in (stats, series):
+        command.add_argument("--from", dest="start", required=True, help="start of the range")
+        command.add_argument("--to", dest="end", required=True, help="end of the range (exclusive)")
+
+    importer = add_command(commands, "import", command_import, "add recordings made with --record")
+    importer.add_argument("recordings", nargs="+", metavar="RECORDING")
+    importer.add_argument("--include-bad", action="store_true", help="also import packets that failed the checksum")
+
+    compact = add_command(commands, "compact", command_compact, "roll old raw data up into summaries")
+    compact.add_argument("--keep-raw-days", type=int, default=30, help="days of raw samples to keep")
+    compact.add_argument("--keep-1s-days", type=int, default=365, help="days of 1 s summaries to keep")
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
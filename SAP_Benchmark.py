@@ -0,0 +1,457 @@
+"""Headless benchmarks for the Ship Tilt Dashboard.
+
+Runs without an inclinometer or a display: a simulated sensor writes packets to a pseudo-terminal,
+the dashboard's AcquisitionPipeline reads it, and the image pipeline is timed with PIL alone. Windows has
+no pseudo-terminals, so the latency benchmark is skipped there.
+
+    python SAP_Benchmark.py --output bench.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import threading
+import time
+
+from PIL import Image
+
+import SAP_Production as sap
+
+
+def build_packet(roll, pitch, rng=None):
+    """Encode roll/pitch in degrees into a 32-byte "5A A5 ... AA" packet with a valid checksum."""
+    packet = bytearray(sap.PACKET_SIZE)
+    packet[0] = sap.HEADER_HIGH
+    packet[1] = sap.HEADER_LOW
+    if rng:
+        for i in range(2, 30):
+            packet[i] = rng.randrange(256)
+    for index, angle in ((8, roll), (10, pitch)):
+        raw = max(min(round(angle * sap.RESOLUTION_FACTOR), 0x7FFF), -0x8000) & 0xFFFF
+        packet[index] = raw >> 8
+        packet[index + 1] = raw & 0xFF
+    packet[30] = sum(packet[2:30]) & 0xFF
+    packet[31] = sap.TERMINATOR
+    return bytes(packet)
+
+
+def motion(profile, t, index):
+    """Roll/pitch in degrees at time t for a motion profile."""
+    if profile == "static":
+        return 2.5, -1.0
+    if profile == "sine":
+        return 15 * math.sin(2 * math.pi * t / 10), 4 * math.sin(2 * math.pi * t / 6)
+    if profile == "ramp":
+        # Every packet carries a distinct roll value, so arrivals can be matched to sends
+        return ((index % 1700) - 850) / 10, 0.0
+    if profile == "random":
+        return random.uniform(-30, 30), random.uniform(-10, 10)
+    raise ValueError(f"Unknown motion profile: {profile}")
+
+
+def corrupt(packet, rng, corruption_rate):
+    """Flip a byte or truncate the packet with probability corruption_rate."""
+    if corruption_rate <= 0 or rng.random() >= corruption_rate:
+        return packet
+    if rng.random() < 0.5:
+        damaged = bytearray(packet)
+        damaged[rng.randrange(len(damaged))] ^= 0xFF
+        return bytes(damaged)
+    return packet[:rng.randrange(1, len(packet))]
+
+
+def pty_available():
+    """Pseudo-terminals for FakeInclinometer exist on Linux and macOS, not on Windows."""
+    import importlib.util
+
+    return hasattr(os, "openpty") and importlib.util.find_spec("termios") is not None
+
+
+class FakeInclinometer:
+    """Simulated sensor writing packets to a pseudo-terminal that pyserial can open."""
+
+    def __init__(self, profile="sine", rate=50.0, corruption_rate=0.0, input_mode="binary", seed=0):
+        import tty
+
+        self.profile = profile
+        self.rate = rate
+        self.corruption_rate = corruption_rate
+        self.input_mode = input_mode
+        self.rng = random.Random(seed)
+
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+
+        self.sent = {}  # roll -> monotonic send time, for latency matching
+        self.packets_sent = 0
+        self.running = False
+        self.thread = None
+
+    def encode(self, packet):
+        """Frame a packet the way the firmware sends it."""
+        if self.input_mode == "hex":
+            return b"Data Packet: " + packet.hex(" ").upper().encode() + b"\r\n"
+        return packet
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Write packets at the configured rate until stopped."""
+        start = time.monotonic()
+        index = 0
+        while self.running:
+            now = time.monotonic()
+            roll, pitch = motion(self.profile, now - start, index)
+            packet = corrupt(build_packet(roll, pitch, self.rng), self.rng, self.corruption_rate)
+            self.sent[round(roll, 1)] = time.monotonic()
+            os.write(self.master_fd, self.encode(packet))
+            self.packets_sent += 1
+            index += 1
+            delay = start + index / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+
+def synthetic_packets(count, profile, corruption_rate, seed=0):
+    """Packets (some corrupted) for offline parser benchmarks."""
+    rng = random.Random(seed)
+    return [corrupt(build_packet(*motion(profile, i / 50, i), rng), rng, corruption_rate) for i in range(count)]
+
+
+def bench_parser(count, profile, corruption_rate):
+    """Packets per second through the streaming framers and the batch decoder."""
+    packets = synthetic_packets(count, profile, corruption_rate)
+    data = b"".join(packets)
+    hex_data = b"".join(b"Data Packet: " + packet.hex(" ").upper().encode() + b"\r\n" for packet in packets)
+    results = {"packets": count, "corruption_rate": corruption_rate}
+
+    for name, framer, stream in (("binary", sap.PacketFramer(), data), ("hex", sap.HexLineFramer(), hex_data)):
+        start = time.perf_counter()
+        decoded = 0
+        for i in range(0, len(stream), 4096):
+            for packet, _ in framer.feed(stream[i:i + 4096]):
+                sap.decode_packet(packet)
+                decoded += 1
+        elapsed = time.perf_counter() - start
+        results[name] = {"decoded": decoded, "seconds": elapsed, "packets_per_sec": decoded / elapsed,
+                         "checksum_failures": framer.checksum_failures, "resyncs": framer.resyncs}
+
+    try:
+        sap.angle_table()  # One-off table build is not part of the decode cost
+        start = time.perf_counter()
+        decoded = len(sap.decode_capture(data)["offset"])
+        elapsed = time.perf_counter() - start
+        results["batch"] = {"decoded": decoded, "seconds": elapsed, "packets_per_sec": decoded / elapsed}
+    except ImportError:
+        results["batch"] = None  # NumPy not installed
+    return results
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else None
+
+
+def bench_latency(duration, rate, input_mode):
+    """Time from a packet leaving the fake sensor to the value appearing in tilt_angle_1."""
+    import serial
+
+    sensor = FakeInclinometer(profile="ramp", rate=rate, input_mode=input_mode)
+    port = serial.Serial(sensor.port_name, 115200, timeout=1)
+    pipeline = sap.AcquisitionPipeline(port, input_mode)  # The dashboard's acquisition side, without Tk
+    pipeline.start()
+    sensor.start()
+
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if not pipeline.data_event.wait(0.1):
+            continue
+        pipeline.data_event.clear()
+        seen = time.monotonic()
+        sent = sensor.sent.get(pipeline.tilt_angle_1)
+        if sent is not None and seen >= sent:
+            latencies.append(seen - sent)
+
+    sensor.running = False
+    pipeline.stop()  # Also closes the port
+    sensor.stop()
+
+    return {"rate": rate, "input_mode": input_mode, "packets_sent": sensor.packets_sent,
+            "packets_received": pipeline.framer.packets, "samples": len(latencies),
+            "latency_ms": {"p50": (percentile(latencies, 0.5) or 0) * 1000,
+                           "p99": (percentile(latencies, 0.99) or 0) * 1000,
+                           "max": max(latencies, default=0) * 1000}}
+
+
+def bench_render(frames, size):
+    """Per-frame cost of the ship/highlighter image pipeline, without Tk."""
+    ship = Image.open("ship1.png")
+    highlighter = Image.open("highlighter.png")
+    angles = [15 * math.sin(2 * math.pi * i / 120) for i in range(frames)]
+    angles = [round(angle, 1) for angle in angles]
+    results = {"frames": frames, "size": list(size)}
+
+    # What update_display did before the sprite cache: resize and rotate both layers every frame
+    start = time.perf_counter()
+    for angle in angles:
+        for image in (ship, highlighter):
+            image.resize(size, Image.Resampling.LANCZOS).rotate(-angle, resample=Image.BILINEAR, expand=False)
+    results["uncached_ms"] = (time.perf_counter() - start) * 1000 / frames
+
+    # Sprite cache: rotation from the cached base on a miss, a dictionary lookup on a hit
+    cache = sap.SpriteCache()
+    cache.register("ship1.png", sap.AssetPyramid(ship))
+    cache.register("highlighter.png", sap.AssetPyramid(highlighter))
+    start = time.perf_counter()
+    for angle in angles:
+        for layer in ("ship1.png", "highlighter.png"):
+            key = (layer, size, cache.quantize(angle))
+            if key not in cache.entries:
+                cache.store(key, cache.render(*key), cache.generation)
+    results["cache_cold_ms"] = (time.perf_counter() - start) * 1000 / frames
+
+    start = time.perf_counter()
+    for angle in angles:
+        for layer in ("ship1.png", "highlighter.png"):
+            with cache.lock:
+                cache.entries.get((layer, size, cache.quantize(angle)))
+    results["cache_hit_ms"] = (time.perf_counter() - start) * 1000 / frames
+
+    # Vector backend: vertex math for the traced polygons (the canvas.coords calls need Tk and aren't timed)
+    shapes = sap.trace_shapes(ship) + sap.trace_shapes(highlighter)
+    center = (size[0] // 2, size[1] // 2)
+    start = time.perf_counter()
+    for angle in angles:
+        sap.place_shapes(shapes, size, center, angle)
+    results["vector_ms"] = (time.perf_counter() - start) * 1000 / frames
+    results["vector_polygons"] = len(shapes)
+    results["vector_vertices"] = sum(len(outline) for _, outline in shapes)
+    return results
+
+
+def bench_history(samples, width, rate=10.0):
+    """Append cost of SampleHistory and trend query time for short and long spans at a chart width."""
+    history = sap.SampleHistory(samples)
+    start = time.perf_counter()
+    for i in range(samples):
+        history.append(i / rate, round(15 * math.sin(i / 300), 1), round(4 * math.sin(i / 170), 1))
+    results = {"samples": samples, "width": width, "append_us": (time.perf_counter() - start) * 1e6 / samples}
+    for span in (60, 3600, samples / rate):
+        start = time.perf_counter()
+        for _ in range(10):
+            history.trend(span, width)
+        results[f"trend_{span:g}s_ms"] = (time.perf_counter() - start) * 100
+    return results
+
+
+ALARM_RULES = ("heel=abs(roll)>12,hysteresis=1,for=2", "trim=abs(pitch)>3,hysteresis=0.5",
+               "roll-rate=rate(roll)>8", "list=roll<-20,for=5")
+
+
+def bench_alarms(samples, rule_counts=(1, 4, 16)):
+    """Alarm rule evaluation cost per sample for growing rule sets, plus the transitions seen."""
+    values = [motion("sine", i / 50, i) for i in range(samples)]
+    results = {"samples": samples}
+    for count in rule_counts:
+        specs = [spec.replace("=", f"{i}=", 1) for i, spec in zip(range(count), ALARM_RULES * count)]
+        alarms = sap.AlarmEngine(specs)
+        events = []
+        alarms.subscribe(events.append)
+        start = time.perf_counter()
+        for i, (roll, pitch) in enumerate(values):
+            alarms.evaluate(i / 50, round(roll, 1), round(pitch, 1))
+        elapsed = time.perf_counter() - start
+        results[f"rules_{count}"] = {"us_per_sample": elapsed * 1e6 / samples, "transitions": len(events)}
+    return results
+
+
+def bench_sea_state(windows=(300, 1800, 7200), rate=10.0):
+    """Sea-state analysis cost per sample and per published result for windows of minutes to hours.
+
+    The sensor rolls with a 12 s period and pitches with 6 s plus noise, which must be reported as
+    parametric roll. full_welch_ms is what recomputing the whole window on every result would cost.
+    """
+    import numpy as np
+
+    rng = random.Random(0)
+    results = {"rate": rate}
+    for window in windows:
+        analyzer = sap.SeaStateAnalyzer(window)
+        samples = int((window + 2 * sap.SEA_STATE_SEGMENT / sap.SEA_STATE_RATE) * rate)
+        values = [(round(10 * math.sin(2 * math.pi * t / 12) + rng.gauss(0, 0.5), 1),
+                   round(3 * math.sin(2 * math.pi * t / 6) + rng.gauss(0, 0.2), 1))
+                  for t in (i / rate for i in range(samples))]
+        start = time.perf_counter()
+        for i, (roll, pitch) in enumerate(values):
+            analyzer.append(i / rate, roll, pitch)
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(10):
+            analyzer.publish(samples / rate)
+        publish = (time.perf_counter() - start) / 10
+
+        # Reference: a Welch estimate over the whole window from scratch
+        grid = np.array(analyzer.samples).T
+        segment, hop = analyzer.segment, analyzer.hop
+        start = time.perf_counter()
+        for i in range(0, grid.shape[1] - segment + 1, hop):
+            chunk = grid[:, i:i + segment]
+            np.abs(np.fft.rfft((chunk - chunk.mean(axis=1, keepdims=True)) * analyzer.taper, axis=1)) ** 2
+        full = time.perf_counter() - start
+
+        latest = analyzer.latest
+        results[f"window_{window}s"] = {
+            "samples": samples,
+            "us_per_sample": elapsed * 1e6 / samples,
+            "publish_ms": publish * 1000,
+            "full_welch_ms": full * 1000,
+            "roll_period": latest["roll"]["period"],
+            "pitch_period": latest["pitch"]["period"],
+            "roll_peak_to_peak": latest["roll"]["peak_to_peak"],
+            "warnings": latest["warnings"],
+        }
+    return results
+
+
+def bench_stream(frames, size, viewers=(1, 10, 50)):
+    """Offscreen gauge frames: render and encode cost, and how many renders N stream viewers cause."""
+    from urllib.request import urlopen
+
+    assets = {}
+
+    def asset(path):
+        if path not in assets:
+            assets[path] = sap.AssetPyramid(Image.open(path))
+        return assets[path]
+
+    renderer = sap.OffscreenRenderer(asset, size)
+    angles = [(round(15 * math.sin(2 * math.pi * i / 120), 1), round(4 * math.sin(2 * math.pi * i / 70), 1))
+              for i in range(frames)]
+    results = {"frames": frames, "size": list(size)}
+
+    start = time.perf_counter()
+    images = [renderer.render(roll, pitch) for roll, pitch in angles]
+    results["render_cold_ms"] = (time.perf_counter() - start) * 1000 / frames
+    start = time.perf_counter()
+    for roll, pitch in angles:
+        renderer.render(roll, pitch)
+    results["render_cached_ms"] = (time.perf_counter() - start) * 1000 / frames
+
+    for name, options in (("jpeg", {"quality": sap.STREAM_JPEG_QUALITY}), ("png", {"compress_level": 1})):
+        start = time.perf_counter()
+        for image in images[:20]:
+            output = io.BytesIO()
+            image.save(output, name.upper(), **options)
+        results[f"{name}_encode_ms"] = (time.perf_counter() - start) * 1000 / 20
+        results[f"{name}_bytes"] = output.tell()
+
+    # Viewers read the MJPEG stream while the sample changes 20 times a second for 2 s
+    for count in viewers:
+        cache = sap.FrameCache()
+        sample = [angles[0]]
+        streamer = sap.FrameStreamer(lambda: sample[0], renderer, cache, fps=20)
+        server = sap.FrameServer(cache, port=0)
+        server.start()
+        streamer.start()
+        host, port = server.address()[:2]
+        received = [0] * count
+
+        def view(index):
+            with urlopen(f"http://{host}:{port}/stream.mjpg", timeout=5) as response:
+                end = time.monotonic() + 2.5
+                while time.monotonic() < end:
+                    line = response.readline()
+                    if line.startswith(b"Content-Length"):
+                        length = int(line.split(b":")[1])
+                        response.readline()
+                        response.read(length)
+                        received[index] += 1
+
+        threads = [threading.Thread(target=view, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for roll, pitch in angles[:40]:
+            sample[0] = (roll, pitch)
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        streamer.stop()
+        server.stop()
+        results[f"viewers_{count}"] = {"renders": streamer.frames, "frames_received_min": min(received),
+                                       "frames_received_max": max(received)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Ship Tilt Dashboard benchmarks")
+    parser.add_argument("--only", default="parser,latency,render,history,alarms,sea_state,stream",
+                        help="comma separated subset of parser, latency, render, history, alarms, sea_state, "
+                             "stream")
+    parser.add_argument("--packets", type=int, default=100000, help="packets for the parser benchmark")
+    parser.add_argument("--profile", choices=("static", "sine", "ramp", "random"), default="sine")
+    parser.add_argument("--corruption", type=float, default=0.01, help="fraction of corrupted packets")
+    parser.add_argument("--rate", type=float, default=200.0, help="fake sensor packets per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of live latency measurement")
+    parser.add_argument("--input-mode", choices=("hex", "binary"), default="binary")
+    parser.add_argument("--frames", type=int, default=240, help="frames for the render benchmark")
+    parser.add_argument("--size", default="432x448", help="canvas size for the render benchmark")
+    parser.add_argument("--history-samples", type=int, default=864000,
+                        help="samples for the history benchmark (default: 24 h at 10 Hz)")
+    parser.add_argument("--chart-width", type=int, default=800, help="trend chart width in pixels")
+    parser.add_argument("--sea-state-windows", default="300,1800,7200",
+                        help="comma separated analysis windows in seconds for the sea_state benchmark")
+    parser.add_argument("--stream-size", default=f"{sap.STREAM_SIZE[0]}x{sap.STREAM_SIZE[1]}",
+                        help="frame size for the stream benchmark")
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    args = parser.parse_args()
+
+    selected = set(args.only.split(","))
+    results = {"timestamp": time.time(), "python": platform.python_version(), "platform": platform.platform()}
+    if "parser" in selected:
+        results["parser"] = bench_parser(args.packets, args.profile, args.corruption)
+    if "latency" in selected:
+        if pty_available():
+            results["latency"] = bench_latency(args.duration, args.rate, args.input_mode)
+        else:
+            results["latency"] = None  # No pseudo-terminals for the fake sensor (Windows)
+    if "render" in selected:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        results["render"] = bench_render(args.frames, (width, height))
+    if "alarms" in selected:
+        results["alarms"] = bench_alarms(args.packets)
+    if "history" in selected:
+        results["history"] = bench_history(args.history_samples, args.chart_width)
+    if "sea_state" in selected:
+        windows = tuple(int(window) for window in args.sea_state_windows.split(","))
+        results["sea_state"] = bench_sea_state(windows)
+    if "stream" in selected:
+        width, height = (int(v) for v in args.stream_size.lower().split("x"))
+        results["stream"] = bench_stream(args.frames, (width, height))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,169 +1,3741 @@
-import customtkinter as ctk
-from CTkMessagebox import CTkMessagebox
-from PIL import Image, ImageTk
-import serial
-import serial.tools.list_ports
-import threading
 import time
+STARTUP_TIME = time.perf_counter()  # Reference point for the startup timing report
+
+from PIL import Image
+import threading
+import asyncio
 import queue
 import os
 import subprocess
 import platform
+import struct
+import bisect
+import math
+import json
+import io
+import zlib
+import calendar
+import re
+import mmap
+import selectors
+import socket
+from array import array
+from collections import OrderedDict, deque, namedtuple
+
+# customtkinter, CTkMessagebox and ImageTk are imported by import_gui() when the first window is
+# created, pyserial where a port is opened and NumPy only for batch decoding, so authentication
+# and the headless tools don't pay for them at startup
+ctk = None
+CTkMessagebox = None
+ImageTk = None
+
+# Allowed serial number
+ALLOWED_SERIAL_NUMBER = "0000_0000_0000_0000_ACE4_2E00_3AF9_5F98."  # Replace with your device's serial number
+
+# Upper bound for pre-rendered ship/highlighter sprites (PIL + Tk copies)
+SPRITE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Window resizes are applied once the size has been stable for this long
+RESIZE_DEBOUNCE_MS = 150
+
+# Offscreen stream for secondary monitors (--stream): frame size, frames per second, JPEG quality,
+# and how often an unchanged frame is resent so viewers (and proxies) don't time out
+STREAM_SIZE = (960, 540)
+STREAM_FPS = 10
+STREAM_JPEG_QUALITY = 80
+STREAM_KEEPALIVE = 2.0
+
+# Redraw rate limits for the frame scheduler; low-power mode (night watches) caps the rate further
+MAX_FPS = 60
+LOW_POWER_FPS = 5
+IDLE_INTERVAL_MS = 100  # Longest sleep between data_event checks while no new data arrives
+LOW_POWER_IDLE_INTERVAL_MS = 1000
+
+# Constants matching Arduino
+RESOLUTION_FACTOR = 364
+MAX_ANGLE = 90
+MIN_ANGLE = -90
+
+# Packet constants
+HEADER_HIGH = 0x5A
+HEADER_LOW = 0xA5
+PACKET_SIZE = 32
+TERMINATOR = 0xAA
+
+# Field layout of the 32-byte packet per firmware variant: (name, struct code, kind), big-endian,
+# covering the whole packet. Kinds are looked up in FIELD_CONVERTERS ("angle": raw word to degrees,
+# None: kept as is). The checksum covers the bytes between the "header" and "checksum" fields.
+# A new firmware variant only needs a new entry here.
+PACKET_LAYOUTS = {
+    "default": (
+        ("header", "H", None),
+        ("data_2_7", "6s", None),  # Left raw on purpose: undocumented firmware bytes, shown in the overlay
+        ("roll", "h", "angle"),
+        ("pitch", "h", "angle"),
+        ("data_12_29", "18s", None),
+        ("checksum", "B", None),
+        ("terminator", "B", None),
+    ),
+}
+
+# Recording file layout: magic, then fixed-size records of
+# timestamp, raw packet, roll and pitch in tenths of a degree, flags (bit 0 = checksum ok)
+RECORD_MAGIC = b"SAPREC01"
+RECORD_FORMAT = struct.Struct("<d32shhB")
+
+# Sample archive: a directory with one file per UTC day and level (YYYY-MM-DD.raw, .1s, .1m, .1h).
+# Files are sequences of blocks: header (magic, level, rows, first and last sample time, payload
+# length) and a zlib payload. Raw payloads are delta-coded milliseconds and tenths of a degree,
+# summary payloads are rows of bucket, count and min/max/sum per axis (see archive_summary_dtype).
+ARCHIVE_MAGIC = b"SAPA"
+ARCHIVE_BLOCK = struct.Struct("<4sBIddI")
+ARCHIVE_LEVELS = (("raw", 0), ("1s", 1), ("1m", 60), ("1h", 3600))  # Name and bucket width in seconds
+ARCHIVE_FLUSH_SECONDS = (60, 600, 6 * 3600, 86400)  # Span a pending block of each level covers before it's written
+
+# Broadcast wire format: every message is a header (magic, kind, payload length) and a payload.
+# A sample payload is seq, timestamp, roll, pitch followed by the UTF-8 sensor name (may be empty).
+# Samples are the unfiltered angles of packets that passed the checksum, whatever --filter is set to.
+WIRE_MAGIC = b"ST"
+WIRE_HEADER = struct.Struct("<2sBH")
+WIRE_SAMPLE = struct.Struct("<Idff")
+WIRE_KIND_SAMPLE = 1
+# An alarm payload is timestamp, state (1 raised, 0 cleared), measured value, then "rule\0sensor" in UTF-8.
+WIRE_ALARM = struct.Struct("<dBf")
+WIRE_KIND_ALARM = 2
+
+# Per-user cache for the authentication result, the asset atlas and similar startup data
+CACHE_DIR = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "ShipTiltDashboard")
+
+# A passed serial number check is remembered for this many seconds (a startup speed cache, see
+# load_cached_authentication)
+AUTH_CACHE_MAX_AGE = 7 * 24 * 3600
+
+# Port auto-detection listens on each port at these rates (the --baud value first) for valid packets
+PROBE_BAUD_RATES = (9600, 19200, 38400, 57600, 115200)
+PROBE_WINDOW = 1.0  # Seconds of listening per port and baud rate
+PROBE_MIN_PACKETS = 2  # Valid packets needed before a port counts as the inclinometer
+
+# Trend charts under the gauges: height in pixels and redraw interval
+TREND_HEIGHT = 90
+TREND_INTERVAL_MS = 1000
+
+# Sea-state analysis: samples are resampled to a fixed rate and split into half-overlapping FFT segments
+# (64 s at 4 Hz resolves roll periods to a few percent); results are published every interval seconds
+SEA_STATE_RATE = 4.0
+SEA_STATE_SEGMENT = 256
+SEA_STATE_INTERVAL = 5.0
+SEA_STATE_MAX_GAP = 5.0  # Longer sensor outages restart the analysis
+SEA_STATE_WARN_AMPLITUDE = 5.0  # Significant roll amplitude (degrees) below which no warning is raised
+
+# Every image the dashboard loads, stored pre-scaled in the asset atlas
+ASSET_FILES = ("logo1.png", "logo2.png", "meter1.png", "meter2.png", "ship1.png", "ship2.png", "highlighter.png")
+
+class StartupTimer:
+    """Collects named milestones relative to STARTUP_TIME for the time-to-first-frame report."""
+
+    def __init__(self):
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - STARTUP_TIME))
+
+    def report(self, path=None):
+        """Print the milestones and optionally write them to a JSON file."""
+        print("Startup: " + ", ".join(f"{name} {elapsed * 1000:.0f} ms" for name, elapsed in self.marks))
+        if path:
+            with open(path, "w") as f:
+                json.dump({name: elapsed for name, elapsed in self.marks}, f, indent=2)
+
+startup_timer = StartupTimer()
+
+class Histogram:
+    """Timing histogram with fixed power-of-two buckets from 1 µs to about 17 s.
+
+    observe() is one bisect and a few additions, cheap enough for every packet and frame.
+    """
+
+    BOUNDS = [1e-6 * 2 ** i for i in range(25)]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def state(self):
+        """Copy of the counts, to summarise only what was observed after this point later."""
+        return list(self.buckets), self.count, self.total
+
+    def summary(self, since=None):
+        """Count, mean, max and bucket-resolution percentiles, optionally only since a state()."""
+        buckets, count, total = self.state()
+        if since is not None:
+            buckets = [now - before for now, before in zip(buckets, since[0])]
+            count -= since[1]
+            total -= since[2]
+        maximum = self.max if since is None else self.percentile(buckets, count, 1.0)
+        result = {"count": count, "mean": total / count if count else 0.0, "max": maximum}
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99)):
+            result[name] = self.percentile(buckets, count, fraction)
+        return result
+
+    def percentile(self, buckets, count, fraction):
+        """Upper bound of the bucket that holds the given fraction of the observations."""
+        target = fraction * count
+        seen = 0
+        for index, n in enumerate(buckets):
+            seen += n
+            if n and seen >= target:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+        return 0.0
+
+class Metrics:
+    """Counters, timing histograms and pulled gauges for the acquisition and render pipeline.
+
+    Every counter and histogram is written by a single thread, so updates take no lock; readers
+    copy the numbers and may see a value one update behind. Sources are callables returning a
+    dict of gauges that are only evaluated when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.sources = {}  # prefix -> callable returning {name: value}
+        self.rates = {}  # gauge or counter name -> [time, value, per second]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def histogram(self, name):
+        """Histogram by name, created on first use. Hot paths keep the returned object."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def observe(self, name, value):
+        self.histogram(name).observe(value)
+
+    def add_source(self, prefix, source):
+        self.sources[prefix] = source
+
+    def track_rate(self, name):
+        """Report name_per_sec for a counter or gauge, averaged over at least one second."""
+        self.rates[name] = [self.started, 0, 0.0]
+
+    def gauges(self):
+        gauges = {}
+        for prefix, source in list(self.sources.items()):
+            try:
+                for name, value in source().items():
+                    gauges[f"{prefix}_{name}"] = value
+            except Exception as e:
+                print(f"Metrics source {prefix} error: {e}")
+        return gauges
+
+    def snapshot(self):
+        """Everything as one JSON-serialisable dict."""
+        now = time.time()
+        counters = dict(self.counters)
+        gauges = self.gauges()
+        rates = {}
+        for name, mark in list(self.rates.items()):
+            value = counters.get(name, gauges.get(name)) or 0
+            if now - mark[0] >= 1.0:
+                mark[:] = [now, value, (value - mark[1]) / (now - mark[0])]
+            rates[f"{name}_per_sec"] = mark[2]
+        return {
+            "uptime": now - self.started,
+            "counters": counters,
+            "gauges": gauges,
+            "rates": rates,
+            "histograms": {name: h.summary() for name, h in list(self.histograms.items())},
+        }
+
+    def to_text(self):
+        """Snapshot as "name value" lines in the Prometheus text format."""
+        snapshot = self.snapshot()
+        lines = [f"ship_tilt_uptime_seconds {snapshot['uptime']:.3f}"]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"ship_tilt_{name}_total {value}")
+        for group in ("gauges", "rates"):
+            for name, value in sorted(snapshot[group].items()):
+                if isinstance(value, (bool, int, float)):
+                    lines.append(f"ship_tilt_{name} {float(value):g}")
+        for name, summary in sorted(snapshot["histograms"].items()):
+            for key in ("count", "mean", "p50", "p90", "p99", "max"):
+                lines.append(f"ship_tilt_{name}_{key} {summary[key]:g}")
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serve Metrics over HTTP: /metrics as text, /metrics.json as JSON. Binds to localhost by default."""
+
+    def __init__(self, metrics, host="127.0.0.1", port=9108):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics.json":
+                    body = json.dumps(metrics.snapshot(), indent=2).encode()
+                    content_type = "application/json"
+                elif self.path in ("/", "/metrics"):
+                    body = metrics.to_text().encode()
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the console
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def address(self):
+        return self.server.server_address
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+def parse_metrics_address(spec):
+    """Parse "PORT" or "HOST:PORT" for the metrics and stream endpoints."""
+    host, _, port = spec.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Invalid address {spec!r}, expected PORT or HOST:PORT")
+    return (host.strip("[]") or "127.0.0.1", int(port))
+
+def import_gui():
+    """Import the Tk/CustomTkinter stack on first use."""
+    global ctk, CTkMessagebox, ImageTk
+    if ctk is None:
+        import customtkinter as ctk
+        from CTkMessagebox import CTkMessagebox
+        from PIL import ImageTk
+
+def get_device_serial_number():
+    """Retrieve the device's hard drive serial number based on platform."""
+    try:
+        system_type = platform.system()
+        if system_type == "Windows":
+            try:
+                import wmi
+            except ImportError:
+                print("wmi module not found. Install it with: python -m pip install wmi")
+                return None
+            c = wmi.WMI()
+            for disk in c.Win32_DiskDrive(["DeviceID", "SerialNumber"]):
+                if 'PHYSICALDRIVE0' in disk.DeviceID:
+                    serial_number = disk.SerialNumber.strip()
+                    return serial_number
+            return None
+        elif system_type == "Linux":
+            # Read cpuinfo directly instead of going through a shell pipeline
+            with open("/proc/cpuinfo") as f:
+                for line in f:
+                    if line.startswith("Serial"):
+                        return line.strip().split(": ")[-1]
+            return None
+        elif system_type == "Darwin":  # macOS
+            # Query only the platform expert device instead of dumping the whole registry
+            result = subprocess.check_output(["ioreg", "-rd1", "-c", "IOPlatformExpertDevice"])
+            for line in result.decode().splitlines():
+                if "IOPlatformSerialNumber" in line:
+                    return line.strip().split("\"")[-2]
+            return None
+        else:
+            print("Unsupported platform!")
+            return None
+    except Exception as e:
+        print(f"Error retrieving serial number: {e}")
+        return None
+
+def get_machine_fingerprint():
+    """Cheap, stable machine identifier that keys the cached authentication result."""
+    try:
+        system_type = platform.system()
+        if system_type == "Windows":
+            import winreg
+            with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Cryptography", 0,
+                                winreg.KEY_READ | winreg.KEY_WOW64_64KEY) as key:
+                return winreg.QueryValueEx(key, "MachineGuid")[0]
+        for path in ("/etc/machine-id", "/var/lib/dbus/machine-id"):
+            if os.path.exists(path):
+                with open(path) as f:
+                    return f.read().strip()
+    except OSError:
+        pass
+    import uuid
+    return f"{platform.node()}-{uuid.getnode():012x}"
+
+def load_cached_authentication(allowed_serial_number):
+    """True if this machine recently passed the serial number check for allowed_serial_number.
+
+    This only saves the slow serial number lookup on later starts; it is not an authentication
+    boundary. The record is plain JSON that anyone with access to the user's cache directory can
+    write, just as anyone with the source can change ALLOWED_SERIAL_NUMBER.
+    """
+    try:
+        with open(os.path.join(CACHE_DIR, "auth.json")) as f:
+            cached = json.load(f)
+        verified_at = float(cached["verified_at"])
+        matches = (cached["serial_number"] == allowed_serial_number
+                   and cached["fingerprint"] == get_machine_fingerprint())
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    return matches and 0 <= time.time() - verified_at <= AUTH_CACHE_MAX_AGE
+
+def save_cached_authentication(serial_number):
+    """Remember that this machine's disk reported serial_number, see load_cached_authentication."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, "auth.json"), "w") as f:
+            json.dump({"verified_at": time.time(), "serial_number": serial_number,
+                       "fingerprint": get_machine_fingerprint()}, f)
+    except OSError as e:
+        print(f"Could not cache authentication: {e}")
+
+def authenticate_device(allowed_serial_number, use_cache=True):
+    """Authenticate the device based on its serial number."""
+    if use_cache and load_cached_authentication(allowed_serial_number):
+        print("Device authenticated successfully (cached).")
+        return
+    device_serial_number = get_device_serial_number()
+    if device_serial_number != allowed_serial_number:
+        print("Unauthorized device. Exiting...")
+        exit(1)
+    if use_cache:
+        save_cached_authentication(device_serial_number)
+    print("Device authenticated successfully.")
+
+def process_hex_data(hex_string):
+    """Process hex string with proper handling of negative angles.
+
+    The dashboard's original per-line decoder, kept as the reference the fast paths (PacketLayout,
+    decode_capture) are tested against; it deliberately doesn't share their angle conversion.
+    Returns (roll, pitch, check_status), with None angles for a malformed line.
+    """
+    try:
+        bytes_data = hex_string.strip().split()
+        
+        if len(bytes_data) != 32:
+            return None, None, "invalid packet length"
+            
+        if bytes_data[0] != '5A' or bytes_data[1] != 'A5' or bytes_data[-1] != 'AA':
+            return None, None, "invalid header or terminator"
+        
+        s = sum(int(i,16) for i in bytes_data[2:30])
+        
+        if int(bytes_data[-2],16) == s%256:
+            check_status = "checksum verification successful"
+        else:
+            check_status = "checksum verification failed"
+
+        roll_high = int(bytes_data[8], 16)
+        roll_low = int(bytes_data[9], 16)
+        roll_raw = (roll_high << 8) | roll_low
+        
+        pitch_high = int(bytes_data[10], 16)
+        pitch_low = int(bytes_data[11], 16)
+        pitch_raw = (pitch_high << 8) | pitch_low
+        
+        if roll_raw & 0x8000:
+            roll_raw = -((~roll_raw & 0xFFFF) + 1)
+        if pitch_raw & 0x8000:
+            pitch_raw = -((~pitch_raw & 0xFFFF) + 1)
+        
+        roll_angle = roll_raw / RESOLUTION_FACTOR
+        pitch_angle = pitch_raw / RESOLUTION_FACTOR
+        
+        roll_angle = round(max(min(roll_angle, MAX_ANGLE), MIN_ANGLE),1)
+        pitch_angle = round(max(min(pitch_angle, MAX_ANGLE), MIN_ANGLE),1)
+        
+        return roll_angle, pitch_angle, check_status
+        
+    except Exception as e:
+        print(f"Processing error: {e}")
+        return None, None, f"processing error: {e}"
+
+def angle_from_raw(raw):
+    """Convert a signed raw angle word into degrees, clamped and rounded like process_hex_data."""
+    return round(max(min(raw / RESOLUTION_FACTOR, MAX_ANGLE), MIN_ANGLE), 1)
+
+def decode_angle(high, low):
+    """Convert a big-endian two's-complement angle word into degrees, as process_hex_data does."""
+    raw = (high << 8) | low
+    if raw & 0x8000:
+        raw = -((~raw & 0xFFFF) + 1)
+    return angle_from_raw(raw)
+
+FIELD_CONVERTERS = {"angle": angle_from_raw}
+
+# struct codes of PACKET_LAYOUTS and their NumPy equivalents (byte strings become uint8 arrays)
+NUMPY_CODES = {"B": "u1", "b": "i1", "H": "u2", "h": "i2", "I": "u4", "i": "i4"}
+
+class Packet:
+    """Base of the __slots__ records PacketLayout generates, one class per layout."""
+
+    __slots__ = ()
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+class PacketLayout:
+    """A PACKET_LAYOUTS entry compiled into one Struct, a NumPy dtype and a __slots__ record class."""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.names = tuple(field[0] for field in fields)
+        self.struct = struct.Struct(">" + "".join(field[1] for field in fields))
+        if self.struct.size != PACKET_SIZE:
+            raise ValueError(f"Packet layout {name!r} covers {self.struct.size} bytes, expected {PACKET_SIZE}")
+        self.converters = tuple((index, FIELD_CONVERTERS[kind]) for index, (_, _, kind) in enumerate(fields) if kind)
+        self.offsets = {}
+        for index, (field, code, _) in enumerate(fields):
+            self.offsets[field] = struct.calcsize(">" + "".join(f[1] for f in fields[:index]))
+        self.checksum_span = (self.offsets["header"] + struct.calcsize(">" + fields[0][1]), self.offsets["checksum"])
+        self.record = type(f"{name.title().replace('-', '').replace('_', '')}Packet", (Packet,),
+                           {"__slots__": self.names + ("valid",)})
+        # Roll and pitch alone, the rest skipped as padding, for the per-packet hot path
+        axes = sorted(("roll", "pitch"), key=self.offsets.get)
+        layout, position = ">", 0
+        for axis in axes:
+            layout += f"{self.offsets[axis] - position}x{self.code(axis)}"
+            position = self.offsets[axis] + struct.calcsize(">" + self.code(axis))
+        self.angle_struct = struct.Struct(layout)
+        self.angle_order = axes == ["roll", "pitch"]
+        self._dtype = None
+
+    def code(self, field):
+        return self.fields[self.names.index(field)][1]
+
+    def checksum_ok(self, packet):
+        start, end = self.checksum_span
+        return sum(packet[start:end]) & 0xFF == packet[end]
+
+    def angles(self, packet):
+        """(roll, pitch) in degrees without building a record."""
+        first, second = self.angle_struct.unpack_from(packet)
+        if not self.angle_order:
+            first, second = second, first
+        return angle_from_raw(first), angle_from_raw(second)
+
+    def decode(self, packet, checksum_ok=None):
+        """Every field of a framed packet as a record; pass checksum_ok if the framer already checked it."""
+        values = list(self.struct.unpack_from(packet))
+        for index, convert in self.converters:
+            values[index] = convert(values[index])
+        record = self.record()
+        for name, value in zip(self.names, values):
+            setattr(record, name, value)
+        if checksum_ok is None:
+            checksum_ok = (packet[0] == HEADER_HIGH and packet[1] == HEADER_LOW
+                           and packet[PACKET_SIZE - 1] == TERMINATOR and self.checksum_ok(packet))
+        record.valid = checksum_ok
+        return record
+
+    def dtype(self):
+        """Structured NumPy dtype of the raw packet, built on first use."""
+        if self._dtype is None:
+            import numpy as np
+
+            fields = []
+            for name, code, _ in self.fields:
+                if code.endswith("s"):
+                    fields.append((name, "u1", (int(code[:-1] or 1),)))
+                else:
+                    fields.append((name, ">" + NUMPY_CODES[code]))
+            self._dtype = np.dtype(fields)
+        return self._dtype
+
+_packet_layouts = {}
+
+def packet_layout(name="default"):
+    """The compiled PacketLayout for a PACKET_LAYOUTS entry."""
+    layout = _packet_layouts.get(name)
+    if layout is None:
+        if name not in PACKET_LAYOUTS:
+            raise ValueError(f"Unknown packet layout {name!r}, expected one of: {', '.join(PACKET_LAYOUTS)}")
+        layout = _packet_layouts[name] = PacketLayout(name, PACKET_LAYOUTS[name])
+    return layout
+
+def decode_packet(packet, layout=None):
+    """Return (roll, pitch) from a framed 32-byte packet (bytes, bytearray or memoryview)."""
+    return (layout or packet_layout()).angles(packet)
+
+def packet_checksum_ok(packet, layout=None):
+    """The checksum byte must equal the sum of the bytes it covers modulo 256 (bytes 2..29 by default)."""
+    return (layout or packet_layout()).checksum_ok(packet)
+
+class PacketFramer:
+    """Split a raw byte stream into PACKET_SIZE frames, resynchronising on HEADER_HIGH/HEADER_LOW."""
+
+    HEADER = bytes((HEADER_HIGH, HEADER_LOW))
+
+    def __init__(self, buffer_size=4096, layout=None):
+        self.layout = layout or packet_layout()  # Decides which bytes the checksum covers
+        self.buffer = bytearray(buffer_size)
+        self.start = 0  # First unconsumed byte
+        self.end = 0  # One past the last buffered byte
+        self.position = 0  # Stream offset of buffer[start]
+
+        self.packets = 0
+        self.checksum_failures = 0
+        self.resyncs = 0
+        self.bytes_discarded = 0
+
+    def append(self, data):
+        """Copy data behind the unconsumed bytes, compacting or growing the buffer as needed."""
+        length = len(data)
+        if self.end + length > len(self.buffer):
+            pending = self.end - self.start
+            if pending + length > len(self.buffer):
+                # Grow into a new buffer: packets handed out earlier may still hold a view on the old one
+                grown = bytearray(max(2 * len(self.buffer), pending + length))
+                grown[:pending] = self.buffer[self.start:self.end]
+                self.buffer = grown
+            else:
+                self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        self.buffer[self.end:self.end + length] = data
+        self.end += length
+
+    def feed(self, data):
+        """Buffer data and yield (packet memoryview, checksum_ok) for each complete frame.
+
+        A yielded memoryview points into the framer's buffer and is only valid until the next feed().
+        """
+        self.append(data)
+        buffer = self.buffer
+        view = memoryview(buffer)
+        try:
+            while self.end - self.start >= PACKET_SIZE:
+                start = self.start
+                if (buffer[start] == HEADER_HIGH and buffer[start + 1] == HEADER_LOW
+                        and buffer[start + PACKET_SIZE - 1] == TERMINATOR):
+                    packet = view[start:start + PACKET_SIZE]
+                    checksum_ok = self.layout.checksum_ok(packet)
+                    self.packets += 1
+                    if not checksum_ok:
+                        self.checksum_failures += 1
+                    self.start = start + PACKET_SIZE
+                    self.position += PACKET_SIZE
+                    yield packet, checksum_ok
+                    continue
+
+                # Corrupt or partial frame: skip to the next header candidate
+                self.resyncs += 1
+                next_start = buffer.find(self.HEADER, start + 1, self.end)
+                if next_start < 0:
+                    # Keep a trailing HEADER_HIGH, it may be the first half of the next header
+                    next_start = self.end - 1 if buffer[self.end - 1] == HEADER_HIGH else self.end
+                self.bytes_discarded += next_start - start
+                self.position += next_start - start
+                self.start = next_start
+        finally:
+            view.release()
+
+class HexLineFramer(PacketFramer):
+    """Framer for the ASCII firmware that prints "Data Packet: 5A A5 ... AA" lines."""
+
+    LINE_LENGTH = len(b"Data Packet: ") + 3 * PACKET_SIZE + 1  # Longest valid line with its \r\n
+    MAX_PENDING = 4 * LINE_LENGTH  # Unterminated data kept before it's treated as garbage
+
+    def __init__(self, buffer_size=4096, layout=None):
+        super().__init__(buffer_size, layout)
+        self.line_buffer = bytearray()
+        self.malformed_lines = 0
+
+    def feed(self, data):
+        """Convert complete hex lines to bytes and frame them like a binary stream."""
+        self.line_buffer += data
+        lines = self.line_buffer.split(b"\n")
+        self.line_buffer = lines.pop()  # Incomplete last line waits for more data
+        if len(self.line_buffer) > self.MAX_PENDING:
+            # No newline for far longer than any line (wrong baud rate, binary device): drop all but the
+            # last line's worth, which may still be the start of a real line
+            dropped = len(self.line_buffer) - self.LINE_LENGTH
+            del self.line_buffer[:dropped]
+            self.bytes_discarded += dropped
+            self.resyncs += 1
+        for line in lines:
+            line = line.replace(b"Data Packet:", b"").strip()
+            if not line:
+                continue
+            try:
+                packet = bytes.fromhex(line.decode("ascii"))
+            except ValueError:
+                self.malformed_lines += 1
+                continue
+            # Only whole frames are passed on so a bad line can never shift the framing
+            if (len(packet) != PACKET_SIZE or packet[0] != HEADER_HIGH or packet[1] != HEADER_LOW
+                    or packet[-1] != TERMINATOR):
+                self.malformed_lines += 1
+                self.resyncs += 1
+                continue
+            yield from super().feed(packet)
+
+_angle_table = None
+
+def angle_table():
+    """Lookup table of decode_angle() for every 16-bit raw value, built on first use."""
+    global _angle_table
+    if _angle_table is None:
+        import numpy as np
+        _angle_table = np.array([decode_angle(raw >> 8, raw & 0xFF) for raw in range(0x10000)])
+    return _angle_table
+
+def decode_capture(data, chunk_size=1 << 24, layout=None):
+    """Decode a whole binary capture in vectorised passes.
+
+    data may be bytes, a memoryview, an mmap or a NumPy (mem)map. Frames are picked the same way
+    PacketFramer picks them and angles come from the same table as decode_angle(), so the result
+    matches the streaming decoder exactly. Returns a dict of NumPy arrays: "offset", "roll",
+    "pitch" and "checksum_ok".
+    """
+    import numpy as np
+
+    layout = layout or packet_layout()
+
+    buffer = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    last_start = len(buffer) - PACKET_SIZE + 1
+
+    # Every offset with a header and a terminator in the right place, scanned in bounded chunks
+    candidates = []
+    for chunk_start in range(0, max(last_start, 0), chunk_size):
+        chunk_end = min(chunk_start + chunk_size, last_start)
+        head = buffer[chunk_start:chunk_end]
+        mask = head == HEADER_HIGH
+        mask &= buffer[chunk_start + 1:chunk_end + 1] == HEADER_LOW
+        mask &= buffer[chunk_start + PACKET_SIZE - 1:chunk_end + PACKET_SIZE - 1] == TERMINATOR
+        candidates.append(np.flatnonzero(mask) + chunk_start)
+    candidates = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.intp)
+
+    # Overlapping candidates only occur around corrupt data; resolve those clusters greedily
+    # like the streaming framer and accept everything else as is
+    keep = np.ones(len(candidates), dtype=bool)
+    close = np.flatnonzero(np.diff(candidates) < PACKET_SIZE)
+    if len(close):
+        next_free = -1
+        for i in np.unique(np.concatenate((close, close + 1))):
+            if candidates[i] < next_free:
+                keep[i] = False
+            else:
+                next_free = candidates[i] + PACKET_SIZE
+    offsets = candidates[keep]
+
+    # Gather the frames into contiguous rows and read the fields through the layout's dtype
+    table = angle_table()
+    dtype = layout.dtype()
+    start, end = layout.checksum_span
+    roll = np.empty(len(offsets))
+    pitch = np.empty(len(offsets))
+    checksum_ok = np.empty(len(offsets), dtype=bool)
+    span = np.arange(PACKET_SIZE)
+    step = max(chunk_size // PACKET_SIZE, 1)
+    for i in range(0, len(offsets), step):
+        frames = buffer[offsets[i:i + step, None] + span]
+        records = frames.view(dtype)[:, 0]
+        roll[i:i + step] = table[records["roll"].view(">u2")]
+        pitch[i:i + step] = table[records["pitch"].view(">u2")]
+        sums = frames[:, start:end].sum(axis=1, dtype=np.uint32) & 0xFF
+        checksum_ok[i:i + step] = sums == frames[:, end]
+
+    return {"offset": offsets, "roll": roll, "pitch": pitch, "checksum_ok": checksum_ok}
+
+# One decoded reading as published by the reader thread. Replaced as a whole, never mutated,
+# so the UI always sees a roll and pitch from the same packet. seq increases with every packet.
+Sample = namedtuple("Sample", "seq timestamp roll pitch sensor", defaults=(None,))
+
+class PacketRecorder:
+    """Append timestamped raw packets and decoded angles to a fixed-record binary file.
+
+    Records are queued by the reader and written in batches by a background thread; each batch is
+    fsync'ed, so a power loss costs at most the batch being written.
+    """
+
+    def __init__(self, path, batch_size=256, batch_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.records_written = 0
+        self.queue = queue.Queue()
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            self.file.write(RECORD_MAGIC)
+        else:
+            self.trim_partial_record()
+
+        self.thread = threading.Thread(target=self.write_batches, daemon=True)
+        self.thread.start()
+
+    def trim_partial_record(self):
+        """Cut off a half-written record left by a power loss so appends stay aligned."""
+        size = os.path.getsize(self.path)
+        body = size - len(RECORD_MAGIC)
+        if body % RECORD_FORMAT.size:
+            self.file.truncate(size - body % RECORD_FORMAT.size)
+
+    def record(self, timestamp, packet, roll, pitch, checksum_ok):
+        """Queue one decoded packet. Called from the reader thread."""
+        self.queue.put(RECORD_FORMAT.pack(timestamp, bytes(packet), round(roll * 10), round(pitch * 10),
+                                          1 if checksum_ok else 0))
+
+    def write_batches(self):
+        """Collect queued records and write them in batches until close() is called."""
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.batch_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.file.write(b"".join(batch))
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.records_written += len(batch)
+                except OSError as e:
+                    print(f"Recorder write error: {e}")
+        self.file.close()
+
+    def close(self):
+        """Flush the remaining records and close the file."""
+        self.queue.put(None)
+        self.thread.join()
+
+def read_recording(path):
+    """Yield (timestamp, packet, roll, pitch, checksum_ok) for every complete record in a recording."""
+    with open(path, "rb") as f:
+        if f.read(len(RECORD_MAGIC)) != RECORD_MAGIC:
+            raise ValueError(f"{path} is not an inclinometer recording")
+        while True:
+            chunk = f.read(RECORD_FORMAT.size * 1024)
+            usable = len(chunk) - len(chunk) % RECORD_FORMAT.size  # Ignore a trailing partial record
+            for timestamp, packet, roll, pitch, flags in RECORD_FORMAT.iter_unpack(chunk[:usable]):
+                yield timestamp, packet, roll / 10, pitch / 10, bool(flags & 1)
+            if len(chunk) < RECORD_FORMAT.size * 1024:
+                break
+
+def archive_day_name(day):
+    return time.strftime("%Y-%m-%d", time.gmtime(day * 86400))
+
+def archive_summary_dtype():
+    import numpy as np
+
+    return np.dtype([("bucket", "<i8"), ("count", "<u4"), ("roll_min", "<i2"), ("roll_max", "<i2"),
+                     ("roll_sum", "<i8"), ("pitch_min", "<i2"), ("pitch_max", "<i2"), ("pitch_sum", "<i8")])
+
+def encode_archive_raw(times, rolls, pitches):
+    """Delta-encode one raw block: millisecond time steps, then roll and pitch steps in tenths."""
+    import numpy as np
+
+    offsets = np.round((times - times[0]) * 1000).astype(np.int64)
+    return zlib.compress(np.diff(offsets, prepend=0).astype("<i4").tobytes()
+                         + np.diff(rolls, prepend=0).astype("<i2").tobytes()
+                         + np.diff(pitches, prepend=0).astype("<i2").tobytes())
+
+def decode_archive_raw(payload, count, first):
+    """(times, rolls, pitches) of a raw block; angles in tenths of a degree."""
+    import numpy as np
+
+    data = zlib.decompress(payload)
+    times = first + np.cumsum(np.frombuffer(data, "<i4", count)) / 1000
+    rolls = np.cumsum(np.frombuffer(data, "<i2", count, 4 * count), dtype=np.int16)
+    pitches = np.cumsum(np.frombuffer(data, "<i2", count, 6 * count), dtype=np.int16)
+    return times, rolls, pitches
+
+def summarize_samples(times, rolls, pitches, width):
+    """Summary rows of samples sorted by time, one per width-second bucket that has samples."""
+    import numpy as np
+
+    buckets = np.floor(times / width).astype(np.int64)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    rows = np.empty(len(starts), dtype=archive_summary_dtype())
+    rows["bucket"] = buckets[starts]
+    rows["count"] = np.diff(starts, append=len(buckets))
+    for axis, values in (("roll", rolls), ("pitch", pitches)):
+        rows[f"{axis}_min"] = np.minimum.reduceat(values, starts)
+        rows[f"{axis}_max"] = np.maximum.reduceat(values, starts)
+        rows[f"{axis}_sum"] = np.add.reduceat(values.astype(np.int64), starts)
+    return rows
+
+def merge_summary_rows(rows):
+    """Combine rows of the same bucket (split across blocks or written twice after a restart)."""
+    import numpy as np
+
+    if len(rows) < 2:
+        return rows
+    rows = rows[np.argsort(rows["bucket"], kind="stable")]
+    starts = np.flatnonzero(np.diff(rows["bucket"], prepend=rows["bucket"][0] - 1))
+    if len(starts) == len(rows):
+        return rows
+    merged = np.empty(len(starts), dtype=rows.dtype)
+    merged["bucket"] = rows["bucket"][starts]
+    merged["count"] = np.add.reduceat(rows["count"], starts)
+    for axis in ("roll", "pitch"):
+        merged[f"{axis}_min"] = np.minimum.reduceat(rows[f"{axis}_min"], starts)
+        merged[f"{axis}_max"] = np.maximum.reduceat(rows[f"{axis}_max"], starts)
+        merged[f"{axis}_sum"] = np.add.reduceat(rows[f"{axis}_sum"], starts)
+    return merged
+
+def write_archive_block(f, level, rows, first, last, payload):
+    f.write(ARCHIVE_BLOCK.pack(ARCHIVE_MAGIC, level, rows, first, last, len(payload)))
+    f.write(payload)
+
+class ArchiveWriter:
+    """Append decoded samples to an archive directory, with their 1 s, 1 min and 1 h summaries.
+
+    Samples are queued by the reader and written by a background thread as one compressed raw block
+    per ARCHIVE_FLUSH_SECONDS[0]. Summary rows collect until their level's flush span or the end of the
+    UTC day. Summaries lost in a crash are rebuilt from the raw blocks on the next start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.queue = queue.Queue()
+        self.pending = [[], [], []]  # Raw samples not written yet: times, rolls, pitches in tenths
+        self.pending_rows = {level: [] for level in range(1, len(ARCHIVE_LEVELS))}
+        self.samples_written = 0
+        self.blocks_written = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def append(self, timestamp, roll, pitch):
+        """Queue one sample. Called from the reader thread."""
+        self.queue.put((timestamp, round(roll * 10), round(pitch * 10)))
+
+    def run(self):
+        try:
+            self.catch_up()
+        except Exception as e:
+            print(f"Archive recovery error: {e}")
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=1)
+            except queue.Empty:
+                item = False
+            if item is None:
+                running = False
+            elif item:
+                times = self.pending[0]
+                if times and int(item[0] // 86400) != int(times[0] // 86400):
+                    self.flush(force=True)  # Blocks never cross a UTC day
+                for column, value in zip(self.pending, item):
+                    column.append(value)
+            times = self.pending[0]
+            if times and (not running or times[-1] - times[0] >= ARCHIVE_FLUSH_SECONDS[0]):
+                self.flush(force=not running)
+        self.flush(force=True)
+
+    def flush(self, force=False):
+        """Write the pending raw block and any summary level whose span is full (all with force)."""
+        import numpy as np
+
+        try:
+            if self.pending[0]:
+                times = np.array(self.pending[0])
+                order = np.argsort(times, kind="stable")
+                # Summarise the millisecond times the raw block stores, so every level agrees on bucket edges
+                times = times[order][0] + np.round((times[order] - times[order][0]) * 1000) / 1000
+                rolls = np.array(self.pending[1], dtype=np.int16)[order]
+                pitches = np.array(self.pending[2], dtype=np.int16)[order]
+                self.pending = [[], [], []]
+                day = int(times[0] // 86400)
+                self.write(day, 0, times[0], times[-1], len(times), encode_archive_raw(times, rolls, pitches))
+                self.samples_written += len(times)
+                self.add_summaries(times, rolls, pitches)
+            for level, rows in self.pending_rows.items():
+                if rows and (force or rows[-1][1] - rows[0][0] >= ARCHIVE_FLUSH_SECONDS[level]
+                             or int(rows[-1][1] // 86400) != int(rows[0][0] // 86400)):
+                    self.write_rows(level, rows)
+                    rows.clear()
+        except OSError as e:
+            print(f"Archive write error: {e}")
+
+    def add_summaries(self, times, rolls, pitches):
+        for level, rows in self.pending_rows.items():
+            # Rows of a previous day go out on their own before this day's are added
+            if rows and int(rows[-1][1] // 86400) != int(times[0] // 86400):
+                self.write_rows(level, rows)
+                rows.clear()
+            rows.append((times[0], times[-1], summarize_samples(times, rolls, pitches, ARCHIVE_LEVELS[level][1])))
+
+    def write_rows(self, level, rows):
+        import numpy as np
+
+        merged = merge_summary_rows(np.concatenate([summary for _, _, summary in rows]))
+        self.write(int(rows[0][0] // 86400), level, rows[0][0], rows[-1][1], len(merged),
+                   zlib.compress(merged.tobytes()))
+
+    def write(self, day, level, first, last, rows, payload):
+        name = os.path.join(self.path, f"{archive_day_name(day)}.{ARCHIVE_LEVELS[level][0]}")
+        with open(name, "ab") as f:
+            write_archive_block(f, level, rows, first, last, payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.blocks_written += 1
+
+    def catch_up(self):
+        """Summarise raw samples newer than what each level covers, e.g. after a crash."""
+        archive = SampleArchive(self.path)
+        days = archive.days(0)[-2:]
+        for level in self.pending_rows:
+            covered = max((entry[1] for day in days for entry in archive.index(day, level)), default=-math.inf)
+            for day in days:
+                for entry in archive.index(day, 0):
+                    if entry[1] <= covered:
+                        continue
+                    times, rolls, pitches = archive.read(day, 0, entry)
+                    mask = times > covered
+                    if mask.any():
+                        rows = summarize_samples(times[mask], rolls[mask], pitches[mask], ARCHIVE_LEVELS[level][1])
+                        self.pending_rows[level].append((times[mask][0], times[mask][-1], rows))
+            if self.pending_rows[level]:
+                self.write_rows(level, self.pending_rows[level])
+                self.pending_rows[level].clear()
+
+    def close(self):
+        """Write everything still pending and stop the writer thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        return {"samples_written": self.samples_written, "blocks_written": self.blocks_written,
+                "queued": self.queue.qsize()}
+
+class SampleArchive:
+    """Range queries over an archive directory written by ArchiveWriter.
+
+    Each file is one UTC day of one level (raw, 1s, 1m or 1h). Block headers are indexed per file on
+    first use, so a query only opens the days it covers. stats() takes whole buckets from the
+    coarsest level that fits and descends to finer levels only at the edges of the range.
+    """
+
+    def __init__(self, path, cache_blocks=64):
+        if not os.path.isdir(path):
+            raise ValueError(f"{path} is not an archive directory")
+        self.path = path
+        self.indexes = {}  # (day, level) -> (file size when indexed, [(first, last, rows, offset, length)])
+        self.cache = OrderedDict()  # (day, level, offset) -> decoded block
+        self.cache_blocks = cache_blocks
+        self.blocks_read = 0
+        self.level_days = None  # Set of days per level, listed once per query by refresh()
+        self.all_days = []
+
+    def refresh(self):
+        self.level_days = [set(self.days(level)) for level in range(len(ARCHIVE_LEVELS))]
+        self.all_days = sorted(set().union(*self.level_days))
+
+    def complete(self, level, start, end):
+        """True if every day with data in [start, end) still has the level (not compacted away)."""
+        first = bisect.bisect_left(self.all_days, int(start // 86400))
+        last = bisect.bisect_left(self.all_days, int(math.ceil(end / 86400)))
+        return all(day in self.level_days[level] for day in self.all_days[first:last])
+
+    def file_name(self, day, level):
+        return os.path.join(self.path, f"{archive_day_name(day)}.{ARCHIVE_LEVELS[level][0]}")
+
+    def days(self, level):
+        """UTC days (days since the epoch) that have a file for the level, oldest first."""
+        suffix = "." + ARCHIVE_LEVELS[level][0]
+        days = []
+        for name in os.listdir(self.path):
+            if name.endswith(suffix):
+                try:
+                    days.append(int(calendar.timegm(time.strptime(name[:-len(suffix)], "%Y-%m-%d")) // 86400))
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def has(self, day, level):
+        return os.path.exists(self.file_name(day, level))
+
+    def index(self, day, level):
+        """Block entries (first, last, rows, offset, length) of one file; files still growing are re-read."""
+        name = self.file_name(day, level)
+        try:
+            size = os.path.getsize(name)
+        except OSError:
+            return []
+        indexed = self.indexes.get((day, level))
+        if indexed and indexed[0] == size:
+            return indexed[1]
+        entries = list(indexed[1]) if indexed else []
+        offset = entries[-1][3] + entries[-1][4] if entries else 0
+        with open(name, "rb") as f:
+            while offset + ARCHIVE_BLOCK.size <= size:
+                f.seek(offset)
+                magic, block_level, rows, first, last, length = ARCHIVE_BLOCK.unpack(f.read(ARCHIVE_BLOCK.size))
+                if magic != ARCHIVE_MAGIC or block_level != level:
+                    raise ValueError(f"{name} is damaged at offset {offset}")
+                if offset + ARCHIVE_BLOCK.size + length > size:
+                    break  # Block still being written or cut off by a crash
+                entries.append((first, last, rows, offset + ARCHIVE_BLOCK.size, length))
+                offset += ARCHIVE_BLOCK.size + length
+        self.indexes[(day, level)] = (size, entries)
+        return entries
+
+    def read(self, day, level, entry):
+        """Decoded block: (times, rolls, pitches) for raw blocks, summary rows otherwise."""
+        key = (day, level, entry[3])
+        block = self.cache.get(key)
+        if block is not None:
+            self.cache.move_to_end(key)
+            return block
+        import numpy as np
+
+        with open(self.file_name(day, level), "rb") as f:
+            f.seek(entry[3])
+            payload = f.read(entry[4])
+        if level == 0:
+            block = decode_archive_raw(payload, entry[2], entry[0])
+        else:
+            block = np.frombuffer(zlib.decompress(payload), dtype=archive_summary_dtype())
+        self.blocks_read += 1
+        self.cache[key] = block
+        if len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        return block
+
+    def entries(self, level, start, end):
+        """(day, entry) of the blocks that may hold data in [start, end)."""
+        width = ARCHIVE_LEVELS[level][1] or 0
+        days = sorted(self.level_days[level]) if self.level_days else self.days(level)
+        for day in days[bisect.bisect_left(days, int(start // 86400)):bisect.bisect_left(days, math.ceil(end / 86400))]:
+            for entry in self.index(day, level):
+                # A summary row covers its whole bucket, so widen the block's sample span to bucket edges
+                first = entry[0] - entry[0] % width if width else entry[0]
+                last = entry[1] - entry[1] % width + width if width else entry[1]
+                if first < end and last >= start:
+                    yield day, entry
+
+    def samples(self, start, end):
+        """Raw samples in [start, end) as NumPy arrays: time, roll and pitch in degrees."""
+        import numpy as np
+
+        parts = []
+        for day, entry in self.entries(0, start, end):
+            times, rolls, pitches = self.read(day, 0, entry)
+            mask = (times >= start) & (times < end)
+            parts.append((times[mask], rolls[mask], pitches[mask]))
+        if not parts:
+            return {"time": np.empty(0), "roll": np.empty(0), "pitch": np.empty(0)}
+        times, rolls, pitches = (np.concatenate(column) for column in zip(*parts))
+        order = np.argsort(times, kind="stable")
+        return {"time": times[order], "roll": rolls[order] / 10, "pitch": pitches[order] / 10}
+
+    def rows(self, level, start, end, inside=True):
+        """Merged summary rows of a level for buckets within [start, end), or overlapping it."""
+        import numpy as np
+
+        width = ARCHIVE_LEVELS[level][1]
+        parts = []
+        for day, entry in self.entries(level, start, end):
+            rows = self.read(day, level, entry)
+            if inside:
+                mask = (rows["bucket"] * width >= start) & ((rows["bucket"] + 1) * width <= end)
+            else:
+                mask = (rows["bucket"] * width < end) & ((rows["bucket"] + 1) * width > start)
+            parts.append(rows[mask])
+        return merge_summary_rows(np.concatenate(parts)) if parts else np.empty(0, dtype=archive_summary_dtype())
+
+    def stats(self, start, end):
+        """Count, min, max and mean of roll and pitch in [start, end).
+
+        "approximate" is set when part of the range was only available as summaries whose buckets
+        stick out of the range, i.e. the raw data there has been compacted away.
+        """
+        import numpy as np
+
+        self.blocks_read = 0
+        self.refresh()
+        parts = []
+        approximate = self.collect(len(ARCHIVE_LEVELS) - 1, start, end, parts)
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=archive_summary_dtype())
+        count = int(rows["count"].sum())
+        result = {"count": count, "approximate": approximate, "blocks_read": self.blocks_read}
+        for axis in ("roll", "pitch"):
+            if count:
+                result[axis] = {"min": int(rows[f"{axis}_min"].min()) / 10,
+                                "max": int(rows[f"{axis}_max"].max()) / 10,
+                                "mean": int(rows[f"{axis}_sum"].sum()) / count / 10}
+            else:
+                result[axis] = {"min": None, "max": None, "mean": None}
+        return result
+
+    def collect(self, level, start, end, parts):
+        """Add summary rows covering [start, end) to parts. Returns True if any of them was approximate."""
+        import numpy as np
+
+        if start >= end:
+            return False
+        if level == 0:
+            if self.complete(0, start, end):
+                samples = self.samples(start, end)
+                if len(samples["time"]):
+                    parts.append(summarize_samples(samples["time"], np.round(samples["roll"] * 10).astype(np.int16),
+                                                   np.round(samples["pitch"] * 10).astype(np.int16), math.inf))
+                return False
+            # Raw data compacted away: fall back to the finest summary that overlaps the range
+            for finer in range(1, len(ARCHIVE_LEVELS)):
+                rows = self.rows(finer, start, end, inside=False)
+                if len(rows):
+                    parts.append(rows)
+                    return True
+            return False
+        width = ARCHIVE_LEVELS[level][1]
+        inner_start = math.ceil(start / width) * width
+        inner_end = math.floor(end / width) * width
+        if inner_start >= inner_end or not self.complete(level, inner_start, inner_end):
+            return self.collect(level - 1, start, end, parts)
+        parts.append(self.rows(level, inner_start, inner_end))
+        return self.collect(level - 1, start, inner_start, parts) | self.collect(level - 1, inner_end, end, parts)
+
+    def series(self, start, end, points=1000):
+        """Overview of [start, end) from the finest level with at most about `points` buckets.
+
+        Returns NumPy arrays: time (bucket start), count, and min, max and mean per axis in degrees,
+        plus "level", the name of the level used. None if nothing was archived in the range.
+        """
+        import numpy as np
+
+        self.refresh()
+        for level in range(len(ARCHIVE_LEVELS)):
+            width = ARCHIVE_LEVELS[level][1]
+            if (end - start) / max(width, 1e-3) > points and level < len(ARCHIVE_LEVELS) - 1:
+                continue
+            if level == 0:
+                samples = self.samples(start, end)
+                if len(samples["time"]):
+                    return {"level": "raw", "time": samples["time"], "count": np.ones(len(samples["time"]), int),
+                            "roll_min": samples["roll"], "roll_max": samples["roll"], "roll_mean": samples["roll"],
+                            "pitch_min": samples["pitch"], "pitch_max": samples["pitch"],
+                            "pitch_mean": samples["pitch"]}
+                continue
+            rows = self.rows(level, start, end, inside=False)
+            if not len(rows):
+                if level < len(ARCHIVE_LEVELS) - 1:
+                    continue  # Compacted away at this resolution, try a coarser one
+                return None
+            result = {"level": ARCHIVE_LEVELS[level][0], "time": rows["bucket"] * width, "count": rows["count"]}
+            for axis in ("roll", "pitch"):
+                result[f"{axis}_min"] = rows[f"{axis}_min"] / 10
+                result[f"{axis}_max"] = rows[f"{axis}_max"] / 10
+                result[f"{axis}_mean"] = rows[f"{axis}_sum"] / np.maximum(rows["count"], 1) / 10
+            return result
+
+    def info(self):
+        """Per level: days on disk, blocks, samples or rows, bytes and the time span covered."""
+        info = {}
+        for level, (name, _) in enumerate(ARCHIVE_LEVELS):
+            days = self.days(level)
+            entries = [entry for day in days for entry in self.index(day, level)]
+            info[name] = {"days": len(days), "blocks": len(entries), "rows": sum(entry[2] for entry in entries),
+                          "bytes": sum(os.path.getsize(self.file_name(day, level)) for day in days),
+                          "first": min((entry[0] for entry in entries), default=None),
+                          "last": max((entry[1] for entry in entries), default=None)}
+        return info
+
+def compact_archive(path, keep_raw_days=30, keep_1s_days=365, now=None):
+    """Roll old raw data up into summaries and drop it, and merge the summary blocks of finished days.
+
+    For days before yesterday (UTC) each summary level is rewritten as one block, recomputed from raw
+    where it is still on disk. Raw files keep their per-minute blocks, so a short query still decodes
+    only a minute of samples. Raw files older than keep_raw_days and 1 s summaries older than
+    keep_1s_days are then deleted. Returns counts of what was done.
+    """
+    import numpy as np
+
+    archive = SampleArchive(path)
+    today = int((now or time.time()) // 86400)
+    report = {"days_rewritten": 0, "raw_days_removed": 0, "1s_days_removed": 0, "bytes_before": 0, "bytes_after": 0}
+    days = sorted(set().union(*(archive.days(level) for level in range(len(ARCHIVE_LEVELS)))))
+    for day in days:
+        if day >= today - 1:
+            continue  # The writer may still append to these
+        names = [archive.file_name(day, level) for level in range(len(ARCHIVE_LEVELS))]
+        report["bytes_before"] += sum(os.path.getsize(name) for name in names if os.path.exists(name))
+
+        raw = None
+        if archive.has(day, 0):
+            blocks = [archive.read(day, 0, entry) for entry in archive.index(day, 0)]
+            if blocks:
+                times, rolls, pitches = (np.concatenate(column) for column in zip(*blocks))
+                order = np.argsort(times, kind="stable")
+                raw = times[order], rolls[order], pitches[order]
+        for level in range(1, len(ARCHIVE_LEVELS)):
+            if raw is not None:
+                rows = summarize_samples(*raw, ARCHIVE_LEVELS[level][1])
+                first, last = raw[0][0], raw[0][-1]
+            else:
+                entries = archive.index(day, level)
+                if len(entries) < 2:
+                    continue  # Nothing to merge
+                rows = merge_summary_rows(np.concatenate([archive.read(day, level, entry) for entry in entries]))
+                first, last = min(entry[0] for entry in entries), max(entry[1] for entry in entries)
+            temporary = names[level] + ".tmp"
+            with open(temporary, "wb") as f:
+                write_archive_block(f, level, len(rows), first, last, zlib.compress(rows.tobytes()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, names[level])
+        report["days_rewritten"] += 1
+
+        if raw is not None and day < today - keep_raw_days:
+            os.remove(names[0])
+            report["raw_days_removed"] += 1
+        if archive.has(day, 1) and day < today - keep_1s_days:
+            os.remove(names[1])
+            report["1s_days_removed"] += 1
+        report["bytes_after"] += sum(os.path.getsize(name) for name in names if os.path.exists(name))
+    return report
+
+class EMAFilter:
+    """Exponential moving average: y += alpha * (x - y)."""
+
+    def __init__(self, alpha=0.2):
+        if not 0 < alpha <= 1:
+            raise ValueError("EMA alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x):
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+class MovingAverageFilter:
+    """Mean of the last `window` samples, kept as a running sum over an array-backed ring buffer."""
+
+    def __init__(self, window=8):
+        if window < 1:
+            raise ValueError("Moving average window must be at least 1")
+        self.window = window
+        self.reset()
+
+    def update(self, x):
+        if self.count < self.window:
+            self.count += 1
+        else:
+            self.total -= self.ring[self.index]
+        self.ring[self.index] = x
+        self.total += x
+        self.index = (self.index + 1) % self.window
+        return self.total / self.count
+
+    def reset(self):
+        self.ring = array("d", bytes(8 * self.window))
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+class MedianFilter:
+    """Median of the last `window` samples. A ring buffer plus a sorted copy; the cost depends on the
+    window size only, not on how many samples have been seen."""
+
+    def __init__(self, window=5):
+        if window < 1:
+            raise ValueError("Median window must be at least 1")
+        self.window = window
+        self.reset()
+
+    def update(self, x):
+        if len(self.ring) == self.window:
+            oldest = self.ring[self.index]
+            del self.sorted[bisect.bisect_left(self.sorted, oldest)]
+            self.ring[self.index] = x
+        else:
+            self.ring.append(x)
+        self.index = (self.index + 1) % self.window
+        bisect.insort(self.sorted, x)
+        middle = len(self.sorted) // 2
+        if len(self.sorted) % 2:
+            return self.sorted[middle]
+        return (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    def reset(self):
+        self.ring = array("d")
+        self.sorted = []
+        self.index = 0
+
+class KalmanFilter:
+    """Scalar Kalman filter for a slowly varying angle (random-walk model)."""
+
+    def __init__(self, process_noise=0.01, measurement_noise=0.5):
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.reset()
+
+    def update(self, x):
+        if self.estimate is None:
+            self.estimate = x
+            return x
+        self.error += self.process_noise
+        gain = self.error / (self.error + self.measurement_noise)
+        self.estimate += gain * (x - self.estimate)
+        self.error *= 1 - gain
+        return self.estimate
+
+    def reset(self):
+        self.estimate = None
+        self.error = 1.0
+
+FILTERS = {
+    "ema": EMAFilter,
+    "mean": MovingAverageFilter,
+    "median": MedianFilter,
+    "kalman": KalmanFilter,
+}
+
+def make_filter(spec):
+    """Build a filter from "name[:arg[:arg]]", e.g. "ema:0.3", "mean:10", "median:5", "kalman:0.01:0.5".
+
+    Returns None for "none" or an empty spec.
+    """
+    if not spec or spec == "none":
+        return None
+    name, *params = spec.split(":")
+    if name not in FILTERS:
+        raise ValueError(f"Unknown filter {name!r}, expected one of: none, {', '.join(FILTERS)}")
+    cls = FILTERS[name]
+    args = [int(p) if cls in (MovingAverageFilter, MedianFilter) else float(p) for p in params]
+    return cls(*args)
+
+class SampleHistory:
+    """Fixed-capacity ring of (timestamp, roll, pitch) with a min/max pyramid for trend charts.
+
+    Level 0 is the raw ring. Each further level keeps the first timestamp and the min and max of
+    every block of 4, 16, 64, ... consecutive samples, so any span can be reduced to a chart's pixel
+    width by reading a few buckets per column, whether it covers a minute or a day. Only the
+    acquisition thread appends; a reader may see the newest bucket change under it, which at worst
+    shifts one column.
+    """
+
+    FANOUT = 4
+
+    def __init__(self, capacity=864000):
+        self.capacity = capacity
+        self.times = array("d", [0.0]) * capacity
+        self.axes = (array("f", [0.0]) * capacity, array("f", [0.0]) * capacity)  # roll, pitch
+        self.total = 0  # Samples appended so far; sample n is stored at n % capacity
+        self.levels = []  # (block size, times, roll min, roll max, pitch min, pitch max)
+        block = self.FANOUT
+        while block < capacity:
+            buckets = capacity // block + 2  # Covers every block that still has a sample in the raw ring
+            self.levels.append((block, array("d", [0.0]) * buckets) +
+                               tuple(array("f", [0.0]) * buckets for _ in range(4)))
+            block *= self.FANOUT
+
+    def append(self, timestamp, roll, pitch):
+        n = self.total
+        slot = n % self.capacity
+        self.times[slot] = timestamp
+        self.axes[0][slot] = roll
+        self.axes[1][slot] = pitch
+        for block, times, roll_min, roll_max, pitch_min, pitch_max in self.levels:
+            bucket = (n // block) % len(times)
+            if n % block == 0:
+                times[bucket] = timestamp
+                roll_min[bucket] = roll_max[bucket] = roll
+                pitch_min[bucket] = pitch_max[bucket] = pitch
+                continue
+            if roll_min[bucket] <= roll <= roll_max[bucket] and pitch_min[bucket] <= pitch <= pitch_max[bucket]:
+                break  # Already inside this range, and so inside every coarser one
+            roll_min[bucket] = min(roll_min[bucket], roll)
+            roll_max[bucket] = max(roll_max[bucket], roll)
+            pitch_min[bucket] = min(pitch_min[bucket], pitch)
+            pitch_max[bucket] = max(pitch_max[bucket], pitch)
+        self.total = n + 1  # Counted only once the sample is in place
+
+    def index_at(self, timestamp, first, end):
+        """First sample index in [first, end) whose timestamp is not older than timestamp."""
+        while first < end:
+            middle = (first + end) // 2
+            if self.times[middle % self.capacity] < timestamp:
+                first = middle + 1
+            else:
+                end = middle
+        return first
+
+    def trend(self, span, columns, axis=0):
+        """Min/max envelope of one axis (0 roll, 1 pitch) over the last span seconds of data.
+
+        Returns (lows, highs), one entry per column with None where there is no data, or None when
+        the history is empty. Reads between 2 and 8 buckets per column at any span.
+        """
+        total = self.total
+        if not total or columns < 1:
+            return None
+        end_time = self.times[(total - 1) % self.capacity]
+        start_time = end_time - span
+        first = self.index_at(start_time, max(0, total - self.capacity), total)
+        count = total - first
+
+        # Coarsest level that still has at least two buckets per column
+        block, times, lows, highs = 1, self.times, self.axes[axis], self.axes[axis]
+        for level in self.levels:
+            if count // level[0] < 2 * columns:
+                break
+            block, times = level[0], level[1]
+            lows, highs = level[2 + 2 * axis], level[3 + 2 * axis]
+
+        column_lows = [None] * columns
+        column_highs = [None] * columns
+        scale = columns / span if span > 0 else 0
+        for index in range(first // block, (total - 1) // block + 1):
+            slot = index % len(times)
+            column = min(max(int((times[slot] - start_time) * scale), 0), columns - 1)
+            low, high = lows[slot], highs[slot]
+            if column_lows[column] is None:
+                column_lows[column], column_highs[column] = low, high
+            else:
+                column_lows[column] = min(column_lows[column], low)
+                column_highs[column] = max(column_highs[column], high)
+        return column_lows, column_highs
+
+AlarmEvent = namedtuple("AlarmEvent", "timestamp rule state value sensor")
+
+class AlarmRule:
+    """Threshold on roll or pitch (the value, its magnitude or its rate of change in °/s).
+
+    Raises once the limit has been exceeded for `duration` seconds and clears only when the measure
+    is back inside the limit by `hysteresis`, so a reading hovering at the limit doesn't flap. The
+    rate is taken over at least `window` seconds, since 0.1° steps between consecutive packets
+    would look like large rates.
+    """
+
+    def __init__(self, name, axis, limit, above=True, measure="value", hysteresis=0.5, duration=0.0,
+                 window=0.5):
+        self.name = name
+        self.axis = axis  # 0 roll, 1 pitch
+        self.limit = limit
+        self.above = above
+        self.measure = measure  # "value", "abs" or "rate"
+        self.hysteresis = hysteresis
+        self.duration = duration
+        self.window = window
+        self.active = False
+        self.since = None  # When the limit was first exceeded while not yet active
+        self.reference = None  # (timestamp, value) the rate of change is measured from
+
+    def update(self, timestamp, value):
+        """Feed one sample. Returns (state, measure) on a transition ("raised" or "cleared"), else None."""
+        if self.measure == "rate":
+            reference = self.reference
+            if reference is None or timestamp < reference[0]:
+                self.reference = (timestamp, value)
+                return None
+            if timestamp - reference[0] < self.window:
+                return None
+            self.reference = (timestamp, value)
+            value = abs(value - reference[1]) / (timestamp - reference[0])
+        elif self.measure == "abs":
+            value = abs(value)
+
+        if not self.active:
+            if value > self.limit if self.above else value < self.limit:
+                if self.since is None:
+                    self.since = timestamp
+                if timestamp - self.since >= self.duration:
+                    self.active = True
+                    return "raised", value
+            else:
+                self.since = None
+        elif value < self.limit - self.hysteresis if self.above else value > self.limit + self.hysteresis:
+            self.active = False
+            self.since = None
+            return "cleared", value
+        return None
+
+ALARM_SPEC = re.compile(r"^(?P<name>[\w.-]+)=(?:(?P<measure>abs|rate)\((?P<wrapped>roll|pitch)\)|(?P<axis>roll|pitch))"
+                        r"\s*(?P<op>[<>])\s*(?P<limit>-?\d+(?:\.\d*)?)(?P<options>(?:,\w+=\d+(?:\.\d*)?)*)$")
+
+def make_alarm_rule(spec):
+    """Build an AlarmRule from "NAME=EXPR[,hysteresis=DEG][,for=SECONDS][,window=SECONDS]".
+
+    EXPR compares roll, pitch, abs(roll|pitch) or rate(roll|pitch) (°/s) with a limit, e.g.
+    "heel=abs(roll)>15,for=2" or "trim=pitch<-3,hysteresis=1". window sets the rate interval.
+    """
+    match = ALARM_SPEC.match(spec.replace(" ", ""))
+    if not match:
+        raise ValueError(f"Invalid alarm {spec!r}, expected e.g. heel=abs(roll)>15,hysteresis=1,for=2")
+    options = {}
+    for option in filter(None, match["options"].split(",")):
+        key, _, value = option.partition("=")
+        if key not in ("hysteresis", "for", "window"):
+            raise ValueError(f"Unknown alarm option {key!r}, expected hysteresis, for or window")
+        options[key] = float(value)
+    axis = match["wrapped"] or match["axis"]
+    return AlarmRule(match["name"], 0 if axis == "roll" else 1, float(match["limit"]), match["op"] == ">",
+                     match["measure"] or "value", options.get("hysteresis", 0.5), options.get("for", 0.0),
+                     options.get("window", 0.5))
+
+class AlarmEngine:
+    """Evaluate alarm rules for every decoded sample on the acquisition thread.
+
+    Each sensor gets its own rule state. Transitions go to every listener(event) right away (log,
+    broadcaster); the display polls `active` and `version` on its own schedule, so a stalled UI
+    delays only the banner, never detection or the other outputs.
+    """
+
+    def __init__(self, specs, metrics=None):
+        self.specs = list(specs)
+        for spec in self.specs:
+            make_alarm_rule(spec)  # Fail on a bad spec now rather than on the first sample
+        self.rules = {}  # sensor -> [AlarmRule]
+        self.active = {}  # (rule name, sensor) -> AlarmEvent that raised it
+        self.version = 0  # Bumped on every transition
+        self.listeners = []
+        self.eval_time = metrics.histogram("alarm_seconds") if metrics else None
+        self.metrics = metrics
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def evaluate(self, timestamp, roll, pitch, sensor=None):
+        start = time.perf_counter()
+        rules = self.rules.get(sensor)
+        if rules is None:
+            rules = self.rules[sensor] = [make_alarm_rule(spec) for spec in self.specs]
+        for rule in rules:
+            transition = rule.update(timestamp, pitch if rule.axis else roll)
+            if transition:
+                self.emit(AlarmEvent(timestamp, rule.name, transition[0], transition[1], sensor))
+        if self.eval_time:
+            self.eval_time.observe(time.perf_counter() - start)
+
+    def emit(self, event):
+        key = (event.rule, event.sensor)
+        if event.state == "raised":
+            self.active[key] = event
+        else:
+            self.active.pop(key, None)
+        self.version += 1
+        if self.metrics:
+            self.metrics.count(f"alarms_{event.state}")
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Alarm listener error: {e}")
+
+def log_alarm(event):
+    """Print an alarm transition to the console log."""
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event.timestamp))
+    sensor = f" [{event.sensor}]" if event.sensor else ""
+    print(f"{when} ALARM {event.rule}{sensor} {event.state} at {event.value:.1f}")
+
+class SeaStateAnalyzer:
+    """Roll/pitch period, amplitude and RMS over a sliding window, updated as samples arrive.
+
+    Samples are held onto a SEA_STATE_RATE grid. Every half segment a Hann-windowed FFT of the newest
+    segment is added to a running sum of periodograms and the one that left the window is
+    subtracted (Welch's method, one FFT per hop instead of the whole window). Zero up-crossings
+    around the window mean give the cycles for the peak-to-peak statistics. Runs on the reader
+    thread; `latest` is replaced as a whole every interval seconds, like latest_sample.
+    """
+
+    BAND = 0.2  # Degrees around the mean a crossing must clear, so 0.1° quantisation can't add cycles
+
+    def __init__(self, window=1200, rate=SEA_STATE_RATE, segment=SEA_STATE_SEGMENT, interval=SEA_STATE_INTERVAL,
+                 natural_roll_period=None, metrics=None):
+        import numpy as np
+
+        self.window = window
+        self.rate = rate
+        self.segment = segment
+        self.hop = segment // 2
+        self.interval = interval
+        self.natural_roll_period = natural_roll_period
+        self.taper = np.hanning(segment)
+        self.scale = 1 / (rate * (self.taper ** 2).sum())
+        self.frequencies = np.fft.rfftfreq(segment, 1 / rate)
+        self.max_segments = max(1, (int(window * rate) - segment) // self.hop + 1)
+        self.max_samples = int(window * rate)
+        self.analysis_time = metrics.histogram("sea_state_seconds") if metrics else None
+        self.latest = None
+        self.listeners = []
+        self.reset()
+
+    def reset(self):
+        self.next_time = None  # Next grid time to fill
+        self.next_publish = None
+        self.pending = []  # Grid samples of the segment being filled, (roll, pitch)
+        self.spectra = deque()  # Periodograms in the window, shape (2, bins)
+        self.spectrum_sum = None
+        self.hops = 0
+        self.samples = deque()  # Grid samples in the window, for mean and RMS
+        self.sums = [0.0, 0.0]
+        self.squares = [0.0, 0.0]
+        self.crossings = [ZeroCrossings(), ZeroCrossings()]
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def append(self, timestamp, roll, pitch):
+        if self.next_time is None or timestamp - self.next_time > SEA_STATE_MAX_GAP or timestamp < self.next_time - 1:
+            self.reset()
+            self.next_time = timestamp
+            self.next_publish = timestamp + self.interval
+        step = 1 / self.rate
+        while self.next_time <= timestamp:
+            self.add(self.next_time, roll, pitch)
+            self.next_time += step
+        if timestamp >= self.next_publish:
+            self.next_publish += self.interval
+            self.publish(timestamp)
+
+    def add(self, timestamp, roll, pitch):
+        """One grid sample: update the running sums, the cycle trackers and, every hop, the spectrum."""
+        self.samples.append((roll, pitch))
+        for axis, value in enumerate((roll, pitch)):
+            self.sums[axis] += value
+            self.squares[axis] += value * value
+        if len(self.samples) > self.max_samples:
+            old = self.samples.popleft()
+            for axis, value in enumerate(old):
+                self.sums[axis] -= value
+                self.squares[axis] -= value * value
+        count = len(self.samples)
+        for axis, value in enumerate((roll, pitch)):
+            self.crossings[axis].add(timestamp, value, self.sums[axis] / count, self.BAND, self.window)
+
+        self.pending.append((roll, pitch))
+        if len(self.pending) == self.segment:
+            self.add_segment()
+            del self.pending[:self.hop]
+
+    def add_segment(self):
+        import numpy as np
+
+        start = time.perf_counter()
+        values = np.array(self.pending).T
+        values -= values.mean(axis=1, keepdims=True)
+        spectrum = np.abs(np.fft.rfft(values * self.taper, axis=1)) ** 2 * self.scale
+        self.spectra.append(spectrum)
+        if len(self.spectra) > self.max_segments:
+            self.spectrum_sum -= self.spectra.popleft()
+        self.hops += 1
+        if self.spectrum_sum is None or self.hops % self.max_segments == 0:
+            self.spectrum_sum = sum(self.spectra)  # Also stops rounding errors of the running sum building up
+        else:
+            self.spectrum_sum += spectrum
+        if self.analysis_time:
+            self.analysis_time.observe(time.perf_counter() - start)
+
+    def axis_stats(self, axis):
+        count = len(self.samples)
+        mean = self.sums[axis] / count
+        stats = {"mean": mean, "rms": math.sqrt(max(self.squares[axis] / count - mean * mean, 0)),
+                 "period": None}
+        stats.update(self.crossings[axis].stats())
+        if self.spectra:
+            spectrum = self.spectrum_sum[axis]
+            peak = int(spectrum[1:].argmax()) + 1  # Skip the DC bin
+            offset = 0.0
+            if 1 < peak < len(spectrum) - 1:
+                # Parabolic interpolation between bins for a finer period
+                below, centre, above = spectrum[peak - 1:peak + 2]
+                denominator = below - 2 * centre + above
+                if denominator:
+                    offset = 0.5 * (below - above) / denominator
+            frequency = (peak + offset) * self.frequencies[1]
+            if frequency > 0:
+                stats["period"] = float(1 / frequency)
+        return stats
+
+    def publish(self, timestamp):
+        if not self.samples:
+            return
+        roll, pitch = self.axis_stats(0), self.axis_stats(1)
+        warnings = []
+        roll_period = self.natural_roll_period or roll["period"]
+        encounter_period = pitch["period"]  # Pitch follows the wave encounter period
+        if (roll_period and encounter_period and roll["peak_to_peak"] / 2 >= SEA_STATE_WARN_AMPLITUDE
+                and pitch["rms"] >= self.BAND):
+            ratio = roll_period / encounter_period
+            if 0.85 <= ratio <= 1.15:
+                warnings.append("resonance")
+            elif 1.7 <= ratio <= 2.3:
+                warnings.append("parametric roll")
+        previous = self.latest
+        self.latest = {"timestamp": timestamp, "window": len(self.samples) / self.rate,
+                       "roll": roll, "pitch": pitch, "warnings": warnings}
+        if (previous["warnings"] if previous else []) != warnings:
+            for listener in self.listeners:
+                try:
+                    listener(self.latest)
+                except Exception as e:
+                    print(f"Sea state listener error: {e}")
+
+    def stats(self):
+        """Flat numbers of the latest result for the metrics endpoint."""
+        latest = self.latest
+        if latest is None:
+            return {}
+        stats = {"window_seconds": latest["window"], "warning": int(bool(latest["warnings"]))}
+        for axis in ("roll", "pitch"):
+            for name, value in latest[axis].items():
+                if value is not None:
+                    stats[f"{axis}_{name}"] = value
+        return stats
+
+class ZeroCrossings:
+    """Up-crossing cycles of one axis over a sliding time window: period and peak-to-peak height."""
+
+    def __init__(self):
+        self.cycles = deque()  # (timestamp, period, height)
+        self.above = None
+        self.last_up = None
+        self.high = -math.inf
+        self.low = math.inf
+
+    def add(self, timestamp, value, mean, band, window):
+        self.high = max(self.high, value)
+        self.low = min(self.low, value)
+        if value > mean + band and self.above is not True:
+            if self.above is False:
+                if self.last_up is not None:
+                    self.cycles.append((timestamp, timestamp - self.last_up, self.high - self.low))
+                self.last_up = timestamp
+                self.high = self.low = value
+            self.above = True
+        elif value < mean - band and self.above is not False:
+            self.above = False
+        while self.cycles and self.cycles[0][0] < timestamp - window:
+            self.cycles.popleft()
+
+    def stats(self):
+        """Mean zero-crossing period, significant (highest third) and largest peak-to-peak."""
+        if not self.cycles:
+            return {"zero_crossing_period": None, "peak_to_peak": 0.0, "max_peak_to_peak": 0.0, "cycles": 0}
+        heights = sorted((height for _, _, height in self.cycles), reverse=True)
+        highest = heights[:max(1, len(heights) // 3)]
+        return {"zero_crossing_period": sum(period for _, period, _ in self.cycles) / len(self.cycles),
+                "peak_to_peak": sum(highest) / len(highest), "max_peak_to_peak": heights[0],
+                "cycles": len(self.cycles)}
+
+def log_sea_state(result):
+    """Print sea-state warning changes to the console log."""
+    when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(result["timestamp"]))
+    roll, pitch = result["roll"], result["pitch"]
+    if result["warnings"]:
+        print(f"{when} SEA STATE {', '.join(result['warnings'])}: roll period {roll['period']:.1f} s, "
+              f"pitch period {pitch['period']:.1f} s, significant roll ±{roll['peak_to_peak'] / 2:.1f}°")
+    else:
+        print(f"{when} SEA STATE warnings cleared")
+
+class SensorChannel:
+    """One inclinometer handled by the AcquisitionEngine: its port, framer, latest sample and stats."""
+
+    def __init__(self, name, device, input_mode, layout=None):
+        self.name = name
+        self.device = device
+        self.framer = HexLineFramer(layout=layout) if input_mode == "hex" else PacketFramer(layout=layout)
+        self.port = None
+        self.latest_sample = Sample(0, 0.0, 0, 0, name)
+        self.latest_packet = None  # Raw bytes of the last packet, decoded only when displayed
+        self.bytes_read = 0
+        self.errors = 0
+        self.connects = 0
+        self.started = time.time()
+
+    def stats(self):
+        """Per-sensor counters, including the average packet rate since the engine started."""
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            "device": self.device,
+            "connected": self.port is not None,
+            "packets": self.framer.packets,
+            "packets_per_sec": self.framer.packets / elapsed,
+            "checksum_failures": self.framer.checksum_failures,
+            "resyncs": self.framer.resyncs,
+            "malformed_lines": getattr(self.framer, "malformed_lines", 0),
+            "bytes_read": self.bytes_read,
+            "errors": self.errors,
+            "connects": self.connects,
+            "last_sample_age": time.time() - self.latest_sample.timestamp if self.latest_sample.seq else None,
+        }
+
+class AcquisitionEngine:
+    """Read several inclinometers concurrently on a single asyncio event loop thread.
+
+    handler(sensor_name, packet, checksum_ok, sample) is called on the loop thread for every packet,
+    and merge handlers receive a time-aligned {sensor_name: Sample} snapshot every merge_interval seconds.
+    """
+
+    def __init__(self, sensors, baud_rate=9600, input_mode="hex", handler=None, merge_interval=0.1,
+                 metrics=None, layout=None):
+        self.layout = layout or packet_layout()
+        self.channels = OrderedDict((name, SensorChannel(name, device, input_mode, self.layout))
+                                    for name, device in sensors)
+        self.baud_rate = baud_rate
+        self.handler = handler
+        self.parse_time = metrics.histogram("parse_seconds") if metrics else None
+        self.merge_interval = merge_interval
+        self.merge_handlers = []
+        self.loop = None
+        self.stopping = None
+        self.thread = None
+        # Serial handles can't be registered with the Windows event loop, so poll there instead
+        self.use_fd_readers = os.name != "nt"
+        self.poll_interval = 0.005
+
+    def start(self):
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2):
+        """Ask the loop to cancel all readers and wait for it to finish."""
+        if self.loop and self.stopping:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.thread:
+            self.thread.join(timeout)
+
+    def call(self, callback, *args):
+        """Run callback on the loop thread, in order with the packet handler (directly before start)."""
+        if self.loop:
+            self.loop.call_soon_threadsafe(callback, *args)
+        else:
+            callback(*args)
+
+    def subscribe_merged(self, callback):
+        """Receive a time-aligned {sensor_name: Sample} dict every merge_interval seconds."""
+        self.merge_handlers.append(callback)
+
+    def snapshot(self, at=None):
+        """Latest sample of every sensor that is not newer than `at` (default: now), sample-and-hold."""
+        at = time.time() if at is None else at
+        return {name: channel.latest_sample for name, channel in self.channels.items()
+                if channel.latest_sample.seq and channel.latest_sample.timestamp <= at}
+
+    def stats(self):
+        return {name: channel.stats() for name, channel in self.channels.items()}
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        tasks = [asyncio.create_task(self.read_sensor(channel)) for channel in self.channels.values()]
+        tasks.append(asyncio.create_task(self.merge()))
+        await self.stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def read_sensor(self, channel):
+        """Keep one sensor connected and feed everything it sends through its framer."""
+        import serial
+
+        while True:
+            try:
+                channel.port = serial.Serial(channel.device, self.baud_rate, timeout=0)
+                channel.connects += 1
+                if self.use_fd_readers:
+                    await self.read_with_fd_reader(channel)
+                else:
+                    await self.read_with_polling(channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                channel.errors += 1
+                print(f"Sensor {channel.name} ({channel.device}) error: {e}")
+            finally:
+                if channel.port:
+                    channel.port.close()
+                    channel.port = None
+            await asyncio.sleep(1)  # Back off before reconnecting
+
+    async def read_with_fd_reader(self, channel):
+        """Wait for the port's file descriptor to become readable, then drain it."""
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fd = channel.port.fileno()
+        loop.add_reader(fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                self.consume(channel, channel.port.read(max(1, channel.port.in_waiting)))
+        finally:
+            loop.remove_reader(fd)
+
+    async def read_with_polling(self, channel):
+        """Non-blocking reads with a short sleep between empty polls, all on the loop thread."""
+        while True:
+            data = channel.port.read(channel.port.in_waiting or 1)
+            if data:
+                self.consume(channel, data)
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    def consume(self, channel, data):
+        """Frame and decode a chunk of bytes from one sensor."""
+        channel.bytes_read += len(data)
+        for packet, checksum_ok in channel.framer.feed(data):
+            start = time.perf_counter()
+            roll, pitch = self.layout.angles(packet)
+            if self.parse_time:
+                self.parse_time.observe(time.perf_counter() - start)
+            channel.latest_packet = bytes(packet)
+            sample = Sample(channel.latest_sample.seq + 1, time.time(), roll, pitch, channel.name)
+            channel.latest_sample = sample
+            if self.handler:
+                self.handler(channel.name, packet, checksum_ok, sample)
+
+    async def merge(self):
+        """Publish time-aligned snapshots on a fixed cadence."""
+        while True:
+            await asyncio.sleep(self.merge_interval)
+            if self.merge_handlers:
+                merged = self.snapshot()
+                for callback in self.merge_handlers:
+                    try:
+                        callback(merged)
+                    except Exception as e:
+                        print(f"Merged sample handler error: {e}")
+
+def encode_wire_sample(sample):
+    """Encode a Sample as one broadcast message."""
+    payload = WIRE_SAMPLE.pack(sample.seq & 0xFFFFFFFF, sample.timestamp, sample.roll, sample.pitch)
+    if sample.sensor:
+        payload += sample.sensor.encode()
+    return WIRE_HEADER.pack(WIRE_MAGIC, WIRE_KIND_SAMPLE, len(payload)) + payload
+
+def decode_wire_messages(buffer):
+    """Split received bytes into (kind, payload) messages. Returns (messages, unconsumed bytes)."""
+    messages = []
+    offset = 0
+    while len(buffer) - offset >= WIRE_HEADER.size:
+        magic, kind, length = WIRE_HEADER.unpack_from(buffer, offset)
+        if magic != WIRE_MAGIC:
+            raise ValueError("Broadcast stream out of sync")
+        end = offset + WIRE_HEADER.size + length
+        if end > len(buffer):
+            break
+        messages.append((kind, bytes(buffer[offset + WIRE_HEADER.size:end])))
+        offset = end
+    return messages, bytes(buffer[offset:])
+
+def decode_wire_sample(payload):
+    """Turn a WIRE_KIND_SAMPLE payload back into a Sample."""
+    seq, timestamp, roll, pitch = WIRE_SAMPLE.unpack_from(payload)
+    sensor = payload[WIRE_SAMPLE.size:].decode() or None
+    return Sample(seq, timestamp, round(roll, 1), round(pitch, 1), sensor)
+
+def encode_wire_alarm(event):
+    """Encode an AlarmEvent as one broadcast message."""
+    payload = WIRE_ALARM.pack(event.timestamp, event.state == "raised", event.value)
+    payload += f"{event.rule}\0{event.sensor or ''}".encode()
+    return WIRE_HEADER.pack(WIRE_MAGIC, WIRE_KIND_ALARM, len(payload)) + payload
+
+def decode_wire_alarm(payload):
+    """Turn a WIRE_KIND_ALARM payload back into an AlarmEvent."""
+    timestamp, raised, value = WIRE_ALARM.unpack_from(payload)
+    rule, _, sensor = payload[WIRE_ALARM.size:].decode().partition("\0")
+    return AlarmEvent(timestamp, rule, "raised" if raised else "cleared", value, sensor or None)
+
+class Subscriber:
+    """One connected stream client with its own bounded backlog of messages."""
+
+    def __init__(self, sock, backlog):
+        self.sock = sock
+        self.queue = deque(maxlen=backlog)  # (messages, count); the oldest fall off when the client lags
+        self.current = None  # memoryview of the batch being sent, always finished to keep framing
+        self.dropped = 0
+
+    def enqueue(self, batch, count):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += self.queue[0][1]
+        self.queue.append((batch, count))
+
+class SampleBroadcaster:
+    """Fan live samples out to local consumers over TCP, UDP and Unix domain sockets.
+
+    publish() only appends to an outbox and wakes the server thread, so the reader never blocks on
+    a client. The server thread copies each message into every subscriber's bounded queue and sends
+    with non-blocking sockets; a slow client loses its oldest queued samples instead of stalling
+    anyone else. UDP clients subscribe by sending any datagram to the UDP port and must repeat it
+    within udp_timeout seconds to stay subscribed.
+    """
+
+    def __init__(self, endpoints, backlog=16, udp_timeout=30.0):
+        self.endpoints = endpoints  # [("tcp", host, port), ("udp", host, port), ("unix", path)]
+        self.backlog = backlog
+        self.udp_timeout = udp_timeout
+        self.selector = selectors.DefaultSelector()
+        self.listeners = []
+        self.subscribers = {}  # socket -> Subscriber
+        self.udp_sockets = []
+        self.udp_subscribers = {}  # (socket, address) -> last subscribe time
+        self.lock = threading.Lock()  # Guards changes to both subscriber dicts against stats() readers
+        self.outbox = deque()
+        self.published = 0
+        self.udp_dropped = 0
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        for endpoint in self.endpoints:
+            self.listen(endpoint)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ, "wake")
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def listen(self, endpoint):
+        kind = endpoint[0]
+        if kind == "unix":
+            path = endpoint[1]
+            if os.path.exists(path):
+                os.remove(path)  # Stale socket from a previous run
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(path)
+        else:
+            host, port = endpoint[1], endpoint[2]
+            family = socket.AF_INET6 if ":" in host else socket.AF_INET
+            sock_type = socket.SOCK_DGRAM if kind == "udp" else socket.SOCK_STREAM
+            sock = socket.socket(family, sock_type)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+        sock.setblocking(False)
+        if kind == "udp":
+            self.udp_sockets.append(sock)
+            self.selector.register(sock, selectors.EVENT_READ, "udp")
+        else:
+            sock.listen(128)
+            self.selector.register(sock, selectors.EVENT_READ, "listen")
+        self.listeners.append(sock)
+
+    def address(self, index=0):
+        """Bound address of a listener, e.g. to find the port chosen for port 0."""
+        return self.listeners[index].getsockname()
+
+    def publish(self, sample):
+        """Queue a sample for every subscriber. Safe to call from any thread and never blocks."""
+        self.publish_message(encode_wire_sample(sample))
+
+    def publish_message(self, message):
+        self.outbox.append(message)
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wake_writer.send(b"\0")
+        except OSError:
+            pass  # Wake-up already pending
+
+    def serve(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=1.0):
+                try:
+                    self.handle_event(key, events)
+                except OSError as e:
+                    if key.data not in ("listen", "udp", "wake"):
+                        self.drop(key.fileobj)
+                    else:
+                        print(f"Broadcast server error: {e}")
+            self.distribute()
+
+    def handle_event(self, key, events):
+        if key.data == "wake":
+            try:
+                while self.wake_reader.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+        elif key.data == "listen":
+            client, _ = key.fileobj.accept()
+            client.setblocking(False)
+            if client.family != socket.AF_UNIX:
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self.lock:
+                self.subscribers[client] = Subscriber(client, self.backlog)
+            self.selector.register(client, selectors.EVENT_READ)
+        elif key.data == "udp":
+            while True:
+                try:
+                    _, address = key.fileobj.recvfrom(512)
+                except BlockingIOError:
+                    break
+                with self.lock:
+                    self.udp_subscribers[(key.fileobj, address)] = time.monotonic()
+        else:
+            if events & selectors.EVENT_READ:
+                # Subscribers don't send anything; readable means data to ignore or a disconnect
+                if not key.fileobj.recv(4096):
+                    self.drop(key.fileobj)
+                    return
+            if events & selectors.EVENT_WRITE:
+                self.flush(self.subscribers[key.fileobj])
+
+    def distribute(self):
+        """Move published messages into every subscriber's queue and send what fits."""
+        if not self.outbox:
+            return
+        messages = []
+        while self.outbox:
+            messages.append(self.outbox.popleft())
+        self.published += len(messages)
+        # Stream clients get everything published since the last pass in one send
+        batch = b"".join(messages)
+
+        now = time.monotonic()
+        for (sock, address), seen in list(self.udp_subscribers.items()):
+            if now - seen > self.udp_timeout:
+                with self.lock:
+                    del self.udp_subscribers[(sock, address)]
+                continue
+            for message in messages:
+                try:
+                    sock.sendto(message, address)
+                except OSError:
+                    self.udp_dropped += 1  # Full socket buffer or unreachable client: skip, never wait
+
+        for subscriber in list(self.subscribers.values()):
+            subscriber.enqueue(batch, len(messages))
+            self.flush(subscriber)
+
+    def flush(self, subscriber):
+        """Send queued messages until the socket would block; wait for EVENT_WRITE if data remains."""
+        if not self.send_pending(subscriber):
+            return
+        events = selectors.EVENT_READ
+        if subscriber.current is not None or subscriber.queue:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(subscriber.sock, events)
+
+    def send_pending(self, subscriber):
+        """Write as much of the queue as the socket accepts. Returns False if the client was dropped."""
+        try:
+            while True:
+                if subscriber.current is None:
+                    if not subscriber.queue:
+                        break
+                    subscriber.current = memoryview(subscriber.queue.popleft()[0])
+                sent = subscriber.sock.send(subscriber.current)
+                subscriber.current = subscriber.current[sent:] if sent < len(subscriber.current) else None
+                if subscriber.current is not None:
+                    break
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(subscriber.sock)
+            return False
+        return True
+
+    def drop(self, sock):
+        with self.lock:
+            self.subscribers.pop(sock, None)
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+        sock.close()
+
+    def stats(self):
+        """Counters for the metrics endpoint; called from other threads, so the dicts are copied under the lock."""
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+            udp_subscribers = len(self.udp_subscribers)
+        return {
+            "published": self.published,
+            "stream_subscribers": len(subscribers),
+            "udp_subscribers": udp_subscribers,
+            "dropped": sum(s.dropped for s in subscribers) + self.udp_dropped,
+        }
+
+    def stop(self):
+        self.running = False
+        self.wake()
+        if self.thread:
+            self.thread.join(2)
+        for sock in list(self.subscribers):
+            self.drop(sock)
+        for sock in self.listeners:
+            if sock.family == getattr(socket, "AF_UNIX", None):
+                try:
+                    os.remove(sock.getsockname())
+                except OSError:
+                    pass
+            sock.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+def parse_endpoint(spec):
+    """Parse "tcp:HOST:PORT", "udp:HOST:PORT" or "unix:PATH" into a SampleBroadcaster endpoint."""
+    kind, _, rest = spec.partition(":")
+    if kind == "unix" and rest:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix domain sockets are not supported on this platform")
+        return ("unix", rest)
+    if kind in ("tcp", "udp"):
+        host, _, port = rest.rpartition(":")
+        if host and port.isdigit():
+            return (kind, host.strip("[]"), int(port))
+    raise ValueError(f"Invalid endpoint {spec!r}, expected tcp:HOST:PORT, udp:HOST:PORT or unix:PATH")
+
+ProbeResult = namedtuple("ProbeResult", "device hwid description baud_rate input_mode packets packets_per_sec")
+
+def probe_port(device, baud_rates, window=PROBE_WINDOW, min_packets=PROBE_MIN_PACKETS, stop_early=False):
+    """Listen on one port at each baud rate in turn for packets with a good checksum.
+
+    Both framers see the same bytes, so the input mode is detected too. Returns
+    (baud_rate, input_mode, packets, packets_per_sec) for the first rate that works, or None.
+    With stop_early the listening ends as soon as min_packets arrived.
+    """
+    import serial
+
+    for baud_rate in baud_rates:
+        framers = {"binary": PacketFramer(), "hex": HexLineFramer()}
+        valid = dict.fromkeys(framers, 0)
+        received = 0
+        try:
+            port = serial.Serial()
+            port.port = device
+            port.baudrate = baud_rate
+            port.timeout = 0.1
+            port.dtr = False  # Don't reset Arduino style boards by opening the port
+            port.rts = False
+            port.open()
+        except Exception:
+            return None  # Busy, gone or not a serial device
+        start = time.monotonic()
+        try:
+            while time.monotonic() - start < window:
+                data = port.read(max(1, port.in_waiting))
+                received += len(data)
+                for mode, framer in framers.items():
+                    for _, checksum_ok in framer.feed(data):
+                        valid[mode] += checksum_ok
+                if stop_early and max(valid.values()) >= min_packets:
+                    break
+        except Exception:
+            return None
+        finally:
+            port.close()
+        if not received:
+            return None  # A wrong baud rate still produces garbage bytes; silence means no sensor
+        input_mode = max(valid, key=valid.get)
+        if valid[input_mode] >= min_packets:
+            elapsed = max(time.monotonic() - start, 1e-9)
+            return baud_rate, input_mode, valid[input_mode], valid[input_mode] / elapsed
+    return None
+
+def detect_ports(baud_rates=PROBE_BAUD_RATES, window=PROBE_WINDOW):
+    """Probe every serial port at once and return ProbeResults ranked by valid packet rate."""
+    import serial.tools.list_ports
+    from concurrent.futures import ThreadPoolExecutor
+
+    ports = serial.tools.list_ports.comports()
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        probes = list(pool.map(lambda port: probe_port(port.device, baud_rates, window), ports))
+    results = [ProbeResult(port.device, port.hwid, port.description, *probe)
+               for port, probe in zip(ports, probes) if probe]
+    return sorted(results, key=lambda result: result.packets_per_sec, reverse=True)
+
+def load_cached_port():
+    try:
+        with open(os.path.join(CACHE_DIR, "port.json")) as f:
+            return ProbeResult(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+def save_cached_port(result):
+    """Remember the detected port so the next launch can skip the full probe."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, "port.json"), "w") as f:
+            json.dump(result._asdict(), f)
+    except OSError as e:
+        print(f"Could not cache serial port: {e}")
+
+def find_cached_port():
+    """The last detected port if it still sends valid packets, following its hwid if it was renamed."""
+    cached = load_cached_port()
+    if cached is None:
+        return None
+    import serial.tools.list_ports
+
+    ports = {port.device: port for port in serial.tools.list_ports.comports()}
+    port = ports.get(cached.device)
+    if port is None or port.hwid != cached.hwid:
+        port = next((p for p in ports.values() if p.hwid == cached.hwid), None)
+    if port is None:
+        return None
+    probe = probe_port(port.device, (cached.baud_rate,), stop_early=True)
+    return ProbeResult(port.device, port.hwid, port.description, *probe) if probe else None
+
+def auto_detect_port(baud_rate=9600, use_cache=True):
+    """Ranked ProbeResults: just the cached port if it still answers, otherwise every port that does."""
+    if use_cache:
+        cached = find_cached_port()
+        if cached:
+            return [cached]
+    return detect_ports((baud_rate,) + tuple(rate for rate in PROBE_BAUD_RATES if rate != baud_rate))
+
+class PortSelector:
+    def __init__(self, parent, probe_results=None):
+        import_gui()
+        self.dialog = ctk.CTkToplevel(parent)
+        self.dialog.title("Select Serial Port")
+        self.dialog.geometry("800x400")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()  # Make the dialog modal
+        
+        # Center the dialog
+        self.dialog.update_idletasks()
+        width = self.dialog.winfo_width()
+        height = self.dialog.winfo_height()
+        x = (self.dialog.winfo_screenwidth() // 2) - (width // 2)
+        y = (self.dialog.winfo_screenheight() // 2) - (height // 2)
+        self.dialog.geometry(f'+{x}+{y}')
+        
+        # Create main frame
+        main_frame = ctk.CTkFrame(self.dialog, fg_color="transparent")
+        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        
+        # Add refresh and auto-detect buttons
+        top_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        top_frame.pack(pady=(0, 10))
+        refresh_btn = ctk.CTkButton(top_frame, text="Refresh Ports", command=self.refresh_ports)
+        refresh_btn.pack(side="left", padx=5)
+        self.detect_btn = ctk.CTkButton(top_frame, text="Auto-detect", command=self.start_detection)
+        self.detect_btn.pack(side="left", padx=5)
+        
+        # Create a custom table using CTkFrames and CTkLabels
+        self.table_frame = ctk.CTkScrollableFrame(main_frame, fg_color="transparent")
+        self.table_frame.pack(fill="both", expand=True)
+        
+        # Define columns
+        self.columns = ('Port', 'Description', 'Hardware ID', 'Packets/s')
+        self.rows = []  # To store rows dynamically
+        self.selected_row = None  # Track the currently selected row
+
+        # Ports found sending valid packets, best first
+        self.probe_results = probe_results or []
+        self.detection = None  # Background detect_ports() result while Auto-detect runs
+        
+        # Buttons frame
+        btn_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        btn_frame.pack(fill="x", pady=(10, 0))
+        
+        # Add buttons
+        ctk.CTkButton(btn_frame, text="Connect", command=self.on_connect).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Cancel", command=self.on_cancel).pack(side="left")
+        
+        self.selected_port = None
+        self.refresh_ports()
+    
+    def refresh_ports(self):
+        """Scan and refresh the list of available ports"""
+        # Clear all existing widgets in the table_frame
+        for widget in self.table_frame.winfo_children():
+            widget.destroy()
+        
+        # Clear the rows list
+        self.rows.clear()
+
+        # Get available ports, the ones detected as inclinometers first
+        import serial.tools.list_ports
+        ports = serial.tools.list_ports.comports()
+        rates = {result.device: result.packets_per_sec for result in self.probe_results}
+        ports.sort(key=lambda port: -rates.get(port.device, -1))
+        self.selected_row = None
+        self.selected_port = None
+
+        # Add header row
+        header_frame = ctk.CTkFrame(self.table_frame, fg_color="gray20")
+        header_frame.pack(fill="x", pady=(0, 5))
+        for i, col in enumerate(self.columns):
+            header_label = ctk.CTkLabel(header_frame, text=col, font=("Helvetica", 12, "bold"), anchor="w",
+                                        width=150 if i in (0, 3) else 300)
+            header_label.grid(row=0, column=i, padx=5, sticky="w")
+
+        # Add port rows
+        for port in ports:
+            row_frame = ctk.CTkFrame(self.table_frame, fg_color="transparent")
+            row_frame.pack(fill="x", pady=(0, 5))
+
+            # Add columns for each row
+            ctk.CTkLabel(row_frame, text=port.device, anchor="w", width=150).grid(row=0, column=0, padx=5, sticky="w")
+            ctk.CTkLabel(row_frame, text=port.description, anchor="w", width=300).grid(row=0, column=1, padx=5, sticky="w")
+            ctk.CTkLabel(row_frame, text=port.hwid, anchor="w", width=300).grid(row=0, column=2, padx=5, sticky="w")
+            rate = f"{rates[port.device]:.1f}" if port.device in rates else ""
+            ctk.CTkLabel(row_frame, text=rate, anchor="w", width=150).grid(row=0, column=3, padx=5, sticky="w")
+
+            # Store the row frame and bind click event
+            row_frame.bind("<Button-1>", lambda event, r=row_frame, p=port.device: self.select_row(r, p))
+            for widget in row_frame.winfo_children():
+                widget.bind("<Button-1>", lambda event, r=row_frame, p=port.device: self.select_row(r, p))
+
+            self.rows.append(row_frame)
+            if port.device in rates and self.selected_port is None:
+                self.select_row(row_frame, port.device)  # Preselect the best match
+
+    def start_detection(self):
+        """Probe all ports in the background and rank them when done."""
+        self.detect_btn.configure(state="disabled", text="Detecting...")
+        self.detection = None
+
+        def detect():
+            self.detection = detect_ports()
+
+        threading.Thread(target=detect, daemon=True).start()
+        self.dialog.after(100, self.finish_detection)
+
+    def finish_detection(self):
+        if self.detection is None:
+            self.dialog.after(100, self.finish_detection)
+            return
+        self.probe_results = self.detection
+        self.detect_btn.configure(state="normal", text="Auto-detect")
+        self.refresh_ports()
+        if not self.probe_results:
+            CTkMessagebox(title="Auto-detect", message="No port is sending inclinometer packets.", icon="warning")
+    
+    def select_row(self, row, port):
+        """Handle row selection"""
+        if self.selected_row:
+            self.selected_row.configure(fg_color="transparent")  # Deselect previous row
+        self.selected_row = row
+        self.selected_port = port
+        row.configure(fg_color="#0060AA")  # Highlight selected row
+    
+    def on_connect(self):
+        """Handle port selection"""
+        if not self.selected_port:
+            CTkMessagebox(title="Warning", message="Please select a port first!", icon="warning")
+            return
+        
+        self.dialog.destroy()
+    
+    def on_cancel(self):
+        """Handle dialog cancellation"""
+        self.selected_port = None
+        self.dialog.destroy()
+
+class AssetPyramid:
+    """An image and its precomputed half-size levels.
+
+    Any target size is produced from the smallest level that is still at least as large with a single
+    bilinear resample, instead of a LANCZOS pass over the full-size original (or over an earlier,
+    already shrunk copy).
+    """
+
+    def __init__(self, image, min_size=32):
+        image.load()
+        self.levels = [image]
+        while min(self.levels[-1].size) // 2 >= min_size:
+            previous = self.levels[-1]
+            self.levels.append(previous.resize((previous.width // 2, previous.height // 2),
+                                               Image.Resampling.LANCZOS))
+
+    @classmethod
+    def from_levels(cls, levels):
+        """Wrap already computed levels, largest first (used by AssetAtlas)."""
+        pyramid = cls.__new__(cls)
+        pyramid.levels = levels
+        return pyramid
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def get(self, size):
+        """Return the asset resampled to size (width, height)."""
+        width, height = max(int(size[0]), 1), max(int(size[1]), 1)
+        level = self.levels[0]
+        for candidate in self.levels:
+            if candidate.width >= width and candidate.height >= height:
+                level = candidate
+            else:
+                break
+        if level.size == (width, height):
+            return level.copy()
+        return level.resize((width, height), Image.Resampling.BILINEAR)
+
+class AssetAtlas:
+    """Uncompressed copy of every AssetPyramid level in one memory-mapped cache file.
+
+    Loading maps the file and wraps each level with Image.frombuffer, so startup skips PNG decoding
+    and pyramid building. The header records each source file's size and mtime; any change makes
+    the atlas stale and it is rebuilt from the PNGs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mapping = None
+
+    @staticmethod
+    def source_key(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def load(self, paths):
+        """Return {path: AssetPyramid} backed by the atlas, or None if it is missing or stale."""
+        try:
+            with open(self.path, "rb") as f:
+                header_size, = struct.unpack("<I", f.read(4))
+                header = json.loads(f.read(header_size))
+                if header.get("sources") != {path: self.source_key(path) for path in paths}:
+                    return None
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, struct.error):
+            return None
+
+        view = memoryview(self.mapping)[4 + header_size:]
+        pyramids = {}
+        for path, levels in header["levels"].items():
+            images = [Image.frombuffer("RGBA", (width, height), view[offset:offset + width * height * 4],
+                                       "raw", "RGBA", 0, 1)
+                      for width, height, offset in levels]
+            pyramids[path] = AssetPyramid.from_levels(images)
+        return pyramids
+
+    def save(self, pyramids):
+        """Write all pyramid levels as raw RGBA, replacing the atlas atomically."""
+        levels = {}
+        blobs = []
+        offset = 0  # Relative to the end of the header
+        for path, pyramid in pyramids.items():
+            levels[path] = []
+            for image in pyramid.levels:
+                data = image.convert("RGBA").tobytes()
+                levels[path].append([image.width, image.height, offset])
+                blobs.append(data)
+                offset += len(data)
+        header = json.dumps({"sources": {path: self.source_key(path) for path in pyramids},
+                             "levels": levels}).encode()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(temporary, self.path)
+
+class SpriteCache:
+    """LRU cache of resized and rotated layer sprites keyed by (layer, size, angle)."""
+
+    def __init__(self, max_bytes=SPRITE_CACHE_MAX_BYTES, angle_step=0.1, prefetch_span=10, metrics=None):
+        self.max_bytes = max_bytes
+        self.angle_step = angle_step
+        self.prefetch_span = prefetch_span  # Neighbouring steps rendered in the background
+
+        self.sources = {}  # layer -> AssetPyramid of the original image
+        self.bases = {}  # (layer, size) -> resized, unrotated PIL image
+        self.entries = OrderedDict()  # (layer, size, step) -> [PIL image, PhotoImage or None, bytes]
+        self.current_bytes = 0
+        self.generation = 0  # Bumped by invalidate() so stale background renders are dropped
+        self.hits = 0
+        self.misses = 0
+
+        # Tk-thread costs of a miss, part of the frame time split
+        self.rotate_time = metrics.histogram("frame_rotate_seconds") if metrics else None
+        self.photoimage_time = metrics.histogram("frame_photoimage_seconds") if metrics else None
+
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.prefetch_queue = queue.Queue()
+        self.prefetch_thread = threading.Thread(target=self.prefetch_worker, daemon=True)
+        self.prefetch_thread.start()
+
+    def register(self, layer, pyramid):
+        """Register the source AssetPyramid for a layer (e.g. "ship1.png")."""
+        with self.lock:
+            self.sources[layer] = pyramid
+
+    def quantize(self, angle):
+        """Map an angle onto the cache's integer step grid."""
+        return int(round(angle / self.angle_step))
+
+    def render(self, layer, size, step):
+        """Resize (once per size) and rotate a layer sprite. Safe to call off the Tk thread."""
+        with self.lock:
+            base = self.bases.get((layer, size))
+            source = self.sources[layer]
+        if base is None:
+            base = source.get(size)
+            with self.lock:
+                self.bases[(layer, size)] = base
+        return base.rotate(-step * self.angle_step, resample=Image.BILINEAR, expand=False)
+
+    def store(self, key, sprite, generation):
+        """Insert a rendered sprite and evict least recently used entries over the cap."""
+        with self.lock:
+            if generation != self.generation:
+                return None  # Cache was invalidated while rendering
+            if key in self.entries:
+                return self.entries[key]
+            entry = [sprite, None, sprite.width * sprite.height * 4]
+            self.entries[key] = entry
+            self.current_bytes += entry[2]
+            self.evict()
+            return entry
+
+    def evict(self):
+        """Drop least recently used sprites until the cache fits. Caller holds the lock."""
+        while self.current_bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.current_bytes -= entry[2]
+
+    def lookup(self, layer, size, angle):
+        """PhotoImage for the layer at the given size and angle, or None if it isn't rendered yet.
+
+        Never renders: misses are left to fill() on the compositor. Tk thread only.
+        """
+        key = (layer, size, self.quantize(angle))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        if entry[1] is None:
+            # PhotoImage has to be created on the Tk thread
+            start = time.perf_counter()
+            entry[1] = ImageTk.PhotoImage(entry[0])
+            if self.photoimage_time:
+                self.photoimage_time.observe(time.perf_counter() - start)
+            with self.lock:
+                if self.entries.get(key) is entry:
+                    self.current_bytes += entry[2]  # Account for the Tk-side copy
+                    entry[2] *= 2
+                    self.evict()
+        return entry[1]
+
+    def image(self, layer, size, angle):
+        """PIL sprite for the layer at the given size and angle, rendered on a miss. Any thread."""
+        key = (layer, size, self.quantize(angle))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        sprite = self.render(*key)
+        self.store(key, sprite, self.generation)
+        return sprite
+
+    def fill(self, layers, size, angle, generation):
+        """Render whichever of the layers' sprites for this size and angle are missing. Any thread."""
+        for layer in layers:
+            key = (layer, size, self.quantize(angle))
+            with self.lock:
+                if key in self.entries:
+                    continue
+            start = time.perf_counter()
+            sprite = self.render(*key)
+            if self.rotate_time:
+                self.rotate_time.observe(time.perf_counter() - start)
+            self.store(key, sprite, generation)
+        return size, angle
+
+    def prefetch(self, layer, size, angle):
+        """Queue background rendering of the angles around the current one."""
+        center = self.quantize(angle)
+        for offset in range(1, self.prefetch_span + 1):
+            for step in (center + offset, center - offset):
+                key = (layer, size, step)
+                with self.lock:
+                    if key in self.entries or key in self.pending:
+                        continue
+                    self.pending.add(key)
+                    generation = self.generation
+                self.prefetch_queue.put((key, generation))
+
+    def prefetch_worker(self):
+        """Render queued sprites in the background so the Tk thread only does lookups."""
+        while True:
+            key, generation = self.prefetch_queue.get()
+            try:
+                if generation == self.generation:
+                    self.store(key, self.render(*key), generation)
+            except Exception as e:
+                print(f"Sprite prefetch error: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.current_bytes}
+
+    def invalidate(self, keep_size=None):
+        """Drop every sprite whose canvas size differs from keep_size (all if None)."""
+        with self.lock:
+            self.generation += 1
+            for key in [k for k in self.entries if k[1] != keep_size]:
+                self.current_bytes -= self.entries.pop(key)[2]
+            for key in [k for k in self.bases if k[1] != keep_size]:
+                del self.bases[key]
+
+# Neighbour offsets in clockwise screen order (y grows downwards), starting west
+MOORE_DIRECTIONS = ((-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1))
+
+def trace_boundary(labels, width, height, label, start):
+    """Moore-neighbour trace of the outer boundary of one labelled region from its top-left pixel."""
+    x, y = start
+    backtrack = 0  # The west neighbour of the top-left pixel is always outside
+    points = []
+    seen = {}
+    while (x, y, backtrack) not in seen:
+        seen[(x, y, backtrack)] = len(points)
+        points.append((x, y))
+        for i in range(1, 9):
+            k = (backtrack + i) % 8
+            dx, dy = MOORE_DIRECTIONS[k]
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and labels[ny * width + nx] == label:
+                break
+        else:
+            return points  # Isolated pixel
+        # The neighbour scanned just before the hit is the new backtrack, seen from the new pixel
+        px, py = MOORE_DIRECTIONS[(k - 1) % 8]
+        backtrack = MOORE_DIRECTIONS.index((px - dx, py - dy))
+        x, y = nx, ny
+    return points[seen[(x, y, backtrack)]:]
+
+def simplify_polygon(points, tolerance):
+    """Ramer-Douglas-Peucker simplification of a closed polygon."""
+    if len(points) < 4:
+        return points
+    # Split the ring at the point farthest from the first one and simplify both halves as polylines
+    first = points[0]
+    split = max(range(len(points)), key=lambda i: (points[i][0] - first[0]) ** 2 + (points[i][1] - first[1]) ** 2)
+    ring = points + [first]
+    keep = {0, split, len(ring) - 1}
+    stack = [(0, split), (split, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        (x1, y1), (x2, y2) = ring[start], ring[end]
+        length = math.hypot(x2 - x1, y2 - y1)
+        farthest, distance = None, tolerance
+        for i in range(start + 1, end):
+            x, y = ring[i]
+            if length:
+                d = abs((x2 - x1) * (y1 - y) - (x1 - x) * (y2 - y1)) / length
+            else:
+                d = math.hypot(x - x1, y - y1)
+            if d > distance:
+                farthest, distance = i, d
+        if farthest is not None:
+            keep.add(farthest)
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    return [ring[i] for i in sorted(keep)[:-1]]
+
+def label_regions(width, height, key):
+    """Label 8-connected regions of pixels with equal key(pixel); key None means background.
+
+    Returns the label array and [(area, label, key, top-left pixel)].
+    """
+    labels = array("i", [0]) * (width * height)
+    regions = []
+    for start in range(width * height):
+        if labels[start]:
+            continue
+        value = key(start)
+        if value is None:
+            continue
+        label = len(regions) + 1
+        labels[start] = label
+        stack = [start]
+        area = 0
+        while stack:
+            pixel = stack.pop()
+            area += 1
+            x, y = pixel % width, pixel // width
+            for dx, dy in MOORE_DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    neighbour = ny * width + nx
+                    if not labels[neighbour] and key(neighbour) == value:
+                        labels[neighbour] = label
+                        stack.append(neighbour)
+        regions.append((area, label, value, (start % width, start // width)))
+    return labels, regions
+
+def trace_shapes(image, max_size=256, colors=6, alpha_threshold=128, min_area=12, tolerance=1.0):
+    """Trace an RGBA image into filled polygons for the vector backend.
+
+    The silhouette of the opaque pixels is traced first and filled with their average colour, then
+    every large enough region of one palette colour is traced on top of it. Returns
+    [(fill "#rrggbb", [(u, v), ...])] in drawing order, with vertices as fractions of the image size
+    relative to its centre so they can be scaled to any canvas.
+    """
+    image = image.convert("RGBA")
+    scale = min(1.0, max_size / max(image.size))
+    width, height = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+    small = image.resize((width, height), Image.Resampling.BILINEAR)
+    alpha = small.getchannel("A").tobytes()
+    rgb = small.convert("RGB")
+    opaque = [pixel for pixel, a in zip(rgb.getdata(), alpha) if a >= alpha_threshold]
+    if not opaque:
+        return []
+
+    # Palette from the opaque pixels only, so transparent areas don't pull the colours towards black
+    sample = Image.new("RGB", (len(opaque), 1))
+    sample.putdata(opaque)
+    reference = sample.quantize(colors)
+    indices = rgb.quantize(palette=reference, dither=Image.Dither.NONE).tobytes()
+    palette = reference.getpalette()
+    average = tuple(sum(channel) // len(opaque) for channel in zip(*opaque))
+
+    layers = [(label_regions(width, height, lambda p: 0 if alpha[p] >= alpha_threshold else None), None),
+              (label_regions(width, height, lambda p: indices[p] if alpha[p] >= alpha_threshold else None), palette)]
+    shapes = []
+    for (labels, regions), colours in layers:
+        for area, label, index, start in sorted(regions, reverse=True):
+            if area < min_area:
+                continue
+            outline = simplify_polygon(trace_boundary(labels, width, height, label, start), tolerance)
+            if len(outline) < 3:
+                continue
+            red, green, blue = colours[index * 3:index * 3 + 3] if colours else average
+            shapes.append((f"#{red:02x}{green:02x}{blue:02x}",
+                           [((x + 0.5) / width - 0.5, (y + 0.5) / height - 0.5) for x, y in outline]))
+    return shapes
+
+def place_shapes(shapes, size, center, angle):
+    """Canvas coordinates of traced shapes scaled to size and rotated clockwise by angle degrees about center."""
+    width, height = size
+    cx, cy = center
+    theta = math.radians(angle)
+    cos, sin = math.cos(theta), math.sin(theta)
+    placed = []
+    for _, outline in shapes:
+        coords = []
+        for u, v in outline:
+            x, y = u * width, v * height
+            coords.append(cx + x * cos - y * sin)
+            coords.append(cy + x * sin + y * cos)
+        placed.append(coords)
+    return placed
+
+class FrameCompositor:
+    """Run rendering jobs on a thread pool, keeping only the newest request and result per slot.
+
+    PIL releases the GIL while it resamples and rotates, so jobs for the two displays run in
+    parallel with each other and with the Tk thread. submit() replaces a request for the same slot
+    that hasn't started yet, and a finished result replaces an uncollected one, so stale frames are
+    dropped instead of queued. collect() hands the Tk thread what finished since the last call.
+    """
+
+    def __init__(self, workers=2):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compositor")
+        self.lock = threading.Lock()
+        self.running = set()  # Slots with a job on a worker
+        self.pending = {}  # slot -> (job, args) to run when the slot's current job finishes
+        self.results = {}  # slot -> result not collected yet
+        self.completed = 0
+        self.dropped = 0
+
+    def submit(self, slot, job, *args):
+        with self.lock:
+            if slot in self.running:
+                if slot in self.pending:
+                    self.dropped += 1
+                self.pending[slot] = (job, args)
+                return
+            self.running.add(slot)
+        self.pool.submit(self.run, slot, job, args)
+
+    def run(self, slot, job, args):
+        """Worker side: run the job, then the newest request that arrived meanwhile, if any."""
+        while True:
+            try:
+                result = job(*args)
+            except Exception as e:
+                print(f"Compositor error in {slot}: {e}")
+                result = None
+            with self.lock:
+                if result is not None:
+                    if slot in self.results:
+                        self.dropped += 1
+                    self.results[slot] = result
+                    self.completed += 1
+                queued = self.pending.pop(slot, None)
+                if queued is None:
+                    self.running.discard(slot)
+                    return
+            job, args = queued
+
+    def collect(self):
+        """Results finished since the last call, newest per slot."""
+        with self.lock:
+            results, self.results = self.results, {}
+        return results
+
+    def busy(self):
+        return bool(self.running)
+
+    def stats(self):
+        return {"completed": self.completed, "dropped": self.dropped, "running": len(self.running)}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class FrameScheduler:
+    """Choose the redraw interval from the sensor's packet rate and the measured frame cost.
+
+    The display never redraws faster than the sensor delivers new samples, than MAX_FPS (or
+    LOW_POWER_FPS in low-power mode), or than it can render frames while leaving the Tk loop time for
+    input. A frame that takes longer than the interval skips the ticks it overran instead of
+    queueing them. Times are in seconds except for the *_ms results handed to root.after().
+    """
+
+    RATE_WINDOW = 1.0  # Seconds of samples per sensor rate estimate
+    SMOOTHING = 0.2  # Weight of the newest measurement in the running averages
+    HEADROOM = 1.25  # Frame interval at least this multiple of the average frame cost
+    SENSOR_MARGIN = 0.9  # Poll a bit faster than the sensor so jitter doesn't merge two samples
+
+    def __init__(self, max_fps=MAX_FPS, low_power_fps=LOW_POWER_FPS, low_power=False):
+        self.max_fps = max_fps
+        self.low_power_fps = low_power_fps
+        self.low_power = low_power
+        self.frame_cost = 0.0
+        self.sensor_rate = None  # Samples per second, None until the first window has passed
+        self.rate_seq = None
+        self.rate_time = None
+        self.interval = 1 / max_fps
+        self.overruns = 0
+        self.ticks_skipped = 0
+        self.limit = "display"  # What sets the interval right now: display, sensor or frame cost
+        self.update_interval()
+
+    def observe_sample(self, seq, now):
+        """Track the sensor rate from the reader's sample sequence number."""
+        if self.rate_seq is None or seq < self.rate_seq:
+            self.rate_seq, self.rate_time = seq, now
+            return
+        elapsed = now - self.rate_time
+        if elapsed >= self.RATE_WINDOW:
+            rate = (seq - self.rate_seq) / elapsed
+            self.sensor_rate = rate if self.sensor_rate is None else self.average(self.sensor_rate, rate)
+            self.rate_seq, self.rate_time = seq, now
+            self.update_interval()
+
+    def average(self, current, value):
+        return current + self.SMOOTHING * (value - current)
+
+    def update_interval(self):
+        fps = self.low_power_fps if self.low_power else self.max_fps
+        candidates = [(1 / fps, "display"), (self.frame_cost * self.HEADROOM, "frame cost")]
+        if self.sensor_rate:
+            candidates.append((self.SENSOR_MARGIN / self.sensor_rate, "sensor"))
+        self.interval, self.limit = max(candidates)
+
+    def frame_done(self, cost):
+        """Record a drawn frame's cost and return the delay in ms until the next tick."""
+        self.frame_cost = self.average(self.frame_cost, cost)
+        self.update_interval()
+        if cost <= self.interval:
+            return max(int((self.interval - cost) * 1000), 1)
+        # Overrun: drop the ticks that fell inside the frame and wait for the next free slot
+        self.overruns += 1
+        skipped = int(cost // self.interval)
+        self.ticks_skipped += skipped
+        return max(int(((skipped + 1) * self.interval - cost) * 1000), 1)
+
+    def interval_ms(self):
+        return max(int(self.interval * 1000), 1)
+
+    def idle_interval_ms(self):
+        return max(LOW_POWER_IDLE_INTERVAL_MS if self.low_power else IDLE_INTERVAL_MS, self.interval_ms())
+
+    def set_low_power(self, enabled):
+        self.low_power = enabled
+        self.update_interval()
+
+    def stats(self):
+        return {"target_fps": round(1 / self.interval, 1), "interval_ms": round(self.interval * 1000, 1),
+                "limit": self.limit, "sensor_rate": round(self.sensor_rate or 0, 1),
+                "frame_cost_ms": round(self.frame_cost * 1000, 2), "overruns": self.overruns,
+                "ticks_skipped": self.ticks_skipped, "low_power": int(self.low_power)}
+
+def angle_color(angle):
+    """Determine color based on angle and sign."""
+    if angle > 0:
+        return "#00FF00"  # Green for positive angles
+    elif angle < 0:
+        return "#FF0000"  # Red for negative angles
+    else:
+        return "#FFFFFF"  # White for zero
+
+def format_angle(angle):
+    return f"{abs(angle)}°"  # Sign is shown by the colour
+
+class OffscreenRenderer:
+    """Compose the roll and pitch gauges into one PIL image, without Tk.
+
+    Same layers as the dashboard's canvases (meter, highlighter, ship) and the same angle text
+    and colours, laid out side by side in a fixed-size frame. Rotated sprites come from a
+    SpriteCache, so a sample that was drawn before costs only the paste.
+    """
+
+    GAUGES = (("ROLL", "meter1.png", "ship1.png", "highlighter.png"),
+              ("PITCH", "meter2.png", "ship2.png", "highlighter.png"))
+
+    def __init__(self, asset, size=STREAM_SIZE, sprite_cache=None):
+        from PIL import ImageFont
+
+        self.asset = asset  # path -> AssetPyramid, e.g. ShipTiltDashboard.asset
+        self.size = size
+        self.sprite_cache = sprite_cache or SpriteCache(prefetch_span=0)
+        width, height = size
+        panel_width = width // len(self.GAUGES)
+        self.label_font = ImageFont.load_default(max(10, height // 24))
+        self.angle_font = ImageFont.load_default(max(12, height // 9))
+
+        # Gauge box per panel: the meter's aspect ratio, fitted above the angle text
+        self.panels = []
+        for index, (title, meter, ship, highlighter) in enumerate(self.GAUGES):
+            for layer in (ship, highlighter):
+                self.sprite_cache.register(layer, self.asset(layer))
+            meter_width, meter_height = self.asset(meter).size
+            scale = min(panel_width * 0.9 / meter_width, height * 0.68 / meter_height)
+            gauge_size = (max(int(meter_width * scale), 1), max(int(meter_height * scale), 1))
+            origin = (index * panel_width + (panel_width - gauge_size[0]) // 2, int(height * 0.1))
+            self.panels.append((title, ship, highlighter, gauge_size, origin, index * panel_width + panel_width // 2))
+
+        # Everything that doesn't move, drawn once: titles, meters and the separator
+        self.background = Image.new("RGB", size, "black")
+        from PIL import ImageDraw
+
+        draw = ImageDraw.Draw(self.background)
+        for index, (title, meter, _, _) in enumerate(self.GAUGES):
+            _, _, _, gauge_size, origin, centre = self.panels[index]
+            draw.text((centre, int(height * 0.05)), title, fill="#FFFFFF", font=self.label_font, anchor="mm")
+            meter_image = self.asset(meter).get(gauge_size).convert("RGBA")
+            self.background.paste(meter_image, origin, meter_image)
+            if index:
+                draw.line([(index * panel_width, int(height * 0.05)), (index * panel_width, int(height * 0.95))],
+                          fill="#FFFFFF", width=2)
+
+    def render(self, roll, pitch):
+        """One RGB frame showing the given angles."""
+        from PIL import ImageDraw
+
+        frame = self.background.copy()
+        draw = ImageDraw.Draw(frame)
+        height = self.size[1]
+        for (title, ship, highlighter, gauge_size, origin, centre), angle in zip(self.panels, (roll, pitch)):
+            for layer in (highlighter, ship):
+                sprite = self.sprite_cache.image(layer, gauge_size, angle)
+                frame.paste(sprite, origin, sprite)
+            draw.text((centre, origin[1] + gauge_size[1] + int(height * 0.1)), format_angle(angle),
+                      fill=angle_color(angle), font=self.angle_font, anchor="mm")
+        return frame
+
+class FrameCache:
+    """The newest encoded frame, shared by every viewer so N viewers cost one render and one encode.
+
+    JPEG is encoded by the streamer for every new frame; PNG only when someone asks for it, once
+    per frame. Viewers block in wait() until a frame newer than the one they have is published.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.key = None  # What the frame shows, so an unchanged sample isn't rendered again
+        self.image = None
+        self.jpeg = None
+        self.png = None
+        self.viewers = 0  # Open MJPEG streams
+        self.requested = 0.0  # Monotonic time of the last single-frame request
+        self.stale = False  # Requested after a quiet period, the streamer has to confirm the frame
+        self.png_encodes = 0
+
+    def publish(self, key, image, jpeg):
+        with self.condition:
+            self.version += 1
+            self.key = key
+            if image is not self.image:
+                self.png = None
+            self.image = image
+            self.jpeg = jpeg
+            self.stale = False
+            self.condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        """(version, jpeg) of the first frame newer than version, or the current one on timeout."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.version > version, timeout)
+            return self.version, self.jpeg
+
+    def png_bytes(self):
+        with self.condition:
+            version, image, png = self.version, self.image, self.png
+        if png is None and image is not None:
+            output = io.BytesIO()
+            image.save(output, "PNG", compress_level=1)
+            png = output.getvalue()
+            with self.condition:
+                if self.version == version:
+                    self.png = png
+                    self.png_encodes += 1
+        return png
+
+    def wanted(self):
+        """Rendering is only worth it while someone watches or just asked for a frame."""
+        return self.viewers > 0 or time.monotonic() - self.requested < 5
+
+    def request(self):
+        """Note a single-frame request; True if the cached frame may be out of date."""
+        if not self.wanted():
+            self.stale = True
+        self.requested = time.monotonic()
+        return self.stale
+
+class FrameStreamer:
+    """Render and JPEG-encode a frame whenever the sample changes, at most fps times a second.
+
+    source() returns (roll, pitch). Runs on its own thread and does nothing while no one is
+    watching the stream.
+    """
+
+    def __init__(self, source, renderer, cache, fps=STREAM_FPS, quality=STREAM_JPEG_QUALITY, metrics=None):
+        self.source = source
+        self.renderer = renderer
+        self.cache = cache
+        self.interval = 1 / fps
+        self.quality = quality
+        self.frames = 0
+        self.render_time = metrics.histogram("stream_render_seconds") if metrics else None
+        self.encode_time = metrics.histogram("stream_encode_seconds") if metrics else None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                print(f"Stream render error: {e}")
+
+    def update(self):
+        if not self.cache.wanted():
+            return
+        key = self.source()
+        if key == self.cache.key:
+            if self.cache.stale:
+                self.cache.publish(key, self.cache.image, self.cache.jpeg)  # Still current, no render
+            return  # Viewers already have this frame
+        start = time.perf_counter()
+        image = self.renderer.render(*key)
+        encoded = time.perf_counter()
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=self.quality)
+        if self.render_time:
+            self.render_time.observe(encoded - start)
+            self.encode_time.observe(time.perf_counter() - encoded)
+        self.cache.publish(key, image, output.getvalue())
+        self.frames += 1
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        return {"frames": self.frames, "viewers": self.cache.viewers, "png_encodes": self.cache.png_encodes}
+
+class FrameServer:
+    """Serve a FrameCache over HTTP: /stream.mjpg (MJPEG), /frame.jpg, /frame.png and a viewer page."""
+
+    PAGE = (b"<!DOCTYPE html><html><head><title>Ship Tilt</title></head>"
+            b"<body style=\"margin:0;background:#000\"><img src=\"/stream.mjpg\" "
+            b"style=\"width:100vw;height:100vh;object-fit:contain\"></body></html>")
+    BOUNDARY = "frame"
+
+    def __init__(self, cache, host="127.0.0.1", port=8081):
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        cache = self.cache
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/stream.mjpg":
+                    self.stream()
+                    return
+                if path == "/":
+                    body, content_type = server.PAGE, "text/html"
+                elif path in ("/frame.jpg", "/frame.png"):
+                    # After a quiet period the streamer first has to catch up with the current sample
+                    version = cache.version
+                    stale = cache.request()
+                    _, body = cache.wait(version if stale else 0, timeout=0.5)
+                    if path == "/frame.png":
+                        body, content_type = cache.png_bytes(), "image/png"
+                    else:
+                        content_type = "image/jpeg"
+                    if body is None:
+                        self.send_error(503, "No frame rendered yet")
+                        return
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={server.BOUNDARY}")
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                with cache.condition:
+                    cache.viewers += 1
+                version = 0
+                sent = 0.0
+                try:
+                    while server.running:
+                        latest, jpeg = cache.wait(version, timeout=1)
+                        if jpeg is None:
+                            continue
+                        if latest == version and time.monotonic() - sent < STREAM_KEEPALIVE:
+                            continue
+                        version = latest
+                        sent = time.monotonic()
+                        self.wfile.write(f"--{server.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except OSError:
+                    pass  # Viewer went away
+                finally:
+                    with cache.condition:
+                        cache.viewers -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.running = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def address(self):
+        return self.server.server_address
+
+    def stop(self):
+        self.running = False
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+class AcquisitionPipeline:
+    """Everything between the sensors and the screen, without Tk.
+
+    Reads a serial port, a recording (replay_path) or several named sensors (AcquisitionEngine).
+    Every packet of every sensor is recorded, archived and checked against the alarm rules; the
+    displayed sensor's reading is smoothed and published as latest_sample, and data_event is set
+    whenever roll or pitch changes. The dashboard and the headless streamer both drive one of these.
+    """
+
+    def __init__(self, serial_port=None, input_mode="hex", record_path=None, replay_path=None, replay_speed=1.0,
+                 sensors=None, baud_rate=9600, filters=None, serve=None, metrics_address=None,
+                 history_capacity=864000, alarms=None, packet_layout_name="default",
+                 sea_state_window=1200, natural_roll_period=None, archive_path=None):
+        self.serial_port = serial_port
+        self.serial_thread = None
+        self.replay_path = replay_path
+        self.replay_speed = replay_speed
+
+        # Field layout of the sensor's firmware; latest_packet keeps the raw bytes of the last packet,
+        # decoded into every field only when the overlay shows them
+        self.packet_layout = packet_layout(packet_layout_name)
+        self.latest_packet = None
+
+        # Pipeline counters and timings are always collected; --metrics serves them over HTTP
+        self.metrics = Metrics()
+        self.parse_time = self.metrics.histogram("parse_seconds")
+
+        # Several named sensors share one asyncio loop; the gauges follow active_sensor
+        self.engine = None
+        self.active_sensor = None
+        if sensors:
+            self.engine = AcquisitionEngine(sensors, baud_rate, input_mode, handler=self.on_sensor_packet,
+                                            metrics=self.metrics, layout=self.packet_layout)
+            self.active_sensor = sensors[0][0]
+
+        # Optional smoothing per axis, applied on the acquisition thread: {"roll": spec, "pitch": spec}
+        filters = filters or {}
+        self.roll_filter = make_filter(filters.get("roll"))
+        self.pitch_filter = make_filter(filters.get("pitch"))
+
+        # Optional fan-out of samples to other programs on board (ECDIS overlay, loading computer, ...)
+        self.broadcaster = SampleBroadcaster(serve) if serve else None
+        if self.broadcaster:
+            self.broadcaster.start()
+
+        # Alarm rules checked for every decoded sample right here on the acquisition path, so detection
+        # and the log/broadcast outputs don't wait for the UI loop
+        self.alarms = AlarmEngine(alarms, self.metrics) if alarms else None
+        if self.alarms:
+            self.alarms.subscribe(log_alarm)
+            if self.broadcaster:
+                self.alarms.subscribe(lambda event: self.broadcaster.publish_message(encode_wire_alarm(event)))
+
+        # Roll/pitch period, amplitude and resonance warnings over the last sea_state_window seconds,
+        # computed from the raw samples of the displayed sensor
+        self.sea_state = None
+        self.sea_state_sensor = None
+        if sea_state_window > 0:
+            self.sea_state = SeaStateAnalyzer(sea_state_window, natural_roll_period=natural_roll_period,
+                                              metrics=self.metrics)
+            self.sea_state.subscribe(log_sea_state)
+            self.metrics.add_source("sea_state", self.sea_state.stats)
+
+        # Optional crash-safe recording of every packet. Several sensors are recorded to one file each,
+        # FILE.NAME.ext, so a recording never splices two sensors together; None keys the serial port.
+        self.recorders = {}
+        if record_path:
+            root, ext = os.path.splitext(record_path)
+            for name in (self.engine.channels if self.engine else (None,)):
+                self.recorders[name] = PacketRecorder(f"{root}.{name}{ext}" if name else record_path)
+
+        # Optional long-term archive of the decoded angles with 1 s / 1 min / 1 h summaries (SAP_Archive.py).
+        # Every sensor gets its own, DIR/NAME, whatever the gauges show; None keys the serial port.
+        self.archives = {}
+        if archive_path:
+            for name in (self.engine.channels if self.engine else (None,)):
+                self.archives[name] = ArchiveWriter(os.path.join(archive_path, name) if name else archive_path)
+
+        # Displayed roll/pitch over time for the trend charts; bounded, 24 h at 10 Hz by default
+        self.history = SampleHistory(history_capacity)
+
+        # Latest reading, swapped atomically by the reader thread (see tilt_angle_1/tilt_angle_2)
+        self.latest_sample = Sample(0, time.time(), 0, 0)
+
+        # Splits the serial byte stream into packets ("hex" for the ASCII firmware, "binary" for raw frames).
+        # Recordings always hold binary packets.
+        self.input_mode = input_mode if replay_path is None else "binary"
+        self.framer = (HexLineFramer(layout=self.packet_layout) if self.input_mode == "hex"
+                       else PacketFramer(layout=self.packet_layout))
+
+        self.metrics.add_source("history", lambda: {"samples": min(self.history.total, self.history.capacity)})
+        if self.engine:
+            self.metrics.add_source("sensor", self.sensor_gauges)
+            for name in self.engine.channels:
+                self.metrics.track_rate(f"sensor_{name}_packets")
+        else:
+            self.metrics.add_source("serial", self.framer_gauges)
+            self.metrics.track_rate("serial_packets")
+        if self.broadcaster:
+            self.metrics.add_source("broadcast", self.broadcaster.stats)
+        if self.recorders:
+            self.metrics.add_source("recorder", lambda: {"records_written": sum(
+                recorder.records_written for recorder in self.recorders.values())})
+        for name, archive in self.archives.items():
+            self.metrics.add_source(f"archive_{name}" if name else "archive", archive.stats)
+        self.metrics_server = None
+        if metrics_address:
+            self.metrics_server = MetricsServer(self.metrics, *metrics_address)
+            self.metrics_server.start()
 
-# Allowed serial number
-ALLOWED_SERIAL_NUMBER = "0000_0000_0000_0000_ACE4_2E00_3AF9_5F98."  # Replace with your device's serial number
+        self.data_event = threading.Event()  # Set when roll or pitch changes; wakes update_display
+        self.stop_event = threading.Event()  # Wakes the reader/replay threads on shutdown
+        self.running = True
 
-import platform
-import subprocess
+    def start(self):
+        """Start thread to read serial data; it publishes each packet as latest_sample."""
+        if self.engine:
+            self.engine.start()
+        else:
+            reader = self.read_serial if self.replay_path is None else self.replay_recording
+            self.serial_thread = threading.Thread(target=reader, daemon=True)
+            self.serial_thread.start()
 
-def get_device_serial_number():
-    """Retrieve the device's hard drive serial number based on platform."""
-    try:
-        system_type = platform.system()
-        if system_type == "Windows":
+    def alive(self):
+        """False once a replay has finished (live inputs keep reading until stop())."""
+        return self.running and (self.serial_thread is None or self.serial_thread.is_alive())
+
+    def stop(self):
+        """Stop the reader and close every output."""
+        self.running = False
+        self.stop_event.set()
+        if self.serial_port:
             try:
-                import wmi
-                c = wmi.WMI()
-                for disk in c.Win32_DiskDrive():
-                    if 'PHYSICALDRIVE0' in disk.DeviceID:
-                        serial_number = disk.SerialNumber.strip()
-                        return serial_number
-            except ImportError:
-                print("wmi module not found. Attempting to install...")
-                subprocess.check_call(["python", "-m", "pip", "install", "wmi"])
-                import wmi
-                c = wmi.WMI()
-                for disk in c.Win32_DiskDrive():
-                    if 'PHYSICALDRIVE0' in disk.DeviceID:
-                        serial_number = disk.SerialNumber.strip()
-                        return serial_number
-        elif system_type == "Linux":
-            result = subprocess.check_output("cat /proc/cpuinfo | grep Serial", shell=True)
-            serial_number = result.decode().strip().split(": ")[-1]
-        elif system_type == "Darwin":  # macOS
-            result = subprocess.check_output("ioreg -l | grep IOPlatformSerialNumber", shell=True)
-            serial_number = result.decode().strip().split("\"")[-2]
-        else:
-            print("Unsupported platform!")
-            return None
-        
-        return serial_number
-    except Exception as e:
-        print(f"Error retrieving serial number: {e}")
-        return None
+                self.serial_port.cancel_read()  # Wake the reader from its blocking read
+            except Exception:
+                pass
+        if self.engine:
+            self.engine.stop()
+        if self.serial_thread:
+            self.serial_thread.join(timeout=2)
+        if self.serial_port:
+            self.serial_port.close()
+        if self.broadcaster:
+            self.broadcaster.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        for recorder in self.recorders.values():
+            recorder.close()
+            print(f"Recorded {recorder.records_written} packets to {recorder.path}")
+        for archive in self.archives.values():
+            archive.close()
+            print(f"Archived {archive.samples_written} samples to {archive.path}")
 
+    def report(self):
+        """Print the packet counters, per sensor with several sensors."""
+        if self.engine:
+            for name, stats in self.engine.stats().items():
+                print(f"Sensor {name}: {stats['packets']} packets, {stats['checksum_failures']} checksum failures, "
+                      f"{stats['resyncs']} resyncs, {stats['errors']} errors")
+        else:
+            print(f"Packets: {self.framer.packets} received, {self.framer.checksum_failures} checksum failures, "
+                  f"{self.framer.resyncs} resyncs")
 
-def authenticate_device(allowed_serial_number):
-    """Authenticate the device based on its serial number."""
-    device_serial_number = get_device_serial_number()
-    if device_serial_number != allowed_serial_number:
-        print("Unauthorized device. Exiting...")
-        exit(1)
-    print("Device authenticated successfully.")
+    def framer_gauges(self):
+        return {"packets": self.framer.packets, "checksum_failures": self.framer.checksum_failures,
+                "resyncs": self.framer.resyncs, "bytes_discarded": self.framer.bytes_discarded,
+                "malformed_lines": getattr(self.framer, "malformed_lines", 0)}
 
-class PortSelector:
-    def __init__(self, parent):
-        self.dialog = ctk.CTkToplevel(parent)
-        self.dialog.title("Select Serial Port")
-        self.dialog.geometry("800x400")
-        self.dialog.transient(parent)
-        self.dialog.grab_set()  # Make the dialog modal
-        
-        # Center the dialog
-        self.dialog.update_idletasks()
-        width = self.dialog.winfo_width()
-        height = self.dialog.winfo_height()
-        x = (self.dialog.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.dialog.winfo_screenheight() // 2) - (height // 2)
-        self.dialog.geometry(f'+{x}+{y}')
-        
-        # Create main frame
-        main_frame = ctk.CTkFrame(self.dialog, fg_color="transparent")
-        main_frame.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        # Add refresh button
-        refresh_btn = ctk.CTkButton(main_frame, text="Refresh Ports", command=self.refresh_ports)
-        refresh_btn.pack(pady=(0, 10))
-        
-        # Create a custom table using CTkFrames and CTkLabels
-        self.table_frame = ctk.CTkScrollableFrame(main_frame, fg_color="transparent")
-        self.table_frame.pack(fill="both", expand=True)
-        
-        # Define columns
-        self.columns = ('Port', 'Description', 'Hardware ID')
-        self.rows = []  # To store rows dynamically
-        self.selected_row = None  # Track the currently selected row
-        
-        # Buttons frame
-        btn_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-        btn_frame.pack(fill="x", pady=(10, 0))
-        
-        # Add buttons
-        ctk.CTkButton(btn_frame, text="Connect", command=self.on_connect).pack(side="left", padx=5)
-        ctk.CTkButton(btn_frame, text="Cancel", command=self.on_cancel).pack(side="left")
-        
-        self.selected_port = None
-        self.refresh_ports()
-    
-    def refresh_ports(self):
-        """Scan and refresh the list of available ports"""
-        # Clear all existing widgets in the table_frame
-        for widget in self.table_frame.winfo_children():
-            widget.destroy()
-        
-        # Clear the rows list
-        self.rows.clear()
+    def sensor_gauges(self):
+        """Numeric per-sensor stats flattened to sensorname_key."""
+        return {f"{name}_{key}": value for name, stats in self.engine.stats().items()
+                for key, value in stats.items() if isinstance(value, (bool, int, float))}
 
-        # Get available ports
-        ports = serial.tools.list_ports.comports()
+    @property
+    def tilt_angle_1(self):
+        """Roll of the latest sample."""
+        return self.latest_sample.roll
 
-        # Add header row
-        header_frame = ctk.CTkFrame(self.table_frame, fg_color="gray20")
-        header_frame.pack(fill="x", pady=(0, 5))
-        for i, col in enumerate(self.columns):
-            header_label = ctk.CTkLabel(header_frame, text=col, font=("Helvetica", 12, "bold"), anchor="w", width=150)
-            header_label.grid(row=0, column=i, padx=5, sticky="w")
+    @property
+    def tilt_angle_2(self):
+        """Pitch of the latest sample."""
+        return self.latest_sample.pitch
 
-        # Add port rows
-        for port in ports:
-            row_frame = ctk.CTkFrame(self.table_frame, fg_color="transparent")
-            row_frame.pack(fill="x", pady=(0, 5))
+    def read_serial(self):
+        """Read and process serial data."""
+        while self.running:
+            try:
+                # Block (up to the port timeout) for the first byte, then take everything buffered
+                # in one call and let the framer split it
+                data = self.serial_port.read(max(1, self.serial_port.in_waiting))
+                for packet, checksum_ok in self.framer.feed(data):
+                    self.handle_packet(packet, checksum_ok)
+                            
+            except Exception as e:
+                if not self.running:
+                    break  # Port closed or read cancelled by stop()
+                print(f"Serial read error: {e}")
+                self.metrics.count("read_errors")
+                self.stop_event.wait(0.5)  # Don't spin on a persistent error such as an unplugged adapter
 
-            # Add columns for each row
-            ctk.CTkLabel(row_frame, text=port.device, anchor="w", width=150).grid(row=0, column=0, padx=5, sticky="w")
-            ctk.CTkLabel(row_frame, text=port.description, anchor="w", width=300).grid(row=0, column=1, padx=5, sticky="w")
-            ctk.CTkLabel(row_frame, text=port.hwid, anchor="w", width=300).grid(row=0, column=2, padx=5, sticky="w")
+    def handle_packet(self, packet, checksum_ok, timestamp=None):
+        """Decode one framed packet, record it and publish the angles to the display."""
+        start = time.perf_counter()
+        roll, pitch = self.packet_layout.angles(packet)
+        self.parse_time.observe(time.perf_counter() - start)
+        self.latest_packet = bytes(packet)  # The framer reuses its buffer
+        self.publish_sample(packet, checksum_ok, roll, pitch,
+                            time.time() if timestamp is None else timestamp)
 
-            # Store the row frame and bind click event
-            row_frame.bind("<Button-1>", lambda event, r=row_frame, p=port.device: self.select_row(r, p))
-            for widget in row_frame.winfo_children():
-                widget.bind("<Button-1>", lambda event, r=row_frame, p=port.device: self.select_row(r, p))
+    def publish_sample(self, packet, checksum_ok, roll, pitch, timestamp, sensor=None):
+        """Record a decoded packet and hand it to the display as the new latest_sample."""
+        if self.recorders and not self.engine:
+            self.recorders[None].record(timestamp, packet, roll, pitch, checksum_ok)  # Raw, unfiltered angles
+        if self.archives and not self.engine and checksum_ok and self.replay_path is None:
+            self.archives[None].append(timestamp, roll, pitch)  # Corrupt packets are left out, as on import
+        if self.alarms and not self.engine:
+            self.check_alarms(timestamp, roll, pitch, checksum_ok, sensor)
+        if self.sea_state:
+            if sensor != self.sea_state_sensor:
+                self.sea_state_sensor = sensor
+                self.sea_state.reset()  # Another sensor was selected; don't mix their motion
+            if checksum_ok:
+                self.sea_state.append(timestamp, roll, pitch)  # A corrupt spike would skew spectrum and period
+        if self.broadcaster and not self.engine and checksum_ok:
+            # Same stream as with several sensors: raw angles of valid packets, smoothing is up to the client
+            self.broadcaster.publish(Sample(self.latest_sample.seq + 1, timestamp, roll, pitch, sensor))
+        # Smoothed values stay on the 0.1° grid the display and sprite cache work in
+        if self.roll_filter:
+            roll = round(self.roll_filter.update(roll), 1)
+        if self.pitch_filter:
+            pitch = round(self.pitch_filter.update(pitch), 1)
+        previous = self.latest_sample
+        self.latest_sample = Sample(previous.seq + 1, timestamp, roll, pitch, sensor)
+        if checksum_ok:
+            self.history.append(timestamp, roll, pitch)  # Corrupt packets would show as spikes in the trends
+        if roll != previous.roll or pitch != previous.pitch:
+            self.data_event.set()
 
-            self.rows.append(row_frame)
-    
-    def select_row(self, row, port):
-        """Handle row selection"""
-        if self.selected_row:
-            self.selected_row.configure(fg_color="transparent")  # Deselect previous row
-        self.selected_row = row
-        self.selected_port = port
-        row.configure(fg_color="#0060AA")  # Highlight selected row
-    
-    def on_connect(self):
-        """Handle port selection"""
-        if not self.selected_port:
-            CTkMessagebox(title="Warning", message="Please select a port first!", icon="warning")
+    def check_alarms(self, timestamp, roll, pitch, checksum_ok, sensor=None):
+        """Evaluate the alarm rules on unfiltered angles (filters add lag), skipping corrupt packets."""
+        if not checksum_ok:
+            # One flipped bit in the angle bytes would read as a large heel or an absurd rate
+            self.metrics.count("alarms_skipped_checksum")
             return
-        
-        self.dialog.destroy()
-    
-    def on_cancel(self):
-        """Handle dialog cancellation"""
-        self.selected_port = None
-        self.dialog.destroy()
+        self.alarms.evaluate(timestamp, roll, pitch, sensor)
+
+    def on_sensor_packet(self, sensor, packet, checksum_ok, sample):
+        """AcquisitionEngine handler: record and archive every sensor; the selected one drives the gauges."""
+        if self.recorders:
+            self.recorders[sensor].record(sample.timestamp, packet, sample.roll, sample.pitch, checksum_ok)
+        if self.archives and checksum_ok:
+            self.archives[sensor].append(sample.timestamp, sample.roll, sample.pitch)
+        if self.broadcaster and checksum_ok:
+            self.broadcaster.publish(sample)  # Subscribers get every sensor, unfiltered
+        if self.alarms:
+            self.check_alarms(sample.timestamp, sample.roll, sample.pitch, checksum_ok, sensor)
+        if sensor == self.active_sensor:
+            self.latest_packet = self.engine.channels[sensor].latest_packet
+            self.publish_sample(packet, checksum_ok, sample.roll, sample.pitch, sample.timestamp, sensor)
+
+    def select_sensor(self, name):
+        """Switch the gauges to another sensor. Runs on the engine thread, the only writer of latest_sample."""
+        self.engine.call(self.apply_sensor_selection, name)
+
+    def apply_sensor_selection(self, name):
+        """Show the newly selected sensor's latest reading right away."""
+        self.active_sensor = name
+        for axis_filter in (self.roll_filter, self.pitch_filter):
+            if axis_filter:
+                axis_filter.reset()  # Don't blend the previous sensor into the new one
+        channel = self.engine.channels[name]
+        sample = channel.latest_sample
+        self.latest_packet = channel.latest_packet
+        self.latest_sample = Sample(self.latest_sample.seq + 1, sample.timestamp, sample.roll, sample.pitch, name)
+        self.data_event.set()
+
+    def replay_recording(self):
+        """Feed a recording through the framer with its original timing, scaled by replay_speed."""
+        try:
+            start_wall = time.monotonic()
+            start_recorded = None
+            for timestamp, packet, _, _, _ in read_recording(self.replay_path):
+                if not self.running:
+                    return
+                if start_recorded is None:
+                    start_recorded = timestamp
+                delay = start_wall + (timestamp - start_recorded) / self.replay_speed - time.monotonic()
+                if delay > 0 and self.stop_event.wait(delay):
+                    return
+                for framed, checksum_ok in self.framer.feed(packet):
+                    self.handle_packet(framed, checksum_ok, timestamp)  # Alarms and analysis run on recorded time
+            print("Replay finished.")
+        except Exception as e:
+            print(f"Replay error: {e}")
+
+class GaugeStream:
+    """The gauges rendered offscreen from a pipeline's latest_sample and served over HTTP (--stream).
+
+    One renderer and one FrameCache for every viewer; see FrameStreamer and FrameServer.
+    """
+
+    def __init__(self, pipeline, asset, address, size=STREAM_SIZE, fps=STREAM_FPS):
+        self.cache = FrameCache()
+        self.streamer = FrameStreamer(lambda: (pipeline.latest_sample.roll, pipeline.latest_sample.pitch),
+                                      OffscreenRenderer(asset, size), self.cache, fps, metrics=pipeline.metrics)
+        self.server = FrameServer(self.cache, *address)
+        pipeline.metrics.add_source("stream", self.streamer.stats)
+
+    def start(self):
+        self.server.start()
+        self.streamer.start()
+        host, port = self.server.address()[:2]
+        print(f"Streaming gauges at http://{host}:{port}/")
+
+    def stop(self):
+        self.streamer.stop()
+        self.server.stop()
+        print(f"Stream: {self.streamer.frames} frames rendered, {self.cache.png_encodes} PNG encodes")
+
+def load_asset(assets, path):
+    """Return the AssetPyramid for an image file from assets, loading it on first use."""
+    pyramid = assets.get(path)
+    if pyramid is None:
+        pyramid = assets[path] = AssetPyramid(Image.open(path))
+    return pyramid
 
 class ShipTiltDashboard:
-    def __init__(self, root):
+    def __init__(self, root, render_mode="on_change", input_mode="hex", baud_rate=9600,
+                 record_path=None, replay_path=None, replay_speed=1.0, sensors=None, filters=None,
+                 use_startup_cache=True, startup_report_path=None, serve=None, metrics_address=None,
+                 metrics_overlay=False, port="auto", render_backend="bitmap", trend_span=600,
+                 history_capacity=864000, alarms=None, packet_layout_name="default", low_power=False,
+                 sea_state_window=1200, natural_roll_period=None, archive_path=None, stream_address=None,
+                 stream_size=STREAM_SIZE, stream_fps=STREAM_FPS):
+        import_gui()
         self.root = root
         self.root.title("Ship Tilt Dashboard")
         
@@ -178,37 +3750,70 @@ class ShipTiltDashboard:
         self.container = ctk.CTkFrame(root, fg_color="black")
         self.container.pack(expand=True, fill="both", padx=20, pady=20)
         
-        # Initialize port selection
-        port_selector = PortSelector(root)
-        self.root.wait_window(port_selector.dialog)
-        
-        if not port_selector.selected_port:
-            CTkMessagebox(title="Error", message="No port selected. Application will close.", icon="cancel")
-            root.destroy()
-            return
-            
-        try:
-            self.serial_port = serial.Serial(port_selector.selected_port, 9600, timeout=1)
-            CTkMessagebox(title="Success", message=f"Connected to port: {port_selector.selected_port}", icon="info")
-        except Exception as e:
-            CTkMessagebox(title="Connection Error", message=str(e), icon="cancel")
-            root.destroy()
-            return
+        # A replay feeds a recording through the pipeline instead of a serial port, and named
+        # sensors are opened by the AcquisitionEngine, so both skip the port selector
+        self.serial_port = None
+
+        if replay_path is None and not sensors:
+            # "auto" connects straight away when exactly one port sends valid packets, "select" always
+            # asks, anything else is a port name
+            probe_results = []
+            selected_port = None
+            if port == "auto":
+                probe_results = auto_detect_port(baud_rate, use_startup_cache)
+                startup_timer.mark("port detected")
+                if len(probe_results) == 1:
+                    selected_port = probe_results[0].device
+            elif port != "select":
+                selected_port = port
+
+            if selected_port is None:
+                # Initialize port selection
+                port_selector = PortSelector(root, probe_results)
+                self.root.wait_window(port_selector.dialog)
+
+                if not port_selector.selected_port:
+                    CTkMessagebox(title="Error", message="No port selected. Application will close.", icon="cancel")
+                    root.destroy()
+                    return
+                selected_port = port_selector.selected_port
+                probe_results = port_selector.probe_results
+
+            # A detected port brings its own baud rate and data format
+            detected = next((result for result in probe_results if result.device == selected_port), None)
+            if detected:
+                baud_rate = detected.baud_rate
+                input_mode = detected.input_mode
+
+            try:
+                import serial
+                self.serial_port = serial.Serial(selected_port, baud_rate, timeout=1)
+                if detected:
+                    save_cached_port(detected)
+                CTkMessagebox(title="Success", message=f"Connected to port: {selected_port}", icon="info")
+            except Exception as e:
+                CTkMessagebox(title="Connection Error", message=str(e), icon="cancel")
+                root.destroy()
+                return
 
         # Rest of your existing initialization code...
-        self.tilt_angle_1 = 0  # Roll
-        self.tilt_angle_2 = 0  # Pitch
-        
-        # Constants matching Arduino
-        self.RESOLUTION_FACTOR = 364
-        self.MAX_ANGLE = 90
-        self.MIN_ANGLE = -90
-            
-        # Packet constants
-        self.HEADER_HIGH = 0x5A
-        self.HEADER_LOW = 0xA5
-        self.PACKET_SIZE = 32
-        self.TERMINATOR = 0xAA
+        # Reading, decoding, recording, alarms and analysis run in the Tk-free pipeline; this class only draws
+        self.pipeline = AcquisitionPipeline(self.serial_port, input_mode, record_path, replay_path, replay_speed,
+                                            sensors, baud_rate, filters, serve, metrics_address, history_capacity,
+                                            alarms, packet_layout_name, sea_state_window, natural_roll_period,
+                                            archive_path)
+        self.metrics = self.pipeline.metrics  # The UI's timings go into the same registry
+        self.drawn_seq = 0  # seq of the sample the display last rendered
+
+        self.trend_span = trend_span  # Seconds shown by the trend charts, 0 hides them
+
+        # Size pyramids of every image asset, built once and reused for every resize. The atlas cache
+        # holds them pre-scaled and uncompressed so a restart doesn't decode the PNGs again.
+        self.startup_report_path = startup_report_path
+        self.atlas = AssetAtlas(os.path.join(CACHE_DIR, "assets.atlas")) if use_startup_cache else None
+        self.assets = (self.atlas.load(ASSET_FILES) if self.atlas else None) or {}
+        self.atlas_stale = self.atlas is not None and not self.assets
+        startup_timer.mark("atlas loaded" if self.assets else "atlas missing")
 
        # Load and resize logos
         logo1_path = "logo1.png"  # Replace with your first logo file path
@@ -218,13 +3823,13 @@ class ShipTiltDashboard:
             from customtkinter import CTkImage  # Import CTkImage
 
             # Resize logo1
-            logo1_image = Image.open(logo1_path)
-            resized_logo1 = logo1_image.resize((150, 200), Image.Resampling.LANCZOS)  # Adjust size as needed
+            self.logo1_pyramid = self.asset(logo1_path)
+            resized_logo1 = self.logo1_pyramid.get((150, 200))  # Adjust size as needed
             self.logo1 = CTkImage(light_image=resized_logo1, dark_image=resized_logo1, size=(150, 200))
 
             # Resize logo2
-            logo2_image = Image.open(logo2_path)
-            resized_logo2 = logo2_image.resize((150, 200), Image.Resampling.LANCZOS)  # Adjust size as needed
+            self.logo2_pyramid = self.asset(logo2_path)
+            resized_logo2 = self.logo2_pyramid.get((150, 200))  # Adjust size as needed
             self.logo2 = CTkImage(light_image=resized_logo2, dark_image=resized_logo2, size=(150, 200))
         else:
             print(f"One or both logo files not found: {logo1_path}, {logo2_path}")
@@ -236,26 +3841,86 @@ class ShipTiltDashboard:
         # self.console_update_interval = 0.5
         # self.start_console_thread()
 
+        # Pre-rendered ship/highlighter rotations shared by both displays ("bitmap"), or polygons traced
+        # from the PNGs and rotated vertex by vertex ("vector"), whose cost doesn't grow with the window
+        self.render_backend = render_backend
+        self.sprite_cache = SpriteCache(metrics=self.metrics)
+        # Sprite misses and meter resizes are rendered here; the Tk thread only converts and blits
+        self.compositor = FrameCompositor(workers=2)
+        self.traced_shapes = {}  # layer -> trace_shapes() result
+        self.vector_time = self.metrics.histogram("frame_vector_seconds")
+
+        # Frame time split; the rotate and PhotoImage parts are timed inside the sprite cache
+        self.frame_time = self.metrics.histogram("frame_seconds")
+        self.itemconfig_time = self.metrics.histogram("frame_itemconfig_seconds")
+        self.label_time = self.metrics.histogram("frame_label_seconds")
+        self.latency_time = self.metrics.histogram("reader_to_ui_seconds")
+
         # Initialize layout
         self.init_layout()
+        startup_timer.mark("layout")
+
+        # Metrics overlay in the top left corner, toggled with F3
+        self.overlay_label = None
+        self.overlay_after_id = None
+        self.overlay_marks = {}  # histogram name -> state() at the previous refresh
+        self.root.bind("<F3>", lambda event: self.toggle_overlay())
+        if metrics_overlay:
+            self.toggle_overlay()
+
+        # Redraw interval follows the sensor rate and frame cost; F4 toggles low-power mode
+        self.scheduler = FrameScheduler(low_power=low_power)
+        self.root.bind("<F4>", lambda event: self.toggle_low_power())
         
-        # Bind resize event
+        # Bind resize event; the work is debounced until the window size settles
+        self.pending_resize = None
+        self.resize_after_id = None
+        self.applied_size = None
         self.root.bind("<Configure>", self.on_resize)
 
-        # Start thread to read serial data
-        self.running = True
-        self.serial_thread = threading.Thread(target=self.read_serial, daemon=True)
-        self.serial_thread.start()
+        # Optional offscreen copy of the gauges for other monitors on board (--stream)
+        self.stream = None
+        if stream_address:
+            self.stream = GaugeStream(self.pipeline, self.asset, stream_address, stream_size, stream_fps)
+            self.stream.start()
+
+        self.pipeline.start()
 
-        # Update display continuously
-        self.update_interval = 16
+        # Update display continuously ("continuous") or only when inputs change ("on_change")
+        self.render_mode = render_mode
+        self.render_dirty = True
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+        self.idle_polls = 0  # on_change ticks that found nothing new and went back to sleep
+        self.idle_interval = self.scheduler.interval_ms()
         self.last_update = time.time()
+        self.metrics.add_source("render", self.render_stats)
+        self.metrics.add_source("scheduler", self.scheduler.stats)
+        self.metrics.add_source("sprites", self.sprite_cache.stats)
+        self.metrics.add_source("compositor", self.compositor.stats)
         self.update_display()
+        if self.trend_span > 0:
+            self.update_trends()
+        if self.pipeline.sea_state:
+            self.sea_state_shown = None
+            self.update_sea_state()
+
+    def asset(self, path):
+        """Return the AssetPyramid for an image file, loading it on first use."""
+        return load_asset(self.assets, path)
+
+    def shapes(self, path):
+        """Polygons traced from an image file, traced on first use."""
+        shapes = self.traced_shapes.get(path)
+        if shapes is None:
+            shapes = self.traced_shapes[path] = trace_shapes(self.asset(path).levels[0])
+        return shapes
 
     def init_layout(self):
         # Title and Logo Frame
         title_frame = ctk.CTkFrame(self.container, fg_color="black")
         title_frame.pack(fill="x", pady=(0, 30))
+        self.title_frame = title_frame
 
         # Left Logo (logo1)
         if self.logo1:
@@ -276,6 +3941,29 @@ class ShipTiltDashboard:
             self.right_logo_label = ctk.CTkLabel(title_frame, image=self.logo2, text="")
             self.right_logo_label.pack(side="right", padx=(10, 0))
 
+        # Alarm banner, shown under the title while any alarm is active
+        self.alarm_banner = ctk.CTkLabel(
+            self.container,
+            text="",
+            font=("Helvetica", 28, "bold"),
+            text_color="#FFFFFF",
+            fg_color="#B00000",
+            corner_radius=6
+        )
+        self.alarm_banner_shown = False
+        self.alarm_version = 0
+
+        # Sensor picker when several inclinometers are connected
+        if self.pipeline.engine and len(self.pipeline.engine.channels) > 1:
+            self.sensor_selector = ctk.CTkSegmentedButton(
+                self.container,
+                values=list(self.pipeline.engine.channels),
+                command=self.pipeline.select_sensor,
+                font=("Helvetica", 16, "bold")
+            )
+            self.sensor_selector.set(self.pipeline.active_sensor)
+            self.sensor_selector.pack(pady=(0, 20))
+
         # Main Frame (contains both ship displays)
         main_frame = ctk.CTkFrame(self.container, fg_color="black")
         main_frame.pack(expand=True, fill="both")
@@ -292,22 +3980,20 @@ class ShipTiltDashboard:
         self.ship2_display["frame"].pack(side="left", expand=True, fill="both")
 
     def get_angle_color(self, angle):
-        """Determine color based on angle and sign."""
-        if angle > 0:
-            return "#00FF00"  # Green for positive angles
-        elif angle < 0:
-            return "#FF0000"  # Red for negative angles
-        else:
-            return "#FFFFFF"  # White for zero
+        return angle_color(angle)
 
     def create_display(self, parent, meter_img, ship_img, highlighter_img):
         """Create a single ship display using original image sizes."""
         frame = ctk.CTkFrame(parent, fg_color="black")
 
         # Load images with original sizes
-        meter = Image.open(meter_img)
-        ship = Image.open(ship_img)
-        highlighter = Image.open(highlighter_img)
+        meter = self.asset(meter_img).levels[0]
+        ship = self.asset(ship_img).levels[0]
+        highlighter = self.asset(highlighter_img).levels[0]
+
+        # Rotated variants are served from the sprite cache, keyed by file name
+        self.sprite_cache.register(ship_img, self.asset(ship_img))
+        self.sprite_cache.register(highlighter_img, self.asset(highlighter_img))
 
         # Convert to Tkinter images
         meter_tk = ImageTk.PhotoImage(meter)
@@ -333,8 +4019,19 @@ class ShipTiltDashboard:
 
         # Create image objects at center
         canvas.create_image(center_x, center_y, image=meter_tk, tags="meter")
-        highlighter_canvas_obj = canvas.create_image(center_x, center_y, image=highlighter_tk, tags="highlighter")
-        ship_canvas_obj = canvas.create_image(center_x, center_y, image=ship_tk, tags="ship")
+        if self.render_backend == "vector":
+            # One polygon per traced shape, highlighter below the ship; placed by place_vector_layers
+            vector_layers = []
+            for layer, tag in ((highlighter_img, "highlighter"), (ship_img, "ship")):
+                shapes = self.shapes(layer)
+                items = [canvas.create_polygon(0, 0, 0, 0, 0, 0, fill=fill, outline="", tags=tag)
+                         for fill, _ in shapes]
+                vector_layers.append((shapes, items))
+            highlighter_canvas_obj = ship_canvas_obj = None
+        else:
+            vector_layers = None
+            highlighter_canvas_obj = canvas.create_image(center_x, center_y, image=highlighter_tk, tags="highlighter")
+            ship_canvas_obj = canvas.create_image(center_x, center_y, image=ship_tk, tags="ship")
 
         # Status display frame
         status_frame = ctk.CTkFrame(frame, fg_color="black")
@@ -348,51 +4045,88 @@ class ShipTiltDashboard:
                                 fg_color="black")
         angle_label.pack()
 
+        # Period and amplitude of this axis from the sea-state analysis
+        sea_label = ctk.CTkLabel(status_frame, text="", font=("Helvetica", 16), text_color="#AAAAAA",
+                                 fg_color="black")
+        if self.pipeline.sea_state:
+            sea_label.pack()
+
+        # Trend chart of this gauge's axis over the last trend_span seconds
+        trend_canvas = None
+        if self.trend_span > 0:
+            trend_canvas = ctk.CTkCanvas(frame, width=meter.width, height=TREND_HEIGHT, bg="black",
+                                         highlightthickness=0)
+            trend_canvas.pack(fill="x", pady=(0, 10))
+            trend_canvas.create_line(0, 0, 0, 0, fill="#444444", tags="zero")
+            trend_canvas.create_line(0, 0, 0, 0, fill="#00BFFF", tags="envelope")
+            trend_canvas.create_text(4, 2, anchor="nw", fill="#888888", font=("Helvetica", 10), tags="label")
+
         return {
             "frame": frame,
             "canvas": canvas,
             "meter_img": meter,
+            "meter_layer": meter_img,
             "meter_tk": meter_tk,
             "ship_img": ship,
             "ship_tk": ship_tk,
             "highlighter_img": highlighter,
             "highlighter_tk": highlighter_tk,
+            "ship_layer": ship_img,
+            "highlighter_layer": highlighter_img,
+            "sprite_size": None,
+            "angle": 0,
+            "drawn": {},  # Inputs of the last drawn frame, used to skip unchanged items
             "ship_canvas_obj": ship_canvas_obj,
             "highlighter_canvas_obj": highlighter_canvas_obj,
+            "vector_layers": vector_layers,  # [(shapes, canvas items)] for the vector backend
             "angle_label": angle_label,
+            "sea_label": sea_label,
+            "trend_canvas": trend_canvas,
             "center": (center_x, center_y)
         }
 
     def on_resize(self, event):
         """Handle window resize events."""
         if event.widget == self.root:
-            # Update base font size based on window width
-            new_font_size = max(12, int(event.width / 100))
-            self.base_font_size = new_font_size
-
-            # Update heading font size
-            self.heading.configure(font=("Helvetica", self.base_font_size * 5, "bold"))
-
-            # Resize logos
-            if self.logo1:
-                resized_logo1 = self.logo1._light_image.resize(
-                    (int(event.width / 12), int(event.width / 12 * (200 / 150))),  # Maintain aspect ratio
-                    Image.Resampling.LANCZOS
-                )
-                self.logo1 = ctk.CTkImage(light_image=resized_logo1, dark_image=resized_logo1, size=(int(event.width / 12), int(event.width / 12 * (200 / 150))))
-                self.left_logo_label.configure(image=self.logo1)
-
-            if self.logo2:
-                resized_logo2 = self.logo2._light_image.resize(
-                    (int(event.width / 12), int(event.width / 12 * (200 / 150))),  # Maintain aspect ratio
-                    Image.Resampling.LANCZOS
-                )
-                self.logo2 = ctk.CTkImage(light_image=resized_logo2, dark_image=resized_logo2, size=(int(event.width / 12), int(event.width / 12 * (200 / 150))))
-                self.right_logo_label.configure(image=self.logo2)
-
-            # Resize main frame and its contents
-            for display in [self.ship1_display, self.ship2_display]:
-                self.resize_display(display, event.width, event.height)
+            # Dragging the window fires a burst of events; only the final size is applied
+            self.pending_resize = (event.width, event.height)
+            if self.resize_after_id is not None:
+                self.root.after_cancel(self.resize_after_id)
+            self.resize_after_id = self.root.after(RESIZE_DEBOUNCE_MS, self.apply_resize)
+
+    def apply_resize(self):
+        """Resize fonts, logos and displays for the last reported window size."""
+        self.resize_after_id = None
+        if self.pending_resize == self.applied_size:
+            return
+        width, height = self.applied_size = self.pending_resize
+        start = time.perf_counter()
+
+        # Update base font size based on window width
+        new_font_size = max(12, int(width / 100))
+        self.base_font_size = new_font_size
+
+        # Update heading font size
+        self.heading.configure(font=("Helvetica", self.base_font_size * 5, "bold"))
+
+        # Resize logos from their pyramids, never from an earlier resized copy
+        logo_size = (int(width / 12), int(width / 12 * (200 / 150)))  # Maintain aspect ratio
+        if self.logo1:
+            resized_logo1 = self.logo1_pyramid.get(logo_size)
+            self.logo1 = ctk.CTkImage(light_image=resized_logo1, dark_image=resized_logo1, size=logo_size)
+            self.left_logo_label.configure(image=self.logo1)
+
+        if self.logo2:
+            resized_logo2 = self.logo2_pyramid.get(logo_size)
+            self.logo2 = ctk.CTkImage(light_image=resized_logo2, dark_image=resized_logo2, size=logo_size)
+            self.right_logo_label.configure(image=self.logo2)
+
+        # Resize main frame and its contents
+        for display in [self.ship1_display, self.ship2_display]:
+            self.resize_display(display, width, height)
+            display["drawn"].clear()
+        self.render_dirty = True
+        self.metrics.observe("resize_seconds", time.perf_counter() - start)
 
     def resize_display(self, display, window_width, window_height):
         """Resize the display frame and its contents based on window dimensions."""
@@ -408,150 +4142,338 @@ class ShipTiltDashboard:
         canvas_height = int(frame_height * 0.7)  # 70% of frame height
         display["canvas"].config(width=canvas_width, height=canvas_height)
         
-        # Resize meter image
+        # Resize meter image (fit within canvas dimensions) on the compositor; see apply_compositor_results
+        sprite_size = (int(canvas_width), int(canvas_height))
         if "meter_img" in display:
-            resized_meter = display["meter_img"].resize(
-                (int(canvas_width), int(canvas_height)),  # Fit within canvas dimensions
-                Image.Resampling.LANCZOS
-            )
-            display["meter_tk"] = ImageTk.PhotoImage(resized_meter)
-            display["canvas"].itemconfig("meter", image=display["meter_tk"])
-        
-        # Resize ship image
-        resized_ship = display["ship_img"].resize(
-            (int(canvas_width), int(canvas_height)),  # Fit within canvas dimensions
-            Image.Resampling.LANCZOS
-        )
-        display["ship_tk"] = ImageTk.PhotoImage(resized_ship)
-        display["canvas"].itemconfig("ship", image=display["ship_tk"])
-        
-        # Resize highlighter image
-        resized_highlighter = display["highlighter_img"].resize(
-            (int(canvas_width), int(canvas_height)),  # Fit within canvas dimensions
-            Image.Resampling.LANCZOS
-        )
-        display["highlighter_tk"] = ImageTk.PhotoImage(resized_highlighter)
-        display["canvas"].itemconfig("highlighter", image=display["highlighter_tk"])
+            pyramid = self.asset(display["meter_layer"])
+            self.compositor.submit(("meter", display["meter_layer"]),
+                                   lambda: (sprite_size, pyramid.get(sprite_size)))
         
         # Recalculate center position for images
         center_x = canvas_width // 2
         center_y = canvas_height // 2
         display["canvas"].coords("meter", center_x, center_y)
-        display["canvas"].coords("ship", center_x, center_y)
-        display["canvas"].coords("highlighter", center_x, center_y)
+
+        previous_size, display["sprite_size"] = display["sprite_size"], sprite_size
+        if display["vector_layers"]:
+            self.place_vector_layers(display, sprite_size, display["angle"])
+        else:
+            # Sprites rendered for the previous canvas size are no longer useful; the next
+            # draw_display requests the new ones from the compositor
+            if previous_size != sprite_size:
+                self.sprite_cache.invalidate(keep_size=sprite_size)
+            display["canvas"].coords("ship", center_x, center_y)
+            display["canvas"].coords("highlighter", center_x, center_y)
         
         # Update angle label font size
         new_angle_font_size = max(12, int(window_width / 20))
         display["angle_label"].configure(font=("Helvetica", new_angle_font_size, "bold"))
 
-    def process_hex_data(self, hex_string):
-        """Process hex string with proper handling of negative angles."""
-        try:
-            bytes_data = hex_string.strip().split()
-            
-            if len(bytes_data) != 32:
-                return None, None
-                
-            if bytes_data[0] != '5A' or bytes_data[1] != 'A5' or bytes_data[-1] != 'AA':
-                return None, None
-            
-            s = sum(int(i,16) for i in bytes_data[2:30])
-            
-            if int(bytes_data[-2],16) == s%256:
-                check_status = "checksum verification successful"
+    def update_display(self):
+        """Update the visual display with responsiveness."""
+        if self.pipeline.alarms and self.pipeline.alarms.version != self.alarm_version:
+            self.update_alarm_banner()
+        self.apply_compositor_results()
+        self.scheduler.observe_sample(self.pipeline.latest_sample.seq, time.monotonic())
+        if self.render_mode == "on_change" and not self.pipeline.data_event.is_set() and not self.render_dirty:
+            # Nothing new from the reader: back off towards the idle interval, so a quiet sensor costs a
+            # few wakeups a second, unless the compositor is about to deliver a frame. The first tick that
+            # finds data_event set draws and drops back to the frame interval.
+            self.idle_polls += 1
+            if self.compositor.busy():
+                self.idle_interval = self.scheduler.interval_ms()
             else:
-                check_status = "checksum verification failed"
+                self.idle_interval = min(max(self.idle_interval * 2, self.scheduler.interval_ms()),
+                                         self.scheduler.idle_interval_ms())
+            self.root.after(self.idle_interval, self.update_display)
+            return
+        self.pipeline.data_event.clear()
+        self.idle_interval = self.scheduler.interval_ms()
+        self.render_dirty = False
+        start = time.perf_counter()
 
-            roll_high = int(bytes_data[8], 16)
-            roll_low = int(bytes_data[9], 16)
-            roll_raw = (roll_high << 8) | roll_low
-            
-            pitch_high = int(bytes_data[10], 16)
-            pitch_low = int(bytes_data[11], 16)
-            pitch_raw = (pitch_high << 8) | pitch_low
-            
-            if roll_raw & 0x8000:
-                roll_raw = -((~roll_raw & 0xFFFF) + 1)
-            if pitch_raw & 0x8000:
-                pitch_raw = -((~pitch_raw & 0xFFFF) + 1)
-            
-            roll_angle = roll_raw / self.RESOLUTION_FACTOR
-            pitch_angle = pitch_raw / self.RESOLUTION_FACTOR
-            
-            roll_angle = round(max(min(roll_angle, self.MAX_ANGLE), self.MIN_ANGLE),1)
-            pitch_angle = round(max(min(pitch_angle, self.MAX_ANGLE), self.MIN_ANGLE),1)
-            
-            return roll_angle, pitch_angle, check_status
-            
-        except Exception as e:
-            print(f"Processing error: {e}")
-            return None, None
+        # Read the shared sample once so both displays show the same packet
+        sample = self.pipeline.latest_sample
+        if sample.seq > self.drawn_seq + 1:
+            # Samples replaced by a newer one before a tick picked them up never reach the screen
+            self.metrics.count("frames_dropped", sample.seq - self.drawn_seq - 1)
+        self.drawn_seq = sample.seq
 
-    def read_serial(self):
-        """Read and process serial data."""
-        while self.running:
-            try:
-                if self.serial_port.in_waiting:
-                    line = self.serial_port.readline().decode().strip()
-                    if line:
-                        hex_data = line.replace("Data Packet:", "").strip()
-                        roll, pitch, check_status = self.process_hex_data(hex_data)
-    
-                        if roll is not None and pitch is not None:
-                            self.tilt_angle_1 = roll
-                            self.tilt_angle_2 = pitch
-                            # self.console_queue.put((hex_data, roll, pitch, check_status))
-                            
-            except Exception as e:
-                print(f"Serial read error: {e}")
+        drew_anything = False
+        for display, angle in [(self.ship1_display, sample.roll), 
+                            (self.ship2_display, sample.pitch)]:
+            if self.draw_display(display, angle):
+                drew_anything = True
 
-    def update_display(self):
-        """Update the visual display with responsiveness."""
-        for display, angle in [(self.ship1_display, self.tilt_angle_1), 
-                            (self.ship2_display, self.tilt_angle_2)]:
-            # Get the current canvas dimensions
-            canvas_width = display["canvas"].winfo_width()
-            canvas_height = display["canvas"].winfo_height()
-
-            # Determine the font size dynamically based on the canvas width
-            new_font_size = max(12, int(canvas_width / 10))
-            display["angle_label"].configure(font=("Helvetica", new_font_size, "bold"))
-
-            # Update angle label text and color
-            color = self.get_angle_color(angle)
-            display_angle = abs(angle)  # Display absolute value for negative angles
-            display["angle_label"].configure(text=f"{display_angle}°", text_color=color)
-
-            # Rotate and resize ship images dynamically
-            center_x, center_y = display["center"]
-
-            # Resize and rotate the ship image
-            resized_ship = display["ship_img"].resize((canvas_width, canvas_height), Image.Resampling.LANCZOS)
-            rotated_ship = resized_ship.rotate(-angle, resample=Image.BILINEAR, expand=False)
-            display["ship_tk"] = ImageTk.PhotoImage(rotated_ship)
-
-            # Resize and rotate the highlighter image
-            resized_highlighter = display["highlighter_img"].resize((canvas_width, canvas_height), Image.Resampling.LANCZOS)
-            rotated_highlighter = resized_highlighter.rotate(-angle, resample=Image.BILINEAR, expand=False)
-            display["highlighter_tk"] = ImageTk.PhotoImage(rotated_highlighter)
-
-            # Update the canvas items with the new images
-            display["canvas"].itemconfig(display["ship_canvas_obj"], image=display["ship_tk"])
-            display["canvas"].itemconfig(display["highlighter_canvas_obj"], image=display["highlighter_tk"])
+        if drew_anything:
+            self.frames_drawn += 1
+            self.frame_time.observe(time.perf_counter() - start)
+            if self.pipeline.replay_path is None and sample.seq:
+                self.latency_time.observe(time.time() - sample.timestamp)  # Replayed samples keep their recorded time
+            if self.frames_drawn == 1:
+                self.on_first_frame()
+        else:
+            self.frames_skipped += 1
+
+        # Schedule the next update, less the time this frame took
+        delay = self.scheduler.frame_done(time.perf_counter() - start)
+        self.root.after(delay, self.update_display)
+
+    def apply_compositor_results(self):
+        """Blit meters resized by the compositor and redraw once rendered sprites are ready."""
+        for slot, result in self.compositor.collect().items():
+            if slot[0] == "meter":
+                size, image = result
+                for display in (self.ship1_display, self.ship2_display):
+                    if display["meter_layer"] == slot[1] and display["sprite_size"] in (None, size):
+                        display["meter_tk"] = ImageTk.PhotoImage(image)
+                        display["canvas"].itemconfig("meter", image=display["meter_tk"])
+            else:
+                self.render_dirty = True  # The sprites are in the cache now
+
+    def draw_display(self, display, angle):
+        """Redraw the items of one display whose inputs changed. Returns True if anything was drawn."""
+        drawn = display["drawn"]
+        continuous = self.render_mode == "continuous"
+
+        # Get the current canvas dimensions
+        canvas_width = display["canvas"].winfo_width()
+        canvas_height = display["canvas"].winfo_height()
+        sprite_size = (canvas_width, canvas_height)
+
+        # Determine the font size dynamically based on the canvas width
+        font = ("Helvetica", max(12, int(canvas_width / 10)), "bold")
+        color = self.get_angle_color(angle)
+        text = format_angle(angle)
+
+        changed = False
+        start = time.perf_counter()
+        if continuous or drawn.get("font") != font:
+            display["angle_label"].configure(font=font)
+            drawn["font"] = font
+            changed = True
+
+        # Update angle label text and color
+        if continuous or drawn.get("text") != text or drawn.get("color") != color:
+            display["angle_label"].configure(text=text, text_color=color)
+            drawn["text"] = text
+            drawn["color"] = color
+            changed = True
+        if changed:
+            self.label_time.observe(time.perf_counter() - start)
+
+        rotate = continuous or drawn.get("angle") != angle or drawn.get("size") != sprite_size
+        if rotate and display["vector_layers"]:
+            # Rotate the traced polygons; this also centres them for a new canvas size
+            start = time.perf_counter()
+            self.place_vector_layers(display, sprite_size, angle)
+            self.vector_time.observe(time.perf_counter() - start)
+            display["angle"] = angle
+            drawn["angle"] = angle
+            drawn["size"] = sprite_size
+            changed = True
+
+        elif rotate:
+            # Look up the pre-rendered ship and highlighter sprites for this angle
+            ship_tk = self.sprite_cache.lookup(display["ship_layer"], sprite_size, angle)
+            highlighter_tk = self.sprite_cache.lookup(display["highlighter_layer"], sprite_size, angle)
+            if ship_tk is None or highlighter_tk is None:
+                # Not rendered yet: keep showing the previous frame and let the compositor render this
+                # one; a newer angle arriving meanwhile replaces the request
+                self.compositor.submit(("sprites", display["ship_layer"]), self.sprite_cache.fill,
+                                       (display["ship_layer"], display["highlighter_layer"]), sprite_size, angle,
+                                       self.sprite_cache.generation)
+            else:
+                display["ship_tk"] = ship_tk
+                display["highlighter_tk"] = highlighter_tk
+                display["angle"] = angle
+
+                # Update the canvas items with the new images
+                start = time.perf_counter()
+                display["canvas"].itemconfig(display["ship_canvas_obj"], image=display["ship_tk"])
+                display["canvas"].itemconfig(display["highlighter_canvas_obj"], image=display["highlighter_tk"])
+                self.itemconfig_time.observe(time.perf_counter() - start)
+                drawn["angle"] = angle
+                changed = True
 
+            # Render neighbouring angles in the background for the next frames
+            self.sprite_cache.prefetch(display["ship_layer"], sprite_size, angle)
+            self.sprite_cache.prefetch(display["highlighter_layer"], sprite_size, angle)
+
+        if not display["vector_layers"] and (continuous or drawn.get("size") != sprite_size):
             # Recalculate the center position for the images
             center_x = canvas_width // 2
             center_y = canvas_height // 2
             display["canvas"].coords(display["ship_canvas_obj"], center_x, center_y)
             display["canvas"].coords(display["highlighter_canvas_obj"], center_x, center_y)
+            drawn["size"] = sprite_size
+            changed = True
+
+        return changed
+
+    def update_alarm_banner(self):
+        """Show the active alarms under the title, or hide the banner when there are none."""
+        self.alarm_version = self.pipeline.alarms.version
+        active = sorted(self.pipeline.alarms.active.values(), key=lambda event: event.timestamp)
+        if active:
+            text = "   ".join(f"{event.rule}{f' [{event.sensor}]' if event.sensor else ''}: {event.value:.1f}"
+                             for event in active)
+            self.alarm_banner.configure(text=f"ALARM  {text}")
+            if not self.alarm_banner_shown:
+                self.alarm_banner.pack(fill="x", pady=(0, 20), after=self.title_frame)
+                self.alarm_banner_shown = True
+        elif self.alarm_banner_shown:
+            self.alarm_banner.pack_forget()
+            self.alarm_banner_shown = False
+
+    def update_sea_state(self):
+        """Show the newest sea-state result under the angles, warnings in orange on the roll gauge."""
+        result = self.pipeline.sea_state.latest
+        if result is not None and result is not self.sea_state_shown:
+            self.sea_state_shown = result
+            for display, axis in ((self.ship1_display, "roll"), (self.ship2_display, "pitch")):
+                stats = result[axis]
+                period = f"{stats['period']:.1f} s" if stats["period"] else "--"
+                text = f"Period {period}   Sig. ±{stats['peak_to_peak'] / 2:.1f}°   RMS {stats['rms']:.1f}°"
+                color = "#AAAAAA"
+                if axis == "roll" and result["warnings"]:
+                    text = f"{', '.join(result['warnings']).upper()}   {text}"
+                    color = "#FFA500"
+                display["sea_label"].configure(text=text, text_color=color)
+        self.root.after(TREND_INTERVAL_MS, self.update_sea_state)
+
+    def update_trends(self):
+        """Redraw both trend charts from the history and schedule the next redraw."""
+        start = time.perf_counter()
+        for display, axis in ((self.ship1_display, 0), (self.ship2_display, 1)):
+            self.draw_trend(display, axis)
+        self.metrics.observe("trend_seconds", time.perf_counter() - start)
+        self.root.after(TREND_INTERVAL_MS, self.update_trends)
+
+    def draw_trend(self, display, axis):
+        """Draw the min/max envelope of one axis, one column per pixel, as a single canvas line."""
+        canvas = display["trend_canvas"]
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        trend = self.pipeline.history.trend(self.trend_span, width, axis)
+        if trend is None or width < 2:
+            return
+        lows, highs = trend
+
+        # Symmetric scale in steps of 5°, at least ±5°
+        extreme = max((abs(v) for v in lows + highs if v is not None), default=0)
+        limit = max(5, 5 * math.ceil(extreme / 5))
+        middle = height / 2
+        scale = (height / 2 - 2) / limit
+
+        # Snake through the columns (low to high, then high to low) so one line draws the envelope
+        coords = []
+        for x, (low, high) in enumerate(zip(lows, highs)):
+            if low is None:
+                continue
+            top, bottom = middle - high * scale, middle - low * scale
+            coords += (x, bottom, x, top) if x % 2 else (x, top, x, bottom)
+        if len(coords) < 4:
+            coords = [0, middle, 0, middle]
+        canvas.coords("envelope", coords)
+        canvas.coords("zero", 0, middle, width, middle)
+        span = self.trend_span
+        span_text = f"{span / 3600:g} h" if span >= 3600 else f"{span / 60:g} min" if span >= 60 else f"{span:g} s"
+        canvas.itemconfig("label", text=f"±{limit}°  last {span_text}")
+
+    def place_vector_layers(self, display, size, angle):
+        """Move the traced polygons of a display to the canvas size and angle."""
+        canvas = display["canvas"]
+        center = (size[0] // 2, size[1] // 2)
+        for shapes, items in display["vector_layers"]:
+            for item, coords in zip(items, place_shapes(shapes, size, center, angle)):
+                canvas.coords(item, coords)
+
+    def on_first_frame(self):
+        """Report startup timing and refresh the asset atlas once the first frame is on screen."""
+        startup_timer.mark("first frame")
+        startup_timer.report(self.startup_report_path)
+        if self.atlas_stale and all(path in self.assets for path in ASSET_FILES):
+            self.atlas_stale = False
+            pyramids = {path: self.assets[path] for path in ASSET_FILES}
+            threading.Thread(target=self.save_atlas, args=(pyramids,), daemon=True).start()
+
+    def save_atlas(self, pyramids):
+        try:
+            self.atlas.save(pyramids)
+        except OSError as e:
+            print(f"Could not write asset atlas: {e}")
+
+    def render_stats(self):
+        """Return how many update ticks drew something, how many drew nothing and how many idled."""
+        return {"mode": self.render_mode, "drawn": self.frames_drawn, "skipped": self.frames_skipped,
+                "idle_polls": self.idle_polls}
+
+    def toggle_low_power(self):
+        """Switch between the full redraw rate and the night-watch low-power rate."""
+        self.scheduler.set_low_power(not self.scheduler.low_power)
+        print(f"Low-power mode {'on' if self.scheduler.low_power else 'off'}: "
+              f"redrawing at up to {1000 / self.scheduler.interval_ms():.0f} fps")
+
+    def toggle_overlay(self):
+        """Show or hide the on-screen metrics overlay."""
+        if self.overlay_label is None:
+            self.overlay_label = ctk.CTkLabel(self.root, text="", font=("Courier", 12), text_color="#FFFF00",
+                                              fg_color="black", justify="left", anchor="nw")
+            self.overlay_label.place(x=10, y=10)
+            self.overlay_marks = {name: h.state() for name, h in list(self.metrics.histograms.items())}
+            self.update_overlay()
+        else:
+            if self.overlay_after_id is not None:
+                self.root.after_cancel(self.overlay_after_id)
+                self.overlay_after_id = None
+            self.overlay_label.destroy()
+            self.overlay_label = None
 
-        # Schedule the next update
-        self.root.after(16, self.update_display)
+    def update_overlay(self):
+        """Refresh the overlay with rates, error counts and timings since the previous refresh."""
+        snapshot = self.metrics.snapshot()
+        lines = [f"{name:<32}{value:10.1f}" for name, value in sorted(snapshot["rates"].items())]
+        for name, value in sorted(snapshot["gauges"].items()):
+            if name.endswith(("checksum_failures", "resyncs", "errors", "dropped")):
+                lines.append(f"{name:<32}{value:10}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name:<32}{value:10}")
+        schedule = self.scheduler.stats()
+        lines.append(f"{'redraw fps (' + schedule['limit'] + ')':<32}{schedule['target_fps']:10.1f}")
+        lines.append(f"{'frame overruns':<32}{schedule['overruns']:10}")
+        lines.append(f"{'timing (ms)':<32}{'n':>6}{'p50':>9}{'p99':>9}")
+        for name, histogram in sorted(self.metrics.histograms.items()):
+            summary = histogram.summary(self.overlay_marks.get(name))
+            self.overlay_marks[name] = histogram.state()
+            if summary["count"]:
+                lines.append(f"{name.replace('_seconds', ''):<32}{summary['count']:6}"
+                             f"{summary['p50'] * 1000:9.3f}{summary['p99'] * 1000:9.3f}")
+        if self.pipeline.latest_packet:
+            # Fields the dashboard doesn't interpret yet, for checking a new firmware against its layout
+            packet = self.pipeline.packet_layout.decode(self.pipeline.latest_packet)
+            lines.append(f"{'last packet':<32}{'valid' if packet.valid else 'INVALID':>10}")
+            for name, value in packet.as_dict().items():
+                if isinstance(value, bytes):
+                    lines.append(f"  {name:<12}{value.hex(' ').upper()}")
+        self.overlay_label.configure(text="\n".join(lines))
+        self.overlay_label.lift()
+        self.overlay_after_id = self.root.after(1000, self.update_overlay)
 
     def on_close(self):
-        self.running = False
+        stats = self.render_stats()
+        print(f"Render ({stats['mode']}): {stats['drawn']} frames drawn, {stats['skipped']} skipped, "
+              f"{stats['idle_polls']} idle polls")
+        stats = self.scheduler.stats()
+        print(f"Frame scheduler: {stats['target_fps']} fps target ({stats['limit']} limited), "
+              f"{stats['frame_cost_ms']} ms per frame, {stats['overruns']} overruns, "
+              f"{stats['ticks_skipped']} ticks skipped")
+        self.pipeline.report()
         # self.console_queue.put((None, None, None))  # Signal console thread to exit
-        self.serial_port.close()
+        if self.stream:
+            self.stream.stop()
+        self.pipeline.stop()
+        self.compositor.shutdown()
         self.root.destroy()
 
     # def start_console_thread(self):
@@ -579,13 +4501,202 @@ class ShipTiltDashboard:
     #         except Exception as e:
     #             print(f"Console update thread error: {e}")
     #             break
-    
+
+class HeadlessStreamer:
+    """Acquisition plus the offscreen gauge stream, without Tk (--headless), e.g. on a bridge server."""
+
+    def __init__(self, stream_address, input_mode="hex", baud_rate=9600, port="auto", stream_size=STREAM_SIZE,
+                 stream_fps=STREAM_FPS, use_startup_cache=True, replay_path=None, sensors=None, **acquisition):
+        if port == "select":
+            raise ValueError("the port selector needs a window, pass a port name or \"auto\"")
+        # No port selector without a window: "auto" has to find exactly one inclinometer
+        serial_port = None
+        if replay_path is None and not sensors:
+            selected_port = port
+            if port == "auto":
+                probe_results = auto_detect_port(baud_rate, use_startup_cache)
+                if len(probe_results) != 1:
+                    raise RuntimeError(f"{len(probe_results)} inclinometers detected, choose one with --port")
+                selected_port = probe_results[0].device
+                baud_rate = probe_results[0].baud_rate
+                input_mode = probe_results[0].input_mode
+                save_cached_port(probe_results[0])
+            import serial
+            serial_port = serial.Serial(selected_port, baud_rate, timeout=1)
+            print(f"Connected to port: {selected_port}")
+
+        self.pipeline = AcquisitionPipeline(serial_port, input_mode, replay_path=replay_path, sensors=sensors,
+                                            baud_rate=baud_rate, **acquisition)
+        self.atlas = AssetAtlas(os.path.join(CACHE_DIR, "assets.atlas")) if use_startup_cache else None
+        self.assets = (self.atlas.load(ASSET_FILES) if self.atlas else None) or {}
+        self.stream = GaugeStream(self.pipeline, lambda path: load_asset(self.assets, path), stream_address,
+                                  stream_size, stream_fps)
+        self.stream.start()
+        self.pipeline.start()
+
+    def run(self):
+        """Serve until Ctrl-C or the end of a replay."""
+        try:
+            while self.pipeline.alive():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        self.pipeline.report()
+        self.stream.stop()
+        self.pipeline.stop()
+
+def parse_args():
+    """Command line options for the dashboard."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ship Tilt Dashboard")
+    parser.add_argument("--input-mode", choices=("hex", "binary"), default="hex",
+                        help="serial data format sent by the inclinometer firmware")
+    parser.add_argument("--packet-layout", choices=tuple(PACKET_LAYOUTS), default="default",
+                        help="field layout of the 32-byte packet for the inclinometer firmware variant")
+    parser.add_argument("--port", default="auto",
+                        help="serial port to open, \"auto\" to detect the inclinometer (default) or \"select\" "
+                             "to always choose from a list")
+    parser.add_argument("--baud", type=int, default=9600, help="serial baud rate (tried first when detecting)")
+    parser.add_argument("--render-mode", choices=("on_change", "continuous"), default="on_change",
+                        help="redraw only on new data or on every tick")
+    parser.add_argument("--render-backend", choices=("bitmap", "vector"), default="bitmap",
+                        help="rotate cached ship bitmaps or polygons traced from them (cost independent "
+                             "of window size)")
+    parser.add_argument("--trend-minutes", type=float, default=10.0,
+                        help="time span of the trend charts under the gauges, 0 hides them")
+    parser.add_argument("--history-samples", type=int, default=864000,
+                        help="samples kept for the trend charts (default: 24 h at 10 Hz)")
+    parser.add_argument("--sea-state-minutes", type=float, default=20.0,
+                        help="window of the roll/pitch period and amplitude analysis, 0 turns it off")
+    parser.add_argument("--natural-roll-period", type=float, metavar="SECONDS",
+                        help="the ship's natural roll period, compared against the wave encounter period "
+                             "for resonance and parametric roll warnings (default: the measured roll period)")
+    parser.add_argument("--alarm", action="append", metavar="NAME=EXPR",
+                        help="alarm rule (repeatable), e.g. heel=abs(roll)>15,hysteresis=1,for=2 or "
+                             "roll-rate=rate(roll)>5; EXPR compares roll, pitch, abs(...) or rate(...) in °/s")
+    parser.add_argument("--sensor", action="append", metavar="NAME=PORT",
+                        help="read several inclinometers, e.g. --sensor bow=COM3 --sensor stern=COM4")
+    parser.add_argument("--filter", action="append", metavar="AXIS=SPEC",
+                        help="smooth roll, pitch or both (all), e.g. --filter roll=ema:0.3 "
+                             "--filter pitch=median:5; filters: ema:ALPHA, mean:N, median:N, "
+                             "kalman:Q:R, none")
+    parser.add_argument("--no-startup-cache", action="store_true",
+                        help="ignore the cached authentication result and asset atlas")
+    parser.add_argument("--startup-report", metavar="FILE", help="write startup timing milestones as JSON")
+    parser.add_argument("--serve", action="append", metavar="ENDPOINT",
+                        help="broadcast samples on tcp:HOST:PORT, udp:HOST:PORT or unix:PATH (repeatable)")
+    parser.add_argument("--metrics", metavar="[HOST:]PORT",
+                        help="serve counters and timings at http://HOST:PORT/metrics (text) and /metrics.json")
+    parser.add_argument("--metrics-overlay", action="store_true",
+                        help="show the metrics overlay on start (F3 toggles it)")
+    parser.add_argument("--stream", metavar="[HOST:]PORT",
+                        help="serve the gauges as an MJPEG stream and PNG snapshots at http://HOST:PORT/ "
+                             "for other monitors")
+    parser.add_argument("--stream-size", default=f"{STREAM_SIZE[0]}x{STREAM_SIZE[1]}", metavar="WxH",
+                        help="frame size of the stream")
+    parser.add_argument("--stream-fps", type=float, default=STREAM_FPS, help="highest frame rate of the stream")
+    parser.add_argument("--headless", action="store_true",
+                        help="no window, only acquisition and the --stream server (needs --stream, and a port "
+                             "name or auto for --port)")
+    parser.add_argument("--low-power", action="store_true",
+                        help=f"redraw at most {LOW_POWER_FPS} times a second, e.g. for night watches (F4 toggles it)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="append every received packet to a recording; with --sensor, one recording per "
+                             "sensor named FILE.NAME.ext")
+    parser.add_argument("--archive", metavar="DIR",
+                        help="keep roll and pitch in a time-indexed archive for SAP_Archive.py queries; with "
+                             "--sensor, one archive per sensor in DIR/NAME")
+    parser.add_argument("--replay", metavar="FILE", help="show a recording instead of a serial port")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="N",
+                        help="replay at N times real time")
+    args = parser.parse_args()
+    if args.replay_speed <= 0:
+        parser.error("--replay-speed must be positive")
+    if args.trend_minutes < 0 or args.history_samples < 1:
+        parser.error("--trend-minutes must not be negative and --history-samples must be positive")
+    sensors = []
+    for item in args.sensor or []:
+        name, _, device = item.partition("=")
+        if not name or not device:
+            parser.error(f"--sensor expects NAME=PORT, got {item!r}")
+        sensors.append((name, device))
+    args.sensors = sensors or None
+    filters = {}
+    for item in args.filter or []:
+        axis, _, spec = item.partition("=")
+        if axis not in ("roll", "pitch", "all") or not spec:
+            parser.error(f"--filter expects roll=SPEC, pitch=SPEC or all=SPEC, got {item!r}")
+        try:
+            make_filter(spec)
+        except ValueError as e:
+            parser.error(str(e))
+        for name in (("roll", "pitch") if axis == "all" else (axis,)):
+            filters[name] = spec
+    args.filters = filters
+    for spec in args.alarm or []:
+        try:
+            make_alarm_rule(spec)
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        args.serve = [parse_endpoint(spec) for spec in args.serve or []] or None
+        args.metrics = parse_metrics_address(args.metrics) if args.metrics else None
+        args.stream = parse_metrics_address(args.stream) if args.stream else None
+    except ValueError as e:
+        parser.error(str(e))
+    width, _, height = args.stream_size.partition("x")
+    if not (width.isdigit() and height.isdigit() and int(width) > 0 and int(height) > 0):
+        parser.error(f"--stream-size expects WxH, got {args.stream_size!r}")
+    args.stream_size = (int(width), int(height))
+    if args.stream_fps <= 0:
+        parser.error("--stream-fps must be positive")
+    if args.headless and not args.stream:
+        parser.error("--headless needs --stream")
+    if args.headless and args.port == "select":
+        parser.error("--headless can't show the port selector, pass --port PORT or --port auto")
+    return args
+
 if __name__ == "__main__":
+    args = parse_args()
+    startup_timer.mark("imports")
     # Authenticate device before proceeding
-    authenticate_device(ALLOWED_SERIAL_NUMBER)
+    authenticate_device(ALLOWED_SERIAL_NUMBER, use_cache=not args.no_startup_cache)
+    startup_timer.mark("authenticated")
+    if args.headless:
+        try:
+            app = HeadlessStreamer(args.stream, input_mode=args.input_mode, baud_rate=args.baud, port=args.port,
+                                   stream_size=args.stream_size, stream_fps=args.stream_fps,
+                                   use_startup_cache=not args.no_startup_cache, replay_path=args.replay,
+                                   sensors=args.sensors, record_path=args.record, replay_speed=args.replay_speed,
+                                   filters=args.filters, serve=args.serve, metrics_address=args.metrics,
+                                   history_capacity=args.history_samples, alarms=args.alarm,
+                                   packet_layout_name=args.packet_layout,
+                                   sea_state_window=args.sea_state_minutes * 60,
+                                   natural_roll_period=args.natural_roll_period, archive_path=args.archive)
+        except Exception as e:
+            print(f"Error: {e}")
+            exit(1)
+        app.run()
+        exit(0)
+    import_gui()
+    startup_timer.mark("gui imported")
     ctk.set_appearance_mode("dark")  # Set dark mode
     ctk.set_default_color_theme("blue")  # Set green theme
     root = ctk.CTk()
-    app = ShipTiltDashboard(root)
+    startup_timer.mark("window created")
+    app = ShipTiltDashboard(root, render_mode=args.render_mode, input_mode=args.input_mode, baud_rate=args.baud,
+                            record_path=args.record, replay_path=args.replay, replay_speed=args.replay_speed,
+                            sensors=args.sensors, filters=args.filters,
+                            use_startup_cache=not args.no_startup_cache, startup_report_path=args.startup_report,
+                            serve=args.serve, metrics_address=args.metrics,
+                            metrics_overlay=args.metrics_overlay, port=args.port,
+                            render_backend=args.render_backend, trend_span=args.trend_minutes * 60,
+                            history_capacity=args.history_samples, alarms=args.alarm,
+                            packet_layout_name=args.packet_layout, low_power=args.low_power,
+                            sea_state_window=args.sea_state_minutes * 60,
+                            natural_roll_period=args.natural_roll_period, archive_path=args.archive,
+                            stream_address=args.stream, stream_size=args.stream_size,
+                            stream_fps=args.stream_fps)
     root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
\ No newline at end of file
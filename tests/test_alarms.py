@@ -0,0 +1,86 @@
+"""AlarmRule and AlarmEngine: raise after the hold time, stay raised until clear of the hysteresis band."""
+import pytest
+
+import SAP_Production as sap
+
+
+def feed(rule, values, step=0.1):
+    """Transitions as (time, state) for values sampled every step seconds."""
+    transitions = []
+    for i, value in enumerate(values):
+        transition = rule.update(i * step, value)
+        if transition:
+            transitions.append((round(i * step, 3), transition[0]))
+    return transitions
+
+
+def test_hysteresis_keeps_alarm_latched_near_the_limit():
+    rule = sap.make_alarm_rule("heel=abs(roll)>15,hysteresis=1")
+
+    # Raised at 15.5, still active at 14.5 and -14.2 (magnitude), cleared only below 14
+    assert feed(rule, [10, 15.5, 14.5, 15.2, -14.2, 14.1, 13.9, 14.5, 16]) == [
+        (0.1, "raised"), (0.6, "cleared"), (0.8, "raised")]
+
+
+def test_exactly_at_limit_does_not_raise():
+    rule = sap.make_alarm_rule("trim=pitch<-3")
+
+    assert feed(rule, [-2, -3, -3.0]) == []
+    assert feed(rule, [-3.1]) == [(0.0, "raised")]
+
+
+def test_hold_time_resets_when_the_value_drops_back():
+    rule = sap.make_alarm_rule("heel=roll>10,for=0.3")
+
+    # 0.1..0.3 above (0.2 s), a dip resets the timer, then 0.5..0.8 above for 0.3 s raises
+    assert feed(rule, [0, 11, 11, 11, 5, 11, 11, 11, 11]) == [(0.8, "raised")]
+
+
+def test_rate_is_measured_over_the_window():
+    rule = sap.make_alarm_rule("roll-rate=rate(roll)>5,window=1,hysteresis=0")
+
+    # 0.1° per 0.1 s is 1°/s; then 1° per 0.1 s is 10°/s, seen once a whole window has passed
+    values = [i * 0.1 for i in range(11)] + [1 + i for i in range(1, 11)] + [11] * 10
+    transitions = feed(rule, values)
+
+    assert transitions == [(2.0, "raised"), (3.0, "cleared")]
+
+
+def test_invalid_specs():
+    for spec in ("heel", "heel=yaw>3", "heel=roll>3,delay=1", "heel=roll=3"):
+        with pytest.raises(ValueError):
+            sap.make_alarm_rule(spec)
+    with pytest.raises(ValueError):
+        sap.AlarmEngine(["heel=roll>3", "bad"])
+
+
+def test_engine_tracks_state_per_sensor_and_notifies_listeners():
+    engine = sap.AlarmEngine(["heel=abs(roll)>15,hysteresis=1", "trim=pitch>2"], sap.Metrics())
+    events = []
+    engine.subscribe(events.append)
+
+    engine.evaluate(0.0, 16, 0, "bow")
+    engine.evaluate(0.0, 5, 3, "stern")
+    engine.evaluate(0.1, 14.5, 0, "bow")  # Inside the hysteresis band: bow stays raised
+
+    assert sorted(engine.active) == [("heel", "bow"), ("trim", "stern")]
+    assert [(event.rule, event.state, event.sensor) for event in events] == [
+        ("heel", "raised", "bow"), ("trim", "raised", "stern")]
+
+    engine.evaluate(0.2, 13, 0, "bow")
+    engine.evaluate(0.2, 5, 1, "stern")
+
+    assert engine.active == {}
+    assert engine.version == 4
+    assert [event.state for event in events[2:]] == ["cleared", "cleared"]
+
+
+def test_failing_listener_does_not_stop_the_others():
+    engine = sap.AlarmEngine(["heel=roll>1"])
+    events = []
+    engine.subscribe(lambda event: 1 / 0)
+    engine.subscribe(events.append)
+
+    engine.evaluate(0.0, 2, 0)
+
+    assert [event.state for event in events] == ["raised"]
@@ -0,0 +1,182 @@
+"""ArchiveWriter and SampleArchive: samples and their summaries come back as written."""
+import math
+
+import pytest
+
+import SAP_Production as sap
+
+np = pytest.importorskip("numpy")
+
+DAY = 86400
+START = 19000 * DAY + DAY - 1800  # Half an hour before a UTC midnight, so the data spans two day files
+
+
+def motion(count, rate=2.0):
+    times = START + np.arange(count) / rate
+    rolls = np.round(15 * np.sin(np.arange(count) / 40), 1)
+    pitches = np.round(-3 + 2 * np.cos(np.arange(count) / 97), 1)
+    return times, rolls, pitches
+
+
+def write_archive(path, times, rolls, pitches):
+    writer = sap.ArchiveWriter(str(path))
+    for sample in zip(times, rolls, pitches):
+        writer.append(*sample)
+    writer.close()
+    return writer
+
+
+def expected_stats(times, rolls, pitches, start, end):
+    mask = (times >= start) & (times < end)
+    return {"count": int(mask.sum()),
+            "roll": (rolls[mask].min(), rolls[mask].max(), rolls[mask].mean()),
+            "pitch": (pitches[mask].min(), pitches[mask].max(), pitches[mask].mean())}
+
+
+@pytest.fixture
+def archive(tmp_path):
+    times, rolls, pitches = motion(7200)  # One hour at 2 Hz
+    writer = write_archive(tmp_path, times, rolls, pitches)
+    assert writer.samples_written == len(times)
+    return sap.SampleArchive(str(tmp_path)), (times, rolls, pitches)
+
+
+def test_raw_samples_round_trip(archive):
+    archive, (times, rolls, pitches) = archive
+
+    samples = archive.samples(times[0], times[-1] + 1)
+
+    assert np.allclose(samples["time"], times, atol=1e-3)
+    assert samples["roll"].tolist() == rolls.tolist()
+    assert samples["pitch"].tolist() == pitches.tolist()
+    assert len(archive.days(0)) == 2
+
+
+@pytest.mark.parametrize("offset, span", [(0, 3600), (0.3, 59.9), (123.25, 1900), (1700, 200)])
+def test_stats_match_the_samples(archive, offset, span):
+    archive, (times, rolls, pitches) = archive
+    start, end = START + offset, START + offset + span
+
+    result = archive.stats(start, end)
+    expected = expected_stats(times, rolls, pitches, start, end)
+
+    assert not result["approximate"]
+    assert result["count"] == expected["count"]
+    for axis in ("roll", "pitch"):
+        minimum, maximum, mean = expected[axis]
+        assert result[axis]["min"] == minimum
+        assert result[axis]["max"] == maximum
+        assert math.isclose(result[axis]["mean"], mean, abs_tol=1e-9)
+
+
+def test_series_picks_a_level_by_resolution(archive):
+    archive, (times, rolls, _) = archive
+
+    overview = archive.series(START, START + 3600, points=100)
+    detail = archive.series(START, START + 30, points=100)
+    raw = archive.series(START, START + 0.05, points=100)  # Raw samples count as 1 ms buckets
+
+    assert overview["level"] == "1m"
+    assert overview["count"].sum() == len(times)
+    assert overview["roll_max"].max() == rolls.max()
+    assert detail["level"] == "1s"
+    assert detail["count"].tolist() == [2] * 30
+    assert raw["level"] == "raw"
+    assert raw["roll_mean"].tolist() == [rolls[0]]
+
+
+def test_empty_range(archive):
+    archive, _ = archive
+
+    result = archive.stats(START - 7200, START - 3600)
+
+    assert result["count"] == 0 and result["roll"]["min"] is None
+
+
+def test_summaries_rebuilt_after_a_crash(tmp_path):
+    times, rolls, pitches = motion(600)
+    write_archive(tmp_path, times, rolls, pitches)
+    for level in ("1s", "1m", "1h"):
+        (tmp_path / f"{sap.archive_day_name(19000)}.{level}").unlink()  # Lost before they were written
+
+    sap.ArchiveWriter(str(tmp_path)).close()  # Catches up on start
+    result = sap.SampleArchive(str(tmp_path)).stats(START, START + 300)
+
+    assert result["count"] == 600
+    assert result["roll"]["max"] == rolls.max()
+
+
+COMPACT_DAY = 19000
+TODAY = COMPACT_DAY + 40
+
+
+@pytest.fixture
+def compacted(tmp_path):
+    """100 samples at 1 Hz on days 4, 5, 9, 10 and 39 of the range, each written in two sessions."""
+    days = [COMPACT_DAY + offset for offset in (4, 5, 9, 10, 39)]
+    for half in (0, 1):
+        times = np.concatenate([day * DAY + 3600.5 + half * 50 + np.arange(50) for day in days])
+        rolls = np.round(np.sin(times / 7) * 5, 1)
+        write_archive(tmp_path, times, rolls, -rolls)
+    before = {day: sap.SampleArchive(str(tmp_path)).stats(day * DAY + 3610.7, day * DAY + 3650.7) for day in days}
+    report = sap.compact_archive(str(tmp_path), keep_raw_days=30, keep_1s_days=35, now=TODAY * DAY + 3600)
+    return sap.SampleArchive(str(tmp_path)), report, before
+
+
+def test_compaction_retention_boundaries(compacted):
+    archive, report, _ = compacted
+
+    # Raw goes for days before today - 30, 1 s summaries before today - 35; yesterday and today stay as written
+    assert archive.days(0) == [COMPACT_DAY + 10, COMPACT_DAY + 39]
+    assert archive.days(1) == [COMPACT_DAY + offset for offset in (5, 9, 10, 39)]
+    assert archive.days(2) == archive.days(3) == [COMPACT_DAY + offset for offset in (4, 5, 9, 10, 39)]
+    assert report["days_rewritten"] == 4
+    assert report["raw_days_removed"] == 3
+    assert report["1s_days_removed"] == 1
+    assert report["bytes_after"] < report["bytes_before"]
+
+
+def test_compaction_merges_summary_blocks(compacted):
+    archive, _, _ = compacted
+
+    for offset in (4, 5, 9, 10):
+        day = COMPACT_DAY + offset
+        for level in (1, 2, 3):
+            if archive.has(day, level):
+                assert len(archive.index(day, level)) == 1
+        assert archive.stats(day * DAY + 3600, day * DAY + 3700)["count"] == 100
+    assert len(archive.index(COMPACT_DAY + 39, 1)) == 2  # Not finished yet, left alone
+
+
+def test_stats_after_compaction(compacted):
+    archive, _, before = compacted
+
+    # Raw kept: exact as before compaction
+    kept = archive.stats((COMPACT_DAY + 10) * DAY + 3610.7, (COMPACT_DAY + 10) * DAY + 3650.7)
+    assert not kept["approximate"] and kept["count"] == before[COMPACT_DAY + 10]["count"] == 40
+
+    # Raw gone: the unaligned edges come from the 1 s buckets that overlap them
+    day = COMPACT_DAY + 9
+    approximate = archive.stats(day * DAY + 3610.7, day * DAY + 3650.7)
+    assert not before[day]["approximate"] and before[day]["count"] == 40
+    assert approximate["approximate"] and approximate["count"] == 41  # Whole bucket 3610 s
+
+    # Aligned to the remaining 1 s buckets: still exact
+    aligned = archive.stats(day * DAY + 3610, day * DAY + 3650)
+    assert not aligned["approximate"] and aligned["count"] == 40
+
+    # Raw and 1 s gone: falls back to the 1 min buckets
+    day = COMPACT_DAY + 4
+    coarse = archive.stats(day * DAY + 3610.7, day * DAY + 3650.7)
+    assert coarse["approximate"] and coarse["count"] == 60
+
+
+def test_series_after_compaction(compacted):
+    archive, _, _ = compacted
+    day = COMPACT_DAY + 9
+
+    series = archive.series(day * DAY + 3600, day * DAY + 3700, points=200)
+
+    assert series["level"] == "1s"
+    assert series["count"].sum() == 100
+    assert archive.series(day * DAY, day * DAY + 3600) is None
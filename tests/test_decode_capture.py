@@ -0,0 +1,104 @@
+"""decode_capture() must pick the frames PacketFramer picks and decode them like process_hex_data.
+
+process_hex_data is the dashboard's original line decoder and does its own angle arithmetic, so a bug
+shared by angle_from_raw, angle_table and the layouts can't cancel out here.
+"""
+import random
+
+import pytest
+
+import SAP_Production as sap
+
+np = pytest.importorskip("numpy")
+
+
+def build_packet(rng):
+    """A valid packet with random payload, so roll and pitch cover the whole raw range."""
+    packet = bytearray(rng.randrange(256) for _ in range(sap.PACKET_SIZE))
+    packet[0] = sap.HEADER_HIGH
+    packet[1] = sap.HEADER_LOW
+    packet[30] = sum(packet[2:30]) & 0xFF
+    packet[31] = sap.TERMINATOR
+    return bytes(packet)
+
+
+def capture(count, corruption_rate, seed=0):
+    """Packets with flipped bytes, truncated frames and stray bytes between them."""
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(count):
+        packet = build_packet(rng)
+        roll = rng.random()
+        if roll < corruption_rate / 3:
+            damaged = bytearray(packet)
+            damaged[rng.randrange(len(damaged))] ^= 0xFF
+            packet = bytes(damaged)
+        elif roll < 2 * corruption_rate / 3:
+            packet = packet[:rng.randrange(1, len(packet))]
+        elif roll < corruption_rate:
+            packet = bytes((sap.HEADER_HIGH, sap.HEADER_LOW)) + packet  # False header right before a frame
+        parts.append(packet)
+    return b"".join(parts)
+
+
+CHECK_STATUS = {True: "checksum verification successful", False: "checksum verification failed"}
+
+
+def reference_decode(data):
+    """Frames from PacketFramer, values and checksum status from process_hex_data."""
+    framer = sap.PacketFramer()
+    offsets, rolls, pitches, checksums = [], [], [], []
+    for packet, checksum_ok in framer.feed(data):
+        roll, pitch, check_status = sap.process_hex_data(bytes(packet).hex(" ").upper())
+        assert check_status == CHECK_STATUS[checksum_ok]
+        offsets.append(framer.position - sap.PACKET_SIZE)
+        rolls.append(roll)
+        pitches.append(pitch)
+        checksums.append(check_status == CHECK_STATUS[True])
+    return offsets, rolls, pitches, checksums
+
+
+def assert_matches_reference(decoded, data):
+    offsets, rolls, pitches, checksums = reference_decode(data)
+    assert decoded["offset"].tolist() == offsets
+    assert decoded["roll"].tolist() == rolls
+    assert decoded["pitch"].tolist() == pitches
+    assert decoded["checksum_ok"].tolist() == checksums
+
+
+@pytest.mark.parametrize("corruption_rate", [0.0, 0.05, 0.3])
+@pytest.mark.parametrize("chunk_size", [1 << 24, 1000])
+def test_matches_reference_decoder(corruption_rate, chunk_size):
+    data = capture(5000, corruption_rate)
+
+    assert_matches_reference(sap.decode_capture(data, chunk_size=chunk_size), data)
+
+
+def test_corrupt_checksums_and_truncated_packets():
+    rng = random.Random(1)
+    good = [build_packet(rng) for _ in range(4)]
+    bad_checksum = bytearray(build_packet(rng))
+    bad_checksum[30] ^= 0x01
+    bad_payload = bytearray(build_packet(rng))
+    bad_payload[9] ^= 0x80  # Roll low byte: a plausible angle with a failing checksum
+    data = good[0] + bytes(bad_checksum) + good[1][:17] + good[2] + bytes(bad_payload) + good[3][:31] + good[3]
+
+    decoded = sap.decode_capture(data)
+
+    assert_matches_reference(decoded, data)
+    assert decoded["checksum_ok"].tolist() == [True, False, True, False, True]
+
+
+def test_reads_memory_maps(tmp_path):
+    path = tmp_path / "capture.bin"
+    data = capture(500, 0.1)
+    path.write_bytes(data)
+
+    decoded = sap.decode_capture(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    assert_matches_reference(decoded, data)
+
+
+def test_empty_and_short_captures():
+    for data in (b"", bytes((sap.HEADER_HIGH, sap.HEADER_LOW)), b"\x00" * (sap.PACKET_SIZE - 1)):
+        assert len(sap.decode_capture(data)["offset"]) == 0
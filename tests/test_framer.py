@@ -0,0 +1,115 @@
+"""PacketFramer and HexLineFramer: framing across split reads, resync on garbage, bad lines."""
+import random
+
+import SAP_Production as sap
+
+
+def build_packet(roll_raw, pitch_raw):
+    packet = bytearray(sap.PACKET_SIZE)
+    packet[0] = sap.HEADER_HIGH
+    packet[1] = sap.HEADER_LOW
+    packet[8:10] = (roll_raw & 0xFFFF).to_bytes(2, "big")
+    packet[10:12] = (pitch_raw & 0xFFFF).to_bytes(2, "big")
+    packet[30] = sum(packet[2:30]) & 0xFF
+    packet[31] = sap.TERMINATOR
+    return bytes(packet)
+
+
+def frames(framer, chunks):
+    """(roll, pitch, checksum_ok) of every frame; copied out since the views die on the next feed()."""
+    result = []
+    for chunk in chunks:
+        for packet, checksum_ok in framer.feed(chunk):
+            result.append(sap.decode_packet(packet) + (checksum_ok,))
+    return result
+
+
+PACKETS = [build_packet(roll, pitch) for roll, pitch in ((0, 0), (364, -364), (-364, 364), (3640, -3640),
+                                                          (-32768, 32767))]
+EXPECTED = [(0.0, 0.0, True), (1.0, -1.0, True), (-1.0, 1.0, True), (10.0, -10.0, True), (-90.0, 90.0, True)]
+
+
+def test_frames_split_reads():
+    data = b"".join(PACKETS)
+    for size in (1, 2, 7, 31, 33, len(data)):
+        framer = sap.PacketFramer(buffer_size=8)  # Small buffer so appends compact and grow
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+
+        assert frames(framer, chunks) == EXPECTED
+        assert framer.resyncs == 0 and framer.bytes_discarded == 0
+        assert framer.position == len(data)
+
+
+def test_resyncs_on_garbage():
+    garbage = bytes((0x00, sap.HEADER_HIGH, 0x13, sap.HEADER_HIGH, sap.HEADER_LOW, 0x01))  # Includes a false header
+    data = garbage + PACKETS[0] + PACKETS[1][:20] + PACKETS[2] + garbage + PACKETS[3]
+    framer = sap.PacketFramer()
+
+    assert frames(framer, [data[:40], data[40:]]) == [EXPECTED[0], EXPECTED[2], EXPECTED[3]]
+    assert framer.packets == 3
+    assert framer.resyncs > 0
+    assert framer.bytes_discarded == 2 * len(garbage) + 20
+
+
+def test_split_header_at_chunk_end():
+    framer = sap.PacketFramer()
+    data = b"\x01\x02" + PACKETS[1]
+
+    assert frames(framer, [data[:3], data[3:]]) == [EXPECTED[1]]  # Chunk ends on HEADER_HIGH
+    assert framer.bytes_discarded == 2
+
+
+def test_checksum_failure_keeps_framing():
+    damaged = bytearray(PACKETS[1])
+    damaged[9] ^= 0x01
+    framer = sap.PacketFramer()
+
+    result = frames(framer, [bytes(damaged) + PACKETS[2]])
+
+    assert [checksum_ok for *_, checksum_ok in result] == [False, True]
+    assert framer.checksum_failures == 1 and framer.resyncs == 0
+
+
+def test_random_garbage_never_loses_a_good_packet():
+    rng = random.Random(3)
+    data = bytearray()
+    for packet in PACKETS * 20:
+        data += bytes(rng.choice((0x00, 0x55, 0xAA)) for _ in range(rng.randrange(5)))
+        data += packet
+    framer = sap.PacketFramer()
+    chunks = []
+    i = 0
+    while i < len(data):
+        size = rng.randrange(1, 50)
+        chunks.append(bytes(data[i:i + size]))
+        i += size
+
+    assert frames(framer, chunks) == EXPECTED * 20
+
+
+def hex_line(packet):
+    return b"Data Packet: " + packet.hex(" ").upper().encode() + b"\r\n"
+
+
+def test_hex_lines_split_reads_and_bad_lines():
+    data = (hex_line(PACKETS[0]) + b"Data Packet: 5A A5 ZZ\r\n" + hex_line(PACKETS[1])[:-40] + b"\r\n"
+            + b"\r\n" + hex_line(PACKETS[2]))
+    framer = sap.HexLineFramer()
+
+    assert frames(framer, [data[i:i + 5] for i in range(0, len(data), 5)]) == [EXPECTED[0], EXPECTED[2]]
+    assert framer.malformed_lines == 2
+
+
+def test_hex_framer_bounds_data_without_newlines():
+    framer = sap.HexLineFramer()
+    noise = bytes(byte for byte in range(256) if byte != ord("\n"))  # e.g. a wrong baud rate
+    for _ in range(1000):
+        assert frames(framer, [noise]) == []
+
+    assert len(framer.line_buffer) <= framer.MAX_PENDING
+    assert framer.bytes_discarded == len(noise) * 1000 - len(framer.line_buffer)
+    assert framer.resyncs > 0
+
+    # The next newline ends the garbage as one malformed line and framing picks up again
+    assert frames(framer, [b"\r\n" + hex_line(PACKETS[1])]) == [EXPECTED[1]]
+    assert framer.malformed_lines == 1
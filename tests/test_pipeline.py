@@ -0,0 +1,83 @@
+"""AcquisitionPipeline without a port: what a corrupt packet may and may not reach."""
+import time
+
+import pytest
+
+import SAP_Production as sap
+
+np = pytest.importorskip("numpy")
+
+
+def build_packet(roll_raw, pitch_raw, checksum_ok=True):
+    packet = bytearray(sap.PACKET_SIZE)
+    packet[0] = sap.HEADER_HIGH
+    packet[1] = sap.HEADER_LOW
+    packet[8:10] = (roll_raw & 0xFFFF).to_bytes(2, "big")
+    packet[10:12] = (pitch_raw & 0xFFFF).to_bytes(2, "big")
+    packet[30] = (sum(packet[2:30]) + (0 if checksum_ok else 1)) & 0xFF
+    packet[31] = sap.TERMINATOR
+    return bytes(packet)
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = sap.AcquisitionPipeline(None, "binary", sea_state_window=60)
+    yield pipeline
+    pipeline.stop()
+
+
+def feed(pipeline, packets, start=1000.0, step=0.1):
+    for i, packet in enumerate(packets):
+        pipeline.handle_packet(packet, sap.packet_checksum_ok(packet), start + i * step)
+
+
+def test_sea_state_skips_corrupt_packets(pipeline):
+    feed(pipeline, [build_packet(-30000, 0, checksum_ok=False)] * 5)
+
+    assert pipeline.sea_state.next_time is None  # Nothing reached the resampling grid
+
+    feed(pipeline, [build_packet(364, 0)], start=1001.0)
+
+    assert pipeline.sea_state.next_time is not None
+
+
+def test_trend_history_skips_corrupt_packets(pipeline):
+    feed(pipeline, [build_packet(364, -364), build_packet(-30000, 30000, checksum_ok=False), build_packet(728, 0)])
+
+    lows, highs = pipeline.history.trend(10, 10, 0)
+
+    assert pipeline.history.total == 2
+    assert min(low for low in lows if low is not None) == 1.0
+    assert max(high for high in highs if high is not None) == 2.0
+
+
+def received_samples(sock, count, timeout=5.0):
+    sock.settimeout(timeout)
+    buffer, samples = b"", []
+    while len(samples) < count:
+        buffer += sock.recv(4096)
+        messages, buffer = sap.decode_wire_messages(buffer)
+        samples += [sap.decode_wire_sample(payload) for kind, payload in messages if kind == sap.WIRE_KIND_SAMPLE]
+    return samples
+
+
+def test_broadcast_sends_raw_angles_of_valid_packets():
+    import socket
+
+    pipeline = sap.AcquisitionPipeline(None, "binary", serve=[("tcp", "127.0.0.1", 0)], sea_state_window=0,
+                                       filters={"roll": "ema:0.1", "pitch": "ema:0.1"})
+    try:
+        client = socket.create_connection(pipeline.broadcaster.address()[:2])
+        deadline = time.monotonic() + 5
+        while not pipeline.broadcaster.stats()["stream_subscribers"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        feed(pipeline, [build_packet(3640, -364), build_packet(-30000, 0, checksum_ok=False), build_packet(0, 728)])
+        samples = received_samples(client, 2)
+        client.close()
+    finally:
+        pipeline.stop()
+
+    assert [(sample.roll, sample.pitch) for sample in samples] == [(10.0, -1.0), (0.0, 2.0)]  # Not smoothed
+    assert pipeline.latest_sample.roll != 0.0  # while the gauges follow the filter
+    assert pipeline.broadcaster.stats()["published"] == 2